@@ -0,0 +1,151 @@
+"""
+通用缓存工具
+
+提供按字节预算淘汰的线程安全 LRU 缓存，以及图像内容哈希，
+用于 SAM 图像嵌入等大对象的跨会话复用。
+"""
+
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import numpy as np
+
+
+def estimate_nbytes(value: Any) -> int:
+    """
+    估算对象占用的字节数（numpy 数组、torch 张量、pydantic 对象及其容器）
+
+    Args:
+        value: 任意对象
+
+    Returns:
+        估算的字节数
+    """
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if hasattr(value, "element_size") and hasattr(value, "numel"):
+        return int(value.element_size() * value.numel())
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(k) + estimate_nbytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(v) for v in value)
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if hasattr(value, "model_dump"):
+        # pydantic 对象（如 OpenAI 返回的消息）
+        return estimate_nbytes(value.model_dump())
+    return sys.getsizeof(value)
+
+
+def image_hash(image: np.ndarray) -> str:
+    """计算解码后图像数组的内容哈希（包含形状与类型）"""
+    h = hashlib.sha1()
+    h.update(str((image.shape, image.dtype.str)).encode())
+    h.update(np.ascontiguousarray(image).data)
+    return h.hexdigest()
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """计算文件内容的 SHA-256 哈希"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class LRUByteCache:
+    """按字节预算淘汰的线程安全 LRU 缓存"""
+
+    def __init__(self, max_bytes: int, name: str = "cache"):
+        """
+        Args:
+            max_bytes: 缓存总字节上限，超出时淘汰最久未使用的条目
+            name: 缓存名称（用于统计输出）
+        """
+        self.max_bytes = max_bytes
+        self.name = name
+        self._data = OrderedDict()  # {key: (value, nbytes)}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取缓存并标记为最近使用"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, nbytes: Optional[int] = None):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+            nbytes: 值的字节数，None 时自动估算
+        """
+        nbytes = estimate_nbytes(value) if nbytes is None else nbytes
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._data[key] = (value, nbytes)
+            self._total_bytes += nbytes
+
+            while self._total_bytes > self.max_bytes and self._data:
+                _, (_, evicted_bytes) = self._data.popitem(last=False)
+                self._total_bytes -= evicted_bytes
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """移除并返回缓存条目"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self._total_bytes -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+            self._total_bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def stats(self) -> dict:
+        """返回缓存统计信息"""
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
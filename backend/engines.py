@@ -0,0 +1,393 @@
+"""
+导出推理图（TorchScript / ONNX Runtime）
+
+可选的推理引擎，把固定输入尺寸的计算图导出后执行，默认仍为 eager PyTorch：
+
+- GroundingDINO 图像骨干（Swin-T）：输入尺寸随 Resize([800], max_size=1333) 变化，
+  补零到少数几个尺寸桶（见 DINO_BUCKET_SIDES），每个桶导出一份图，并生成与批量前向
+  相同的 padding mask；文本编码器与跨模态解码器以字符串 caption 为输入，仍以 eager 运行
+- SAM 图像编码器：输入总是 1024x1024，只有一份图
+- SAM 掩码解码器（框提示）：框数补齐到 2 的幂（重复最后一个框，多余的输出丢弃）
+
+导出的图按 <组件>_<尺寸桶>_<指纹>.pt / .onnx 缓存在 weights/compiled/ 中，指纹包含权重文件、
+torch 版本、设备与精度，权重更新后自动重新导出。某个组件导出或加载失败时该组件回退到 eager。
+补零后的骨干特征与批量前向一致，与单张 eager 前向相比边缘处可能有细微差异。
+"""
+
+import os
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import torch
+import torch.nn.functional as F
+
+ENGINES = ("eager", "torchscript", "onnxruntime")
+
+# GroundingDINO 输入的高、宽各自补零到不小于它的最小桶边长（短边 800、长边不超过 1333）
+DINO_BUCKET_SIDES = (800, 1067, 1333)
+
+SAM_ENCODER_SIZE = 1024
+
+
+def resolve_engine(engine: str, device: str, precision: str) -> str:
+    """
+    校验推理引擎，当前设备 / 精度不支持时回退到 eager
+
+    Args:
+        engine: eager / torchscript / onnxruntime
+        device: 推理设备
+        precision: 推理精度（见 backend.precision）
+
+    Returns:
+        实际使用的引擎
+
+    Raises:
+        ValueError: 未知的引擎
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"未知的推理引擎: {engine}（可选 {', '.join(ENGINES)}）")
+    if engine == "eager":
+        return engine
+    if precision == "bf16":
+        print(f"{engine} 不支持 bf16 autocast，使用 eager")
+        return "eager"
+    if engine == "onnxruntime":
+        if not device.startswith("cpu") or precision != "fp32":
+            print("onnxruntime 引擎仅支持 CPU fp32，使用 eager")
+            return "eager"
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            print("未安装 onnxruntime，使用 eager")
+            return "eager"
+    return engine
+
+
+def bucket_size(height: int, width: int, sides: Sequence[int] = DINO_BUCKET_SIDES) -> Optional[Tuple[int, int]]:
+    """
+    选择能容纳 (height, width) 的尺寸桶
+
+    Returns:
+        (桶高, 桶宽)，超出最大桶时为 None
+    """
+    bucket_h = next((side for side in sides if side >= height), None)
+    bucket_w = next((side for side in sides if side >= width), None)
+    if bucket_h is None or bucket_w is None:
+        return None
+    return bucket_h, bucket_w
+
+
+def pad_nested(image_tensor: torch.Tensor, size: Tuple[int, int]):
+    """
+    把 (3, h, w) 图像张量右下补零到 size，返回带 padding mask 的 NestedTensor（与批量前向的补零方式相同）
+    """
+    from groundingdino.util.misc import NestedTensor
+
+    h, w = image_tensor.shape[-2:]
+    padded = F.pad(image_tensor, (0, size[1] - w, 0, size[0] - h))[None]
+    mask = torch.ones((1,) + tuple(size), dtype=torch.bool, device=image_tensor.device)
+    mask[:, :h, :w] = False
+    return NestedTensor(padded, mask)
+
+
+def _box_bucket(n: int) -> int:
+    return 1 << max(0, n - 1).bit_length()
+
+
+def _fingerprint(*parts) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, str) and os.path.isfile(part):
+            stat = os.stat(part)
+            part = f"{os.path.abspath(part)}:{stat.st_size}:{int(stat.st_mtime)}"
+        h.update(str(part).encode())
+    return h.hexdigest()[:12]
+
+
+class _SwinBody(torch.nn.Module):
+    """Swin 骨干的纯张量前向（多尺度特征，不含 mask 与位置编码）"""
+
+    def __init__(self, swin):
+        super().__init__()
+        self.swin = swin
+
+    def forward(self, x):
+        return tuple(self.swin.forward_raw(x))
+
+
+class _SamBoxDecoder(torch.nn.Module):
+    """SAM 提示编码器 + 掩码解码器（只有框提示，单掩码输出），返回低分辨率掩码 logits"""
+
+    def __init__(self, sam):
+        super().__init__()
+        self.prompt_encoder = sam.prompt_encoder
+        self.mask_decoder = sam.mask_decoder
+
+    def forward(self, image_embeddings, boxes):
+        sparse, dense = self.prompt_encoder(points=None, boxes=boxes, masks=None)
+        low_res_masks, _ = self.mask_decoder(
+            image_embeddings=image_embeddings,
+            image_pe=self.prompt_encoder.get_dense_pe(),
+            sparse_prompt_embeddings=sparse,
+            dense_prompt_embeddings=dense,
+            multimask_output=False
+        )
+        return low_res_masks
+
+
+class _OnnxRunner:
+    """以 torch 张量调用 ONNX Runtime 会话（CPU 执行提供程序）"""
+
+    def __init__(self, path: str):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = torch.get_num_threads()
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def __call__(self, *inputs: torch.Tensor) -> List[torch.Tensor]:
+        feeds = {name: t.detach().cpu().numpy() for name, t in zip(self.input_names, inputs)}
+        return [torch.from_numpy(output) for output in self.session.run(None, feeds)]
+
+
+class CompiledEngine:
+    """按尺寸桶懒导出、缓存并执行 GroundingDINO 骨干与 SAM 编解码器的推理图（线程安全）"""
+
+    def __init__(
+        self,
+        kind: str,
+        groundingdino,
+        sam,
+        device: str,
+        cache_dir: str,
+        groundingdino_checkpoint: str,
+        sam_checkpoint: str,
+        precision: str = "fp32",
+        max_boxes: int = 16
+    ):
+        """
+        Args:
+            kind: torchscript / onnxruntime（应先经过 resolve_engine）
+            groundingdino: GroundingDINO 模型
+            sam: Sam 模型
+            device: 推理设备
+            cache_dir: 导出图的缓存目录（如 weights/compiled）
+            groundingdino_checkpoint / sam_checkpoint: 权重文件路径，用于计算缓存指纹
+            precision: 推理精度，int8 模型导出的是量化后的图
+            max_boxes: 掩码解码器单次最大框数（SAM 的 sam_batch_size）
+        """
+        self.kind = kind
+        self.groundingdino = groundingdino
+        self.sam = sam
+        self.device = device
+        self.cache_dir = cache_dir
+        self.max_boxes = max_boxes
+        self._fingerprints = {
+            "dino": _fingerprint(groundingdino_checkpoint, torch.__version__, device, precision),
+            "sam": _fingerprint(sam_checkpoint, torch.__version__, device, precision)
+        }
+        self._lock = threading.Lock()
+        self._runners: Dict[str, Optional[Callable]] = {}  # {图名: 执行函数，导出失败时为 None}
+        self._pid = os.getpid()
+        self._stats = {"compiled": 0, "loaded": 0, "failed": 0, "runs": 0, "fallbacks": 0}
+
+        swin = groundingdino.backbone[0] if hasattr(groundingdino, "backbone") else None
+        # 需要 forward_raw（纯张量骨干）与特征注入（set_image_tensor）才能替换骨干前向
+        self.dino_supported = hasattr(swin, "forward_raw") and hasattr(groundingdino, "set_image_tensor")
+
+    # ---- 导出与缓存 ----
+
+    def _artifact_path(self, name: str, family: str) -> str:
+        ext = ".onnx" if self.kind == "onnxruntime" else ".pt"
+        return os.path.join(self.cache_dir, f"{name}_{self._fingerprints[family]}{ext}")
+
+    def _export(self, module: torch.nn.Module, example: Tuple[torch.Tensor, ...], path: str):
+        # 先写临时文件再改名，其他进程不会读到写了一半的图
+        tmp_path = f"{path}.{os.getpid()}.part"
+        try:
+            with torch.no_grad():
+                if self.kind == "torchscript":
+                    traced = torch.jit.trace(module, example, check_trace=False)
+                    torch.jit.save(torch.jit.freeze(traced.eval()), tmp_path)
+                else:
+                    torch.onnx.export(
+                        module, example, tmp_path,
+                        input_names=[f"input_{i}" for i in range(len(example))],
+                        opset_version=17, do_constant_folding=True
+                    )
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _load(self, path: str) -> Callable:
+        if self.kind == "onnxruntime":
+            return _OnnxRunner(path)
+        module = torch.jit.load(path, map_location=self.device)
+
+        def run(*inputs):
+            outputs = module(*inputs)
+            return list(outputs) if isinstance(outputs, (tuple, list)) else [outputs]
+        return run
+
+    def _runner(
+        self,
+        name: str,
+        family: str,
+        make_module: Callable[[], torch.nn.Module],
+        make_example: Callable[[], Tuple[torch.Tensor, ...]]
+    ) -> Optional[Callable]:
+        """取得某个尺寸桶的执行函数：进程内已加载则直接返回，磁盘有缓存则加载，否则导出"""
+        if os.getpid() != self._pid:
+            # fork 后的子进程不复用父进程的 ONNX Runtime 会话（线程池不随 fork 复制），从磁盘重新加载
+            with self._lock:
+                if os.getpid() != self._pid:
+                    self._runners = {}
+                    self._pid = os.getpid()
+
+        if name in self._runners:
+            return self._runners[name]
+        with self._lock:
+            if name in self._runners:
+                return self._runners[name]
+            path = self._artifact_path(name, family)
+            runner = None
+            try:
+                if os.path.exists(path):
+                    self._stats["loaded"] += 1
+                else:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    print(f"Exporting {name} ({self.kind})...")
+                    self._export(make_module(), make_example(), path)
+                    self._stats["compiled"] += 1
+                runner = self._load(path)
+            except Exception as e:
+                print(f"{self.kind} 导出 / 加载 {name} 失败，使用 eager: {e}")
+                self._stats["failed"] += 1
+            self._runners[name] = runner
+            return runner
+
+    def _run(self, runner: Optional[Callable], *inputs: torch.Tensor) -> Optional[List[torch.Tensor]]:
+        if runner is None:
+            with self._lock:
+                self._stats["fallbacks"] += 1
+            return None
+        outputs = runner(*inputs)
+        with self._lock:
+            self._stats["runs"] += 1
+        return [output.to(self.device) for output in outputs]
+
+    # ---- 各组件 ----
+
+    def _dino_runner(self, size: Tuple[int, int]) -> Optional[Callable]:
+        return self._runner(
+            f"dino_backbone_{size[0]}x{size[1]}", "dino",
+            lambda: _SwinBody(self.groundingdino.backbone[0]).eval(),
+            lambda: (torch.zeros((1, 3) + tuple(size), device=self.device),)
+        )
+
+    def dino_features(self, image_tensor: torch.Tensor) -> Optional[dict]:
+        """
+        GroundingDINO 图像骨干，返回值同 GroundedSAM.compute_dino_features，另含 padded_size
+
+        Args:
+            image_tensor: (3, h, w) 预处理后的图像张量
+
+        Returns:
+            {"features", "poss", "padded_size"}，不支持或导出失败时为 None（调用方改用 eager）
+        """
+        from groundingdino.util.misc import NestedTensor
+
+        size = bucket_size(*image_tensor.shape[-2:])
+        if not self.dino_supported or size is None:
+            return None
+        samples = pad_nested(image_tensor.to(self.device), size)
+        outputs = self._run(self._dino_runner(size), samples.tensors)
+        if outputs is None:
+            return None
+
+        # 与 Joiner 相同：各层特征附上插值后的 padding mask，再计算位置编码
+        position_embedding = self.groundingdino.backbone[1]
+        features, poss = [], []
+        for output in outputs:
+            mask = F.interpolate(samples.mask[None].float(), size=output.shape[-2:]).to(torch.bool)[0]
+            feature = NestedTensor(output, mask)
+            features.append(feature)
+            poss.append(position_embedding(feature).to(output.dtype))
+        return {"features": features, "poss": poss, "padded_size": size}
+
+    def sam_encode(self, inputs: torch.Tensor) -> Optional[torch.Tensor]:
+        """
+        SAM 图像编码器
+
+        Args:
+            inputs: (B, 3, 1024, 1024) sam.preprocess 的输出
+
+        Returns:
+            (B, 256, 64, 64) 图像嵌入，导出失败时为 None
+        """
+        runner = self._runner(
+            f"sam_encoder_{SAM_ENCODER_SIZE}", "sam",
+            lambda: self.sam.image_encoder,
+            lambda: (torch.zeros((1, 3, SAM_ENCODER_SIZE, SAM_ENCODER_SIZE), device=self.device),)
+        )
+        features = []
+        for i in range(len(inputs)):
+            outputs = self._run(runner, inputs[i:i + 1])
+            if outputs is None:
+                return None
+            features.append(outputs[0])
+        return torch.cat(features, dim=0)
+
+    def sam_decode(self, image_embeddings: torch.Tensor, boxes: torch.Tensor) -> Optional[torch.Tensor]:
+        """
+        SAM 掩码解码器（框提示）
+
+        Args:
+            image_embeddings: (1, 256, 64, 64) 图像嵌入
+            boxes: (N, 4) 已变换到 SAM 输入坐标系的框
+
+        Returns:
+            (N, 1, 256, 256) 低分辨率掩码 logits，框数超出上限或导出失败时为 None
+        """
+        n = len(boxes)
+        bucket = _box_bucket(n)
+        if n == 0 or bucket > _box_bucket(self.max_boxes):
+            return None
+        runner = self._runner(
+            f"sam_decoder_{bucket}", "sam",
+            lambda: _SamBoxDecoder(self.sam).eval(),
+            lambda: (
+                torch.zeros((1, 256, 64, 64), device=self.device),
+                torch.tensor([[0.0, 0.0, 64.0, 64.0]], device=self.device).repeat(bucket, 1)
+            )
+        )
+        # 重复最后一个框补齐到桶大小，输出只取前 n 个
+        padded = torch.cat([boxes, boxes[-1:].expand(bucket - n, 4)]) if bucket > n else boxes
+        outputs = self._run(runner, image_embeddings, padded)
+        return None if outputs is None else outputs[0][:n]
+
+    def compile_all(self):
+        """预先导出 / 加载全部尺寸桶（服务启动时调用，避免首个请求承担导出耗时）"""
+        if self.dino_supported:
+            for h in DINO_BUCKET_SIDES:
+                for w in DINO_BUCKET_SIDES:
+                    # Resize([800], max_size=1333) 的输出短边不超过 800，总有一边落在最小的桶
+                    if DINO_BUCKET_SIDES[0] in (h, w):
+                        self._dino_runner((h, w))
+        self.sam_encode(torch.zeros((1, 3, SAM_ENCODER_SIZE, SAM_ENCODER_SIZE), device=self.device))
+        bucket = 1
+        while bucket <= _box_bucket(self.max_boxes):
+            self.sam_decode(torch.zeros((1, 256, 64, 64), device=self.device), torch.zeros((bucket, 4), device=self.device))
+            bucket *= 2
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "engine": self.kind,
+                "graphs": sorted(name for name, runner in self._runners.items() if runner is not None),
+                **self._stats
+            }
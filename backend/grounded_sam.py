@@ -8,10 +8,135 @@ Grounded-SAM: GroundingDINO + SAM 集成模块
 import os
 import torch
 import numpy as np
-from typing import List, Tuple, Optional
+from typing import Dict, Iterator, List, Sequence, Tuple, Optional
 import cv2
 
 
+def preprocess_for_groundingdino(image: np.ndarray) -> torch.Tensor:
+    """
+    GroundingDINO 输入预处理：短边缩放到 800（长边不超过 1333）并归一化
+
+    Args:
+        image: 输入图像 (RGB numpy array)
+
+    Returns:
+        (3, H, W) float 张量（CPU）
+    """
+    import torchvision.transforms as T
+    from PIL import Image
+
+    # 图像已经是 RGB 格式的 numpy array，需要转换回 PIL Image
+    image_pil = Image.fromarray(image.astype('uint8'))
+
+    transform = T.Compose([
+        T.Resize([800], max_size=1333),
+        T.ToTensor(),
+        T.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+    ])
+    return transform(image_pil)
+
+
+class DecodedImage:
+    """
+    解码一次、在检测 / SAM / 渲染之间复用的图像
+
+    GroundedSAM 中接受 RGB 数组的方法同样接受 DecodedImage；
+    GroundingDINO 预处理结果在首次使用时计算并随对象保存。
+    """
+
+    def __init__(self, rgb: np.ndarray, key: Optional[str] = None):
+        """
+        Args:
+            rgb: (H, W, 3) uint8 RGB 图像
+            key: 图像内容哈希（骨干特征 / SAM 嵌入的缓存键），可为 None
+        """
+        self.rgb = rgb
+        self.key = key
+        self._dino_tensor = None
+
+    @classmethod
+    def from_path(cls, image_path: str, key: Optional[str] = None) -> "DecodedImage":
+        """读取并解码图像文件"""
+        image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError(f"无法读取图像: {image_path}")
+        return cls(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), key)
+
+    @property
+    def shape(self) -> tuple:
+        return self.rgb.shape
+
+    @property
+    def height(self) -> int:
+        return self.rgb.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.rgb.shape[1]
+
+    def dino_tensor(self) -> torch.Tensor:
+        """GroundingDINO 输入张量（首次调用时预处理）"""
+        if self._dino_tensor is None:
+            self._dino_tensor = preprocess_for_groundingdino(self.rgb)
+        return self._dino_tensor
+
+    @property
+    def nbytes(self) -> int:
+        nbytes = int(self.rgb.nbytes)
+        if self._dino_tensor is not None:
+            nbytes += self._dino_tensor.numel() * self._dino_tensor.element_size()
+        return nbytes
+
+
+def as_rgb(image) -> np.ndarray:
+    """取出 RGB 数组（image 为 RGB 数组或 DecodedImage）"""
+    return image.rgb if isinstance(image, DecodedImage) else image
+
+
+def dino_input(image) -> torch.Tensor:
+    """GroundingDINO 输入张量，DecodedImage 复用已有的预处理结果"""
+    return image.dino_tensor() if isinstance(image, DecodedImage) else preprocess_for_groundingdino(image)
+
+
+def normalize_caption(text_prompt: str) -> str:
+    """规范化提示词（合并空白、小写、以 '.' 结尾），作为 GroundingDINO 输入与检测缓存键"""
+    from groundingdino.util.inference import preprocess_caption
+    return preprocess_caption(caption=" ".join(text_prompt.split()))
+
+
+def _cache_key(image, image_key: Optional[str]) -> str:
+    """缓存键：显式传入 > DecodedImage.key > 图像数组哈希"""
+    from backend.cache import image_hash
+    return image_key or getattr(image, "key", None) or image_hash(as_rgb(image))
+
+
+class _CachedTextEncoder(torch.nn.Module):
+    """
+    包装 GroundingDINO 内部的 BERT 文本编码器，按输入 token 缓存输出
+
+    同一提示词（如反复出现的 "building"）只需编码一次。
+    """
+
+    def __init__(self, bert: torch.nn.Module, max_bytes: int = 32 * 1024 * 1024):
+        super().__init__()
+        from backend.cache import LRUByteCache
+
+        self.bert = bert
+        self.cache = LRUByteCache(max_bytes, name="text_encoder")
+
+    def forward(self, **inputs):
+        key = tuple(
+            (name, tuple(value.shape), value.detach().cpu().numpy().tobytes())
+            for name, value in sorted(inputs.items())
+            if value is not None
+        )
+        output = self.cache.get(key)
+        if output is None:
+            output = self.bert(**inputs)
+            self.cache.put(key, output)
+        return output
+
+
 class GroundedSAM:
     """Grounded-SAM 模型封装"""
 
@@ -20,7 +145,17 @@ class GroundedSAM:
         groundingdino_config: str = "weights/GroundingDINO_SwinT_OGC.py",
         groundingdino_checkpoint: str = "weights/groundingdino_swint_ogc.pth",
         sam_checkpoint: str = "weights/sam_vit_b_01ec64.pth",
-        device: Optional[str] = None
+        device: Optional[str] = None,
+        sam_batch_size: int = 16,
+        embedding_cache_bytes: int = 512 * 1024 * 1024,
+        dino_feature_cache_bytes: int = 512 * 1024 * 1024,
+        text_cache_bytes: int = 32 * 1024 * 1024,
+        decoded_image_cache_bytes: int = 256 * 1024 * 1024,
+        detection_cache_bytes: int = 64 * 1024 * 1024,
+        detection_score_floor: float = 0.1,
+        precision: str = "fp32",
+        engine: str = "eager",
+        compiled_dir: Optional[str] = None
     ):
         """
         初始化 Grounded-SAM
@@ -30,122 +165,772 @@ class GroundedSAM:
             groundingdino_checkpoint: GroundingDINO 权重文件路径
             sam_checkpoint: SAM 权重文件路径
             device: 设备 ('cuda', 'cpu' 或 None 自动检测)
+            sam_batch_size: SAM 掩码解码器单次前向的最大框数，用于限制显存/内存占用
+            embedding_cache_bytes: SAM 图像嵌入缓存的字节上限
+            dino_feature_cache_bytes: GroundingDINO 图像骨干特征缓存的字节上限
+            text_cache_bytes: BERT 文本编码缓存的字节上限（注册表中的模型共享同一个缓存，以首次创建时为准）
+            decoded_image_cache_bytes: 解码后图像（DecodedImage）缓存的字节上限
+            detection_cache_bytes: GroundingDINO 原始输出缓存的字节上限
+            detection_score_floor: 原始输出缓存只保留最高分超过该值的查询；
+                                   请求的阈值低于该值时不使用缓存
+            precision: 推理精度 fp32 / int8 / bf16（见 backend.precision），设备不支持时回退到 fp32
+            engine: 推理引擎 eager / torchscript / onnxruntime（见 backend.engines），不支持时回退到 eager
+            compiled_dir: 导出图的缓存目录，None 时为 weights/compiled
         """
-        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"Using device: {self.device}")
+        from backend import model_registry
+        from backend.cache import LRUByteCache
+        from backend.precision import resolve_precision
+        from backend.render import MaskRenderer
+
+        self.device = device or model_registry.default_device()
+        self.sam_batch_size = max(1, sam_batch_size)
+        self.precision = resolve_precision(precision, self.device)
+        print(f"Using device: {self.device} ({self.precision})")
+
+        # SAM 图像嵌入缓存 {图像内容哈希: {"features", "original_size", "input_size"}}
+        # 同一图像的多轮分割（不同 object_indices / 不同会话上传的相同图片）跳过图像编码器
+        self.embedding_cache = LRUByteCache(embedding_cache_bytes, name="sam_embedding")
+
+        # GroundingDINO 图像骨干特征缓存 {图像内容哈希: {"features", "poss"}}
+        # 骨干特征与文本提示无关，同一图像换提示词时只需重跑文本编码器和跨模态解码器
+        self.dino_feature_cache = LRUByteCache(dino_feature_cache_bytes, name="dino_backbone")
+
+        # 解码后的图像 {图像内容哈希: DecodedImage}，检测 / SAM / 渲染与预计算共用，避免重复解码
+        self.decoded_image_cache = LRUByteCache(decoded_image_cache_bytes, name="decoded_image")
+
+        # GroundingDINO 原始输出 {(图像内容哈希, caption): {"logits", "boxes"}}（float32，只保留可能过阈值的查询）
+        # LLM 重试或用户要求重新检测时不再前向；阈值在缓存的原始分数上重新应用，换阈值同样命中
+        self.detection_cache = LRUByteCache(detection_cache_bytes, name="detection")
+        self.detection_score_floor = detection_score_floor
+
+        # 掩码叠加渲染器（复用按图像尺寸预分配的缓冲区）
+        self.mask_renderer = MaskRenderer()
 
-        # 加载 GroundingDINO
-        from groundingdino.util.inference import load_model as load_dino_model
-        self.groundingdino = load_dino_model(
+        # GroundingDINO 与 SAM 权重均来自进程级注册表，多个实例共享同一份
+        self.groundingdino = model_registry.get_groundingdino(
             groundingdino_config,
-            groundingdino_checkpoint
+            groundingdino_checkpoint,
+            self.device,
+            self.precision
         )
+        if not isinstance(self.groundingdino.bert, _CachedTextEncoder):
+            self.groundingdino.bert = _CachedTextEncoder(self.groundingdino.bert, text_cache_bytes)
+        # BERT 文本编码缓存 {输入 token: 编码输出}，同一提示词只编码一次
+        self.text_cache = self.groundingdino.bert.cache
 
-        # 加载 SAM
-        from segment_anything import sam_model_registry, SamPredictor
-        sam = sam_model_registry["vit_b"](checkpoint=sam_checkpoint)
-        sam.to(device=self.device)
+        from segment_anything import SamPredictor
+        sam = model_registry.get_sam(sam_checkpoint, device=self.device, precision=self.precision)
         self.sam_predictor = SamPredictor(sam)
 
+        # 导出推理图引擎（GroundingDINO 骨干、SAM 编码器与解码器），eager 时为 None
+        from backend.engines import CompiledEngine, resolve_engine
+        self.engine = None
+        engine = resolve_engine(engine, self.device, self.precision)
+        if engine != "eager":
+            self.engine = CompiledEngine(
+                engine,
+                self.groundingdino,
+                sam,
+                self.device,
+                compiled_dir or os.path.join(model_registry.WEIGHTS_FOLDER, "compiled"),
+                groundingdino_checkpoint,
+                sam_checkpoint,
+                precision=self.precision,
+                max_boxes=self.sam_batch_size
+            )
+
+    def _autocast(self):
+        """GroundingDINO 与 SAM 图像编码器前向使用的精度上下文（bf16 模式下为 autocast）"""
+        from backend.precision import autocast
+        return autocast(self.precision, self.device)
+
+    @torch.no_grad()
+    def compute_dino_features(self, image_tensor: torch.Tensor) -> dict:
+        """
+        运行 GroundingDINO 图像骨干（Swin-T + 位置编码），与文本提示无关
+
+        Args:
+            image_tensor: preprocess_for_groundingdino 的输出
+
+        Returns:
+            features: 包含 features（多尺度 NestedTensor 列表）与 poss（位置编码列表）的字典；
+                      导出图引擎补零到尺寸桶时另含 padded_size
+        """
+        from groundingdino.util.misc import nested_tensor_from_tensor_list
+
+        if self.engine is not None:
+            features = self.engine.dino_features(image_tensor)
+            if features is not None:
+                return features
+
+        samples = nested_tensor_from_tensor_list([image_tensor.to(self.device)])
+        with self._autocast():
+            features, poss = self.groundingdino.backbone(samples)
+        return {"features": features, "poss": poss}
+
+    @staticmethod
+    def _dino_features_nbytes(features: dict) -> int:
+        """估算骨干特征占用的字节数"""
+        from backend.cache import estimate_nbytes
+        return sum(
+            estimate_nbytes(f.tensors) + estimate_nbytes(f.mask) for f in features["features"]
+        ) + estimate_nbytes(features["poss"])
+
+    def get_dino_features(
+        self,
+        image,
+        image_key: Optional[str] = None,
+        image_tensor: Optional[torch.Tensor] = None
+    ) -> dict:
+        """
+        获取图像的 GroundingDINO 骨干特征，优先从缓存读取
+
+        Args:
+            image: 输入图像 (RGB 数组或 DecodedImage)
+            image_key: 图像内容哈希，None 时使用 DecodedImage.key 或根据图像数组计算
+            image_tensor: 已预处理的输入张量，None 时现场预处理
+        """
+        key = _cache_key(image, image_key)
+        features = self.dino_feature_cache.get(key)
+        if features is None:
+            if image_tensor is None:
+                image_tensor = dino_input(image)
+            features = self.compute_dino_features(image_tensor)
+            self.dino_feature_cache.put(key, features, self._dino_features_nbytes(features))
+        return features
+
+    @torch.no_grad()
+    def _forward_groundingdino(
+        self,
+        image,
+        caption: str,
+        image_key: Optional[str] = None
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        GroundingDINO 单次前向，返回未经阈值过滤的原始输出
+
+        新版 GroundingDINO 在 forward 中检查 model.features / model.poss，存在时跳过骨干网络，
+        因此注入缓存的骨干特征后只会重跑文本编码器和跨模态解码器。
+
+        Args:
+            image: 输入图像 (RGB numpy array 或 DecodedImage)
+            caption: 已经过 normalize_caption 处理的文本
+            image_key: 图像内容哈希，用作骨干特征缓存键
+
+        Returns:
+            prediction_logits: (num_queries, 256) 每个查询对各 token 的 sigmoid 分数（CPU）
+            prediction_boxes: (num_queries, 4) 归一化 [cx, cy, w, h]（CPU）
+        """
+        image_processed = dino_input(image).to(self.device)
+
+        # forward 会向 poss 追加额外层级，因此传入列表副本
+        samples = image_processed[None]
+        use_cached_backbone = hasattr(self.groundingdino, "set_image_tensor")
+        if use_cached_backbone:
+            features = self.get_dino_features(image, image_key, image_processed)
+            self.groundingdino.features = list(features["features"])
+            self.groundingdino.poss = list(features["poss"])
+            if "padded_size" in features:
+                # 骨干特征来自补零后的输入，额外层级的 mask 由 samples 插值得到，需传入相同的补零
+                from backend.engines import pad_nested
+                samples = pad_nested(image_processed, features["padded_size"])
+
+        try:
+            with self._autocast():
+                outputs = self.groundingdino(samples, captions=[caption])
+        finally:
+            if use_cached_backbone:
+                self.groundingdino.unset_image_tensor()
+
+        prediction_logits = outputs["pred_logits"].float().cpu().sigmoid()[0]
+        prediction_boxes = outputs["pred_boxes"].float().cpu()[0]
+        return prediction_logits, prediction_boxes
+
+    def _predict_raw(
+        self,
+        image,
+        caption: str,
+        image_key: Optional[str] = None,
+        min_threshold: float = 0.0
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        带缓存的 GroundingDINO 原始输出，返回值同 _forward_groundingdino
+
+        缓存只保留最高分超过 detection_score_floor 的查询，阈值不低于该值时过滤结果与完整输出一致。
+
+        Args:
+            image: 输入图像 (RGB numpy array 或 DecodedImage)
+            caption: 已经过 normalize_caption 处理的文本
+            image_key: 图像内容哈希
+            min_threshold: 调用方将使用的最低边界框阈值，低于 detection_score_floor 时绕过缓存
+        """
+        if min_threshold < self.detection_score_floor:
+            return self._forward_groundingdino(image, caption, image_key)
+
+        key = (_cache_key(image, image_key), caption)
+        cached = self.detection_cache.get(key)
+        if cached is None:
+            cached = self._cache_raw(key, *self._forward_groundingdino(image, caption, image_key))
+        return cached["logits"], cached["boxes"]
+
+    def _cache_raw(self, key: tuple, prediction_logits: torch.Tensor, prediction_boxes: torch.Tensor) -> dict:
+        """
+        把原始输出中最高分超过 detection_score_floor 的查询存入检测结果缓存
+
+        保持 float32：命中缓存时在相同的分数上重新应用阈值，结果与未命中时逐位一致
+        """
+        keep = prediction_logits.max(dim=1)[0] > self.detection_score_floor
+        cached = {
+            "logits": prediction_logits[keep].float(),
+            "boxes": prediction_boxes[keep].float()
+        }
+        self.detection_cache.put(key, cached)
+        return cached
+
+    def detection_cached(self, image_key: Optional[str], text_prompt: str) -> bool:
+        """该图像 + 提示词的检测原始输出是否已缓存"""
+        return image_key is not None and (image_key, normalize_caption(text_prompt)) in self.detection_cache
+
     def detect_with_groundingdino(
         self,
-        image: np.ndarray,
+        image,
         text_prompt: str,
         box_threshold: float = 0.35,
-        text_threshold: float = 0.25
+        text_threshold: float = 0.25,
+        image_key: Optional[str] = None
     ) -> Tuple[np.ndarray, np.ndarray, List[str]]:
         """
         使用 GroundingDINO 检测目标
 
+        图像骨干特征按图像缓存，同一图像换提示词时只重跑文本编码器和跨模态解码器；
+        相同图像 + 提示词的原始输出也被缓存，重复检测或只改阈值时不再前向。
+
         Args:
-            image: 输入图像 (RGB numpy array)
+            image: 输入图像 (RGB numpy array 或 DecodedImage)
             text_prompt: 文本提示
             box_threshold: 边界框置信度阈值
             text_threshold: 文本置信度阈值
+            image_key: 图像内容哈希，用作骨干特征缓存键；None 时根据图像数组计算
 
         Returns:
             boxes: 边界框 (N, 4) 格式 [x1, y1, x2, y2]
             logits: 置信度分数
             phrases: 检测到的短语
         """
-        from groundingdino.util.inference import predict, load_image
-        import torchvision.transforms as T
+        caption = normalize_caption(text_prompt)
+        prediction_logits, prediction_boxes = self._predict_raw(image, caption, image_key, box_threshold)
 
-        # 图像已经是 RGB 格式的 numpy array，需要转换回 PIL Image
-        from PIL import Image
-        image_pil = Image.fromarray(image.astype('uint8'))
-
-        # GroundingDINO 预处理
-        transform = T.Compose([
-            T.Resize([800], max_size=1333),
-            T.ToTensor(),
-            T.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
-        ])
-
-        image_processed = transform(image_pil).to(self.device)
-
-        boxes, logits, phrases = predict(
-            model=self.groundingdino,
-            image=image_processed,
-            caption=text_prompt,
-            box_threshold=box_threshold,
-            text_threshold=text_threshold
+        return self._postprocess_detection(
+            prediction_logits, prediction_boxes, caption, box_threshold, text_threshold
+        )
+
+    def _postprocess_detection(
+        self,
+        prediction_logits: torch.Tensor,
+        prediction_boxes: torch.Tensor,
+        caption: str,
+        box_threshold: float,
+        text_threshold: float
+    ) -> Tuple[torch.Tensor, torch.Tensor, List[str]]:
+        """阈值过滤并提取短语，与 groundingdino.util.inference.predict 的后处理一致"""
+        from groundingdino.util.utils import get_phrases_from_posmap
+
+        mask = prediction_logits.max(dim=1)[0] > box_threshold
+        logits = prediction_logits[mask]
+        boxes = prediction_boxes[mask]
+
+        tokenizer = self.groundingdino.tokenizer
+        tokenized = tokenizer(caption)
+        phrases = [
+            get_phrases_from_posmap(logit > text_threshold, tokenized, tokenizer).replace('.', '')
+            for logit in logits
+        ]
+
+        return boxes, logits.max(dim=1)[0], phrases
+
+    @torch.no_grad()
+    def _forward_groundingdino_batch(
+        self,
+        images: List[np.ndarray],
+        caption: str,
+        image_keys: Optional[Sequence[Optional[str]]] = None
+    ) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+        """
+        多张图像共用一个 caption 的批量前向
+
+        各图像预处理后尺寸不同，先由 nested_tensor_from_tensor_list 补零对齐并生成 padding mask
+        （GroundingDINO.forward 在转换列表输入之前就会读取 samples.device，不能直接传列表）；
+        调用方应把尺寸相近的图像放在同一批以减少补零。
+
+        支持骨干特征注入时，先对整批运行骨干，按图像拆分后以补零尺寸（padded_size）存入骨干特征缓存，
+        之后同一图像的单张检测复用这份特征（见 _forward_groundingdino），再注入整批特征完成前向。
+
+        Args:
+            images: 输入图像列表 (RGB numpy array 或 DecodedImage)
+            caption: 已经过 normalize_caption 处理的文本
+            image_keys: 各图像的内容哈希，用作骨干特征缓存键；None 或某项为 None 时不缓存
+
+        Returns:
+            每张图像的 (prediction_logits, prediction_boxes)，含义同 _forward_groundingdino
+        """
+        from groundingdino.util.misc import NestedTensor, nested_tensor_from_tensor_list
+
+        samples = nested_tensor_from_tensor_list([dino_input(image).to(self.device) for image in images])
+
+        # 确保没有残留的单图注入特征
+        use_cached_backbone = hasattr(self.groundingdino, "set_image_tensor")
+        if use_cached_backbone:
+            self.groundingdino.unset_image_tensor()
+            with self._autocast():
+                features, poss = self.groundingdino.backbone(samples)
+            padded_size = tuple(samples.tensors.shape[-2:])
+            for i, key in enumerate(image_keys or []):
+                if key is None or key in self.dino_feature_cache:
+                    continue
+                image_features = {
+                    "features": [NestedTensor(f.tensors[i:i + 1], f.mask[i:i + 1]) for f in features],
+                    "poss": [p[i:i + 1] for p in poss],
+                    "padded_size": padded_size
+                }
+                self.dino_feature_cache.put(key, image_features, self._dino_features_nbytes(image_features))
+            # forward 会向 poss 追加额外层级，因此传入列表副本
+            self.groundingdino.features = list(features)
+            self.groundingdino.poss = list(poss)
+
+        try:
+            with self._autocast():
+                outputs = self.groundingdino(samples, captions=[caption] * len(images))
+        finally:
+            if use_cached_backbone:
+                self.groundingdino.unset_image_tensor()
+        prediction_logits = outputs["pred_logits"].float().cpu().sigmoid()
+        prediction_boxes = outputs["pred_boxes"].float().cpu()
+        return [(prediction_logits[i], prediction_boxes[i]) for i in range(len(images))]
+
+    def detect_batch(
+        self,
+        images: List[np.ndarray],
+        text_prompt: str,
+        box_threshold: float = 0.35,
+        text_threshold: float = 0.25,
+        image_keys: Optional[Sequence[Optional[str]]] = None
+    ) -> List[Tuple[torch.Tensor, torch.Tensor, List[str]]]:
+        """
+        多张图像使用同一提示词的批量检测（单次前向）
+
+        Args:
+            images: 输入图像列表 (RGB)，尺寸相近时补零开销最小
+            text_prompt: 文本提示
+            box_threshold: 边界框置信度阈值
+            text_threshold: 文本置信度阈值
+            image_keys: 各图像的内容哈希；提供时骨干特征与原始输出分别存入骨干特征缓存与检测结果缓存，
+                        之后同一图像的检测不再重跑完整前向
+
+        Returns:
+            每张图像的 (boxes, logits, phrases)，格式同 detect_with_groundingdino
+        """
+        if not images:
+            return []
+
+        caption = normalize_caption(text_prompt)
+        outputs = self._forward_groundingdino_batch(images, caption, image_keys)
+        for key, (logits, boxes) in zip(image_keys or [], outputs):
+            if key is not None:
+                self._cache_raw((key, caption), logits, boxes)
+        return [
+            self._postprocess_detection(logits, boxes, caption, box_threshold, text_threshold)
+            for logits, boxes in outputs
+        ]
+
+    def detect_multiple(
+        self,
+        image,
+        text_prompts: List[str],
+        box_threshold: float = 0.35,
+        text_threshold: float = 0.25,
+        class_thresholds: Optional[Dict[str, float]] = None,
+        image_key: Optional[str] = None
+    ) -> Dict[str, Tuple[torch.Tensor, torch.Tensor, List[str]]]:
+        """
+        单次前向检测多个类别
+
+        将多个短语拼接为一个 caption（如 "banner . building . crane ."），只运行一次
+        GroundingDINO，再按各类别在 caption 中的 token 区间把检测结果拆分回各类别。
+
+        Args:
+            image: 输入图像：路径、RGB numpy array 或 DecodedImage（路径经 load_image 读取，
+                推理进程池中以路径传入，避免跨进程传输像素数据）
+            text_prompts: 类别短语列表，如 ["banner", "building", "crane"]
+            box_threshold: 默认边界框置信度阈值
+            text_threshold: 文本置信度阈值
+            class_thresholds: 按类别覆盖的边界框阈值 {类别: 阈值}
+            image_key: 图像内容哈希，用作骨干特征缓存键
+
+        Returns:
+            {类别: (boxes, logits, phrases)}，格式与 detect_with_groundingdino 相同
+        """
+        from groundingdino.util.utils import get_phrases_from_posmap
+
+        class_thresholds = {k.strip().lower(): v for k, v in (class_thresholds or {}).items()}
+
+        classes = []
+        for prompt in text_prompts:
+            name = prompt.strip().lower().rstrip('.').strip()
+            if name and name not in classes:
+                classes.append(name)
+        if not classes:
+            return {}
+        if isinstance(image, str):
+            image = self.load_image(image, image_key)
+
+        tokenizer = self.groundingdino.tokenizer
+        caption = " . ".join(classes) + " ."
+        tokenized = tokenizer(caption)
+
+        # 各类别在 caption 中的 token 区间：[CLS] 之后依次为 "类别 token... ."
+        spans = []
+        position = 1
+        for name in classes:
+            length = len(tokenizer(name, add_special_tokens=False)["input_ids"])
+            spans.append((position, position + length))
+            position += length + 1
+
+        min_threshold = min([box_threshold] + list(class_thresholds.values()))
+        prediction_logits, prediction_boxes = self._predict_raw(image, caption, image_key, min_threshold)
+
+        # 每个查询归属于得分最高的类别
+        class_scores = torch.stack(
+            [prediction_logits[:, start:end].max(dim=1)[0] for start, end in spans], dim=1
         )
+        best_scores, best_classes = class_scores.max(dim=1)
+
+        results = {}
+        for class_index, (name, (start, end)) in enumerate(zip(classes, spans)):
+            threshold = class_thresholds.get(name, box_threshold)
+            mask = (best_classes == class_index) & (best_scores > threshold)
+
+            span_mask = torch.zeros(prediction_logits.shape[1], dtype=torch.bool)
+            span_mask[start:end] = True
 
-        return boxes, logits, phrases
+            phrases = []
+            for logit in prediction_logits[mask]:
+                posmap = (logit > text_threshold) & span_mask
+                phrase = get_phrases_from_posmap(posmap, tokenized, tokenizer).replace('.', '').strip()
+                phrases.append(phrase or name)
+
+            results[name] = (prediction_boxes[mask], best_scores[mask], phrases)
+
+        return results
+
+    def detect_tiled(
+        self,
+        image,
+        text_prompt: str,
+        box_threshold: float = 0.35,
+        text_threshold: float = 0.25,
+        tile_size: int = 1024,
+        overlap: float = 0.2,
+        batch_size: int = 4,
+        nms_threshold: float = 0.5,
+        include_full: bool = True,
+        image_key: Optional[str] = None
+    ) -> Tuple[torch.Tensor, torch.Tensor, List[str]]:
+        """
+        切块检测：大图切成有重叠的图块分批检测，框映射回原图后做跨图块 NMS
+
+        图块的裁剪与预处理在线程池中进行，与前一批图块的前向重叠执行；
+        所有图块尺寸相同，批量前向无需补零。
+
+        Args:
+            image: 输入图像 (RGB numpy array 或 DecodedImage)，通常为原始分辨率
+            text_prompt: 文本提示
+            box_threshold: 边界框置信度阈值
+            text_threshold: 文本置信度阈值
+            tile_size: 图块边长（像素）
+            overlap: 相邻图块的重叠比例
+            batch_size: 每次前向的图块数
+            nms_threshold: 跨图块 NMS 的 IoU 阈值
+            include_full: 是否额外对整幅图像检测一次（找回跨越图块边界的大目标）；
+                          开启时丢弃被图块内部边缘截断的框
+            image_key: 图像内容哈希，用作整图检测的骨干特征缓存键
+
+        Returns:
+            (boxes, logits, phrases)，格式同 detect_with_groundingdino（boxes 相对整幅图像归一化）
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from torchvision.ops import box_convert
+        from backend.tiling import tile_grid, inner_edge_mask, merge_detections
+
+        rgb = as_rgb(image)
+        h, w = rgb.shape[:2]
+        tiles = tile_grid(h, w, tile_size, overlap)
+        if len(tiles) == 1:
+            return self.detect_with_groundingdino(image, text_prompt, box_threshold, text_threshold, image_key)
+
+        caption = normalize_caption(text_prompt)
+        batch_size = max(1, batch_size)
+
+        def prepare(tile):
+            x0, y0, x1, y1 = tile
+            crop = DecodedImage(np.ascontiguousarray(rgb[y0:y1, x0:x1]))
+            crop.dino_tensor()
+            return crop
+
+        all_boxes, all_scores, all_phrases = [], [], []
+
+        def collect(boxes, logits, phrases, tile, drop_cut):
+            x0, y0, x1, y1 = tile
+            xyxy = self._boxes_to_xyxy(boxes, x1 - x0, y1 - y0, True).numpy()
+            xyxy += np.array([x0, y0, x0, y0], dtype=np.float32)
+            # 被截断的框由整图检测负责，不参与合并
+            keep = ~inner_edge_mask(xyxy, tile, h, w) if drop_cut else np.ones(len(xyxy), dtype=bool)
+            all_boxes.append(xyxy[keep])
+            all_scores.append(np.asarray(logits, dtype=np.float32).reshape(-1)[keep])
+            all_phrases.extend(p for p, k in zip(phrases, keep) if k)
+
+        with ThreadPoolExecutor(max_workers=min(4, len(tiles)), thread_name_prefix="tile") as executor:
+            # map 按顺序产出，后续图块的预处理与当前批次的前向并行
+            crops = executor.map(prepare, tiles)
+            for start in range(0, len(tiles), batch_size):
+                batch_tiles = tiles[start:start + batch_size]
+                batch_crops = [next(crops) for _ in batch_tiles]
+                outputs = self._forward_groundingdino_batch(batch_crops, caption)
+                for tile, (logits, boxes) in zip(batch_tiles, outputs):
+                    detections = self._postprocess_detection(logits, boxes, caption, box_threshold, text_threshold)
+                    collect(*detections, tile, drop_cut=include_full)
+
+        if include_full:
+            boxes, logits, phrases = self.detect_with_groundingdino(
+                image, text_prompt, box_threshold, text_threshold, image_key
+            )
+            collect(boxes, logits, phrases, (0, 0, w, h), drop_cut=False)
+
+        boxes = np.concatenate(all_boxes)
+        scores = np.concatenate(all_scores)
+        keep = merge_detections(boxes, scores, nms_threshold)
+
+        boxes_xyxy = torch.as_tensor(boxes[keep]).reshape(-1, 4) / torch.tensor([w, h, w, h], dtype=torch.float32)
+        return (
+            box_convert(boxes_xyxy, in_fmt="xyxy", out_fmt="cxcywh"),
+            torch.as_tensor(scores[keep]),
+            [all_phrases[i] for i in keep]
+        )
+
+    @torch.no_grad()
+    def compute_sam_embedding(self, image: np.ndarray) -> dict:
+        """
+        运行 SAM 图像编码器，计算图像嵌入
+
+        与 SamPredictor.set_image 的计算相同，但不修改 predictor 状态。
+
+        Args:
+            image: 输入图像 (RGB)
+
+        Returns:
+            embedding: 包含 features、original_size、input_size 的字典
+        """
+        return self.compute_sam_embeddings_batch([image])[0]
+
+    @torch.no_grad()
+    def compute_sam_embeddings_batch(self, images: List[np.ndarray]) -> List[dict]:
+        """
+        批量运行 SAM 图像编码器
+
+        每张图像先缩放到长边 1024，再由 sam.preprocess 补零到 1024x1024，
+        因此任意尺寸的图像都可以堆叠成一个批次送入编码器。
+
+        Args:
+            images: 输入图像列表 (RGB)
+
+        Returns:
+            每张图像的嵌入字典，格式同 compute_sam_embedding
+        """
+        sam = self.sam_predictor.model
+        inputs = []
+        sizes = []
+        for image in images:
+            image = as_rgb(image)
+            if sam.image_format != "RGB":
+                image = image[..., ::-1]
+
+            input_image = self.sam_predictor.transform.apply_image(image)
+            input_image_torch = torch.as_tensor(input_image, device=self.device)
+            input_image_torch = input_image_torch.permute(2, 0, 1).contiguous()[None, :, :, :]
+
+            inputs.append(sam.preprocess(input_image_torch))
+            sizes.append((tuple(image.shape[:2]), tuple(input_image_torch.shape[-2:])))
+
+        if not inputs:
+            return []
+
+        batch = torch.cat(inputs, dim=0)
+        features = self.engine.sam_encode(batch) if self.engine is not None else None
+        if features is None:
+            with self._autocast():
+                features = sam.image_encoder(batch)
+        # 掩码解码器以 fp32 运行，嵌入统一转回 fp32
+        features = features.float()
+
+        return [
+            {
+                "features": features[i:i + 1],
+                "original_size": original_size,
+                "input_size": input_size
+            }
+            for i, (original_size, input_size) in enumerate(sizes)
+        ]
+
+    def get_sam_embedding(self, image, image_key: Optional[str] = None) -> dict:
+        """
+        获取图像的 SAM 嵌入，优先从缓存读取
+
+        Args:
+            image: 输入图像 (RGB 数组或 DecodedImage)
+            image_key: 图像内容哈希，None 时使用 DecodedImage.key 或根据图像数组计算
+
+        Returns:
+            embedding: 见 compute_sam_embedding
+        """
+        key = _cache_key(image, image_key)
+        embedding = self.embedding_cache.get(key)
+        if embedding is None:
+            embedding = self.compute_sam_embedding(image)
+            self.embedding_cache.put(key, embedding)
+        return embedding
+
+    def precompute(self, stage: str, image_path: str, image_key: str):
+        """
+        预计算并缓存图像特征（供上传时的后台预计算使用）
+
+        只调用不修改模型状态的编码器，可以与在线推理并发执行。
+
+        Args:
+            stage: "dino"（GroundingDINO 骨干特征）或 "sam"（SAM 图像嵌入）
+            image_path: 图像路径
+            image_key: 图像内容哈希（缓存键）
+        """
+        # 两个阶段共用解码缓存中的同一份图像
+        image = self.load_image(image_path, image_key)
+        if stage == "dino":
+            self.get_dino_features(image, image_key)
+        elif stage == "sam":
+            self.get_sam_embedding(image, image_key)
+        else:
+            raise ValueError(f"未知的预计算阶段: {stage}")
+
+    def load_image(self, image_path: str, image_key: Optional[str] = None) -> DecodedImage:
+        """
+        读取图像，按内容哈希缓存解码结果（含 GroundingDINO 预处理张量）
+
+        Args:
+            image_path: 图像路径
+            image_key: 图像内容哈希，None 时不缓存
+
+        Returns:
+            DecodedImage
+        """
+        if image_key is None:
+            return DecodedImage.from_path(image_path)
+        image = self.decoded_image_cache.get(image_key)
+        if image is None:
+            image = DecodedImage.from_path(image_path, image_key)
+            # 检测总是先用到预处理张量，入缓存前算好以便按实际大小计入预算
+            image.dino_tensor()
+            self.decoded_image_cache.put(image_key, image, image.nbytes)
+        return image
+
+    def _set_sam_embedding(self, embedding: dict):
+        """将已计算的嵌入装载到 SamPredictor，等价于 set_image"""
+        self.sam_predictor.reset_image()
+        self.sam_predictor.features = embedding["features"]
+        self.sam_predictor.original_size = embedding["original_size"]
+        self.sam_predictor.input_size = embedding["input_size"]
+        self.sam_predictor.is_image_set = True
 
     def segment_with_sam(
         self,
-        image: np.ndarray,
+        image,
         boxes: np.ndarray,
-        boxes_normalized: bool = False
+        boxes_normalized: bool = False,
+        image_key: Optional[str] = None,
+        embedding: Optional[dict] = None
     ) -> List[np.ndarray]:
         """
         使用 SAM 进行分割
 
         Args:
-            image: 输入图像 (RGB)
+            image: 输入图像 (RGB 数组或 DecodedImage)
             boxes: 边界框，格式取决于 boxes_normalized 参数
             boxes_normalized: 如果为 True，boxes 是归一化的 [cx, cy, w, h] 格式 (0-1)
                               如果为 False，boxes 是像素坐标 [x1, y1, x2, y2] 格式
+            image_key: 图像内容哈希，用作嵌入缓存键；None 时根据图像数组计算
+            embedding: 已计算好的图像嵌入（如批量编码的结果），提供时跳过缓存查找
 
         Returns:
             masks: 分割掩码列表，每个掩码形状为 (H, W)
         """
-        self.sam_predictor.set_image(image)
+        self._set_sam_embedding(embedding or self.get_sam_embedding(image, image_key))
         h, w = image.shape[:2]
 
+        boxes_xyxy = self._boxes_to_xyxy(boxes, w, h, boxes_normalized)
+
+        # 所有框一次性变换到 SAM 输入坐标系，按 sam_batch_size 分批送入掩码解码器
+        transformed_boxes = self.sam_predictor.transform.apply_boxes_torch(
+            boxes_xyxy.to(self.device), (h, w)
+        )
+
+        sam = self.sam_predictor.model
         masks = []
-        for box in boxes:
-            box_np = box.cpu().numpy() if hasattr(box, 'cpu') else np.array(box)
-
-            if boxes_normalized:
-                # 从归一化的 [cx, cy, w, h] 转换为像素坐标 [x1, y1, x2, y2]
-                cx, cy, bw, bh = box_np
-                x1 = (cx - bw / 2) * w
-                y1 = (cy - bh / 2) * h
-                x2 = (cx + bw / 2) * w
-                y2 = (cy + bh / 2) * h
-                box_xyxy = np.array([x1, y1, x2, y2])
+        for start in range(0, len(transformed_boxes), self.sam_batch_size):
+            batch_boxes = transformed_boxes[start:start + self.sam_batch_size]
+            low_res_masks = None
+            if self.engine is not None:
+                low_res_masks = self.engine.sam_decode(self.sam_predictor.features, batch_boxes)
+            if low_res_masks is None:
+                batch_masks, _, _ = self.sam_predictor.predict_torch(
+                    point_coords=None,
+                    point_labels=None,
+                    boxes=batch_boxes,
+                    multimask_output=False
+                )
             else:
-                # 已经是 [x1, y1, x2, y2] 格式
-                box_xyxy = box_np
-
-            # SAM 期望 [x1, y1, x2, y2] 格式
-            mask, _, _ = self.sam_predictor.predict(
-                box=box_xyxy,
-                multimask_output=False
-            )
-            masks.append(mask[0])  # 取第一个掩码
+                # 与 predict_torch 相同的后处理：放大到原图尺寸后二值化
+                batch_masks = sam.postprocess_masks(
+                    low_res_masks, self.sam_predictor.input_size, self.sam_predictor.original_size
+                ) > sam.mask_threshold
+            masks.extend(batch_masks[:, 0].cpu().numpy())  # 取第一个掩码
 
         return masks
 
+    @staticmethod
+    def _boxes_to_xyxy(boxes, w: int, h: int, boxes_normalized: bool) -> torch.Tensor:
+        """
+        将边界框统一转换为像素坐标 [x1, y1, x2, y2] 的 (N, 4) float 张量
+
+        Args:
+            boxes: 边界框（torch.Tensor / numpy array / list）
+            w, h: 图像宽高
+            boxes_normalized: 如果为 True，boxes 是归一化的 [cx, cy, w, h] 格式 (0-1)
+        """
+        boxes_t = torch.as_tensor(
+            boxes.cpu() if hasattr(boxes, 'cpu') else np.asarray(boxes),
+            dtype=torch.float32
+        ).reshape(-1, 4)
+
+        if boxes_normalized:
+            from torchvision.ops import box_convert
+            boxes_t = box_convert(boxes_t, in_fmt="cxcywh", out_fmt="xyxy")
+            boxes_t = boxes_t * torch.tensor([w, h, w, h], dtype=torch.float32)
+
+        return boxes_t
+
     def predict(
         self,
         image_path: str,
         text_prompt: str,
         box_threshold: float = 0.35,
-        text_threshold: float = 0.25
+        text_threshold: float = 0.25,
+        image_key: Optional[str] = None
     ) -> dict:
         """
         完整的 Grounded-SAM 预测流程
@@ -155,6 +940,7 @@ class GroundedSAM:
             text_prompt: 文本提示（如 "crane arm"）
             box_threshold: 边界框置信度阈值
             text_threshold: 文本置信度阈值
+            image_key: 图像内容哈希，用作骨干特征与 SAM 嵌入的缓存键
 
         Returns:
             result: 包含以下键的字典:
@@ -162,17 +948,18 @@ class GroundedSAM:
                 - masks: 分割掩码
                 - logits: 置信度分数
                 - phrases: 检测到的短语
+                - image_size: 图像尺寸 (h, w)
         """
-        # 读取图像
-        image = cv2.imread(image_path)
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        # 读取图像（有 image_key 时复用解码缓存）
+        image = self.load_image(image_path, image_key)
 
         # 1. GroundingDINO 检测
         boxes, logits, phrases = self.detect_with_groundingdino(
-            image_rgb,
+            image,
             text_prompt,
             box_threshold,
-            text_threshold
+            text_threshold,
+            image_key=image_key
         )
 
         if len(boxes) == 0:
@@ -180,22 +967,222 @@ class GroundedSAM:
                 "boxes": [],
                 "masks": [],
                 "logits": [],
-                "phrases": []
+                "phrases": [],
+                "image_size": image.shape[:2]
             }
 
-        # 2. SAM 分割
-        masks = self.segment_with_sam(image_rgb, boxes)
+        # 2. SAM 分割（GroundingDINO 输出的是归一化 [cx, cy, w, h]）
+        masks = self.segment_with_sam(image, boxes, boxes_normalized=True, image_key=image_key)
 
         return {
             "boxes": boxes,
             "masks": masks,
             "logits": logits,
-            "phrases": phrases
+            "phrases": phrases,
+            "image_size": image.shape[:2]
         }
 
-    def annotate(
+    def predict_tiled(
         self,
         image_path: str,
+        text_prompt: str,
+        box_threshold: float = 0.35,
+        text_threshold: float = 0.25,
+        tile_size: int = 1024,
+        overlap: float = 0.2,
+        batch_size: int = 4,
+        nms_threshold: float = 0.5,
+        image_key: Optional[str] = None
+    ) -> dict:
+        """
+        高分辨率图像的切块 Grounded-SAM 预测
+
+        检测见 detect_tiled；分割时每个框交给完整包含它的图块，在图块分辨率下运行 SAM
+        （SAM 同样把输入缩放到长边 1024，整图分割时小目标的掩码会很粗糙），
+        各图块的 SAM 嵌入按 batch_size 批量编码，掩码再贴回原图坐标。
+        没有图块能完整包含的大目标在整幅图像上分割。
+
+        Args:
+            image_path: 图像路径（原始分辨率；解码结果不进入解码缓存，避免挤占常规图像）
+            text_prompt / box_threshold / text_threshold: 同 predict
+            tile_size / overlap / batch_size / nms_threshold: 同 detect_tiled
+            image_key: 图像内容哈希，用作整图骨干特征与 SAM 嵌入的缓存键
+
+        Returns:
+            与 predict 相同的键，另含 tiles（图块数）与 timings（各阶段耗时，秒）；掩码为原图尺寸
+        """
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from backend.tiling import tile_grid, assign_to_tiles
+
+        t_start = time.perf_counter()
+        image = DecodedImage.from_path(image_path, image_key)
+        t_decode = time.perf_counter() - t_start
+        h, w = image.shape[:2]
+        tiles = tile_grid(h, w, tile_size, overlap)
+
+        boxes, logits, phrases = self.detect_tiled(
+            image, text_prompt, box_threshold, text_threshold,
+            tile_size=tile_size, overlap=overlap, batch_size=batch_size,
+            nms_threshold=nms_threshold, image_key=image_key
+        )
+        t_detect = time.perf_counter() - t_start - t_decode
+        result = {
+            "boxes": boxes,
+            "masks": [],
+            "logits": logits,
+            "phrases": phrases,
+            "image_size": image.shape[:2],
+            "tiles": len(tiles),
+            "timings": {"decode": t_decode, "detect": t_detect, "segment": 0.0, "total": t_decode + t_detect}
+        }
+        if len(boxes) == 0:
+            return result
+
+        boxes_xyxy = self._boxes_to_xyxy(boxes, w, h, True)
+        owners = assign_to_tiles(boxes_xyxy.numpy(), tiles) if len(tiles) > 1 else np.full(len(boxes), -1)
+        masks = [None] * len(boxes)
+
+        # 大目标：整图分割
+        full = np.flatnonzero(owners == -1)
+        if len(full):
+            for i, mask in zip(full, self.segment_with_sam(image, boxes_xyxy[full], image_key=image_key)):
+                masks[i] = mask
+
+        # 小目标：按图块分组，图块嵌入批量编码
+        used = sorted(set(owners[owners >= 0].tolist()))
+
+        def crop(index):
+            x0, y0, x1, y1 = tiles[index]
+            return np.ascontiguousarray(image.rgb[y0:y1, x0:x1])
+
+        with ThreadPoolExecutor(max_workers=min(4, max(1, len(used))), thread_name_prefix="tile") as executor:
+            crops = executor.map(crop, used)
+            for start in range(0, len(used), max(1, batch_size)):
+                batch = used[start:start + max(1, batch_size)]
+                batch_crops = [next(crops) for _ in batch]
+                embeddings = self.compute_sam_embeddings_batch(batch_crops)
+                for index, tile_image, embedding in zip(batch, batch_crops, embeddings):
+                    x0, y0, x1, y1 = tiles[index]
+                    members = np.flatnonzero(owners == index)
+                    local = boxes_xyxy[members] - torch.tensor([x0, y0, x0, y0], dtype=torch.float32)
+                    tile_masks = self.segment_with_sam(tile_image, local, embedding=embedding)
+                    for i, tile_mask in zip(members, tile_masks):
+                        mask = np.zeros((h, w), dtype=bool)
+                        mask[y0:y1, x0:x1] = tile_mask
+                        masks[i] = mask
+
+        result["masks"] = masks
+        result["timings"]["total"] = time.perf_counter() - t_start
+        result["timings"]["segment"] = result["timings"]["total"] - t_decode - t_detect
+        return result
+
+    def predict_batch(
+        self,
+        image_paths: List[str],
+        text_prompt: str,
+        box_threshold: float = 0.35,
+        text_threshold: float = 0.25,
+        batch_size: int = 4
+    ) -> Iterator[dict]:
+        """
+        批量 Grounded-SAM 预测，按批次完成顺序逐个产出结果
+
+        图像按尺寸排序后分批，同一批次的图像一起送入 GroundingDINO 和 SAM 图像编码器；
+        只在处理到某一批时才解码该批图像，内存占用与图像总数无关。
+
+        Args:
+            image_paths: 图像路径列表
+            text_prompt: 文本提示（所有图像共用）
+            box_threshold: 边界框置信度阈值
+            text_threshold: 文本置信度阈值
+            batch_size: 每批图像数
+
+        Yields:
+            result: 与 predict 相同的键，另含:
+                - index: 图像在 image_paths 中的下标
+                - image_path: 图像路径
+                - timings: 各阶段耗时（秒），批量阶段按图像数均摊
+                - error: 图像无法读取时的错误信息（此时不含检测结果）
+        """
+        import time
+        from PIL import Image
+
+        batch_size = max(1, batch_size)
+
+        # 只读取文件头获取尺寸，按 (高, 宽) 排序使同批图像补零最少
+        sizes = {}
+        for index, path in enumerate(image_paths):
+            try:
+                with Image.open(path) as im:
+                    sizes[index] = (im.size[1], im.size[0])
+            except Exception:
+                sizes[index] = (0, 0)
+        order = sorted(range(len(image_paths)), key=lambda i: sizes[i])
+
+        for start in range(0, len(order), batch_size):
+            group = order[start:start + batch_size]
+
+            t0 = time.perf_counter()
+            images = {}
+            for index in group:
+                image = cv2.imread(image_paths[index])
+                if image is None:
+                    yield {"index": index, "image_path": image_paths[index], "error": "无法读取图像"}
+                    continue
+                images[index] = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            valid = list(images)
+            if not valid:
+                continue
+            t_decode = (time.perf_counter() - t0) / len(valid)
+
+            # 1. GroundingDINO 批量检测
+            t0 = time.perf_counter()
+            detections = dict(zip(valid, self.detect_batch(
+                [images[i] for i in valid], text_prompt, box_threshold, text_threshold
+            )))
+            t_detect = (time.perf_counter() - t0) / len(valid)
+
+            # 2. SAM 图像编码器批量编码（只对有检测结果的图像）
+            t0 = time.perf_counter()
+            need_sam = [i for i in valid if len(detections[i][0]) > 0]
+            embeddings = dict(zip(
+                need_sam,
+                self.compute_sam_embeddings_batch([images[i] for i in need_sam])
+            ))
+            t_encode = (time.perf_counter() - t0) / len(need_sam) if need_sam else 0.0
+
+            # 3. 逐图解码掩码并产出
+            for index in valid:
+                boxes, logits, phrases = detections[index]
+                t0 = time.perf_counter()
+                masks = []
+                if index in embeddings:
+                    masks = self.segment_with_sam(
+                        images[index], boxes, boxes_normalized=True, embedding=embeddings[index]
+                    )
+                t_masks = time.perf_counter() - t0
+
+                yield {
+                    "index": index,
+                    "image_path": image_paths[index],
+                    "boxes": boxes,
+                    "masks": masks,
+                    "logits": logits,
+                    "phrases": phrases,
+                    "image_size": images[index].shape[:2],
+                    "timings": {
+                        "decode": t_decode,
+                        "detect": t_detect,
+                        "sam_encode": t_encode if index in embeddings else 0.0,
+                        "sam_decode": t_masks,
+                        "total": t_decode + t_detect + (t_encode if index in embeddings else 0.0) + t_masks
+                    }
+                }
+
+    def annotate(
+        self,
+        image,
         boxes: np.ndarray,
         masks: List[np.ndarray],
         logits: np.ndarray,
@@ -209,7 +1196,7 @@ class GroundedSAM:
         可视化预测结果
 
         Args:
-            image_path: 原始图像路径
+            image: 原始图像：路径、RGB 数组或 DecodedImage（传入已解码的图像可避免再次读取）
             boxes: 边界框
             masks: 分割掩码
             logits: 置信度分数
@@ -219,36 +1206,30 @@ class GroundedSAM:
             draw_masks: 是否绘制掩码
             random_color: 是否使用随机颜色
         """
-        image = cv2.imread(image_path)
-
-        if draw_masks:
-            for i, mask in enumerate(masks):
-                mask_uint8 = (mask * 255).astype(np.uint8)
-                contours, _ = cv2.findContours(
-                    mask_uint8,
-                    cv2.RETR_EXTERNAL,
-                    cv2.CHAIN_APPROX_SIMPLE
-                )
-
-                color = np.random.randint(0, 256, 3).tolist() if random_color else [0, 255, 0]
+        if isinstance(image, str):
+            image = DecodedImage.from_path(image)
 
-                # 填充掩码
-                mask_overlay = ((mask > 0)[:, :, None] * color).astype(np.uint8)
-                image = cv2.addWeighted(image, 0.7, mask_overlay, 0.3, 0)
+        # 在 RGB 副本上渲染（解码结果被检测 / SAM 共享，不能原地修改）
+        canvas = as_rgb(image).copy()
 
-                # 绘制轮廓
-                cv2.drawContours(image, contours, -1, color, 2)
+        if draw_masks and len(masks) > 0:
+            # 所有掩码合成一张标签图后一次混合，只处理掩码外接框范围
+            colors = np.random.randint(0, 256, (len(masks), 3)) if random_color else None
+            self.mask_renderer.render(canvas, masks, colors=colors)
 
         if draw_boxes:
+            # groundingdino 的 annotate 接收 RGB，返回 BGR
             from groundingdino.util.inference import annotate as annotate_dino
-            image = annotate_dino(
-                image_source=image,
+            canvas = annotate_dino(
+                image_source=canvas,
                 boxes=boxes,
                 logits=logits,
                 phrases=phrases
             )
+        else:
+            canvas = cv2.cvtColor(canvas, cv2.COLOR_RGB2BGR)
 
-        cv2.imwrite(output_path, image)
+        cv2.imwrite(output_path, canvas)
 
 
 # 便捷函数
@@ -256,7 +1237,16 @@ def load_grounded_sam(
     groundingdino_config: str = "weights/GroundingDINO_SwinT_OGC.py",
     groundingdino_checkpoint: str = "weights/groundingdino_swint_ogc.pth",
     sam_checkpoint: str = "weights/sam_vit_b_01ec64.pth",
-    device: Optional[str] = None
+    device: Optional[str] = None,
+    sam_batch_size: int = 16,
+    embedding_cache_bytes: int = 512 * 1024 * 1024,
+    dino_feature_cache_bytes: int = 512 * 1024 * 1024,
+    text_cache_bytes: int = 32 * 1024 * 1024,
+    decoded_image_cache_bytes: int = 256 * 1024 * 1024,
+    detection_cache_bytes: int = 64 * 1024 * 1024,
+    precision: str = "fp32",
+    engine: str = "eager",
+    compiled_dir: Optional[str] = None
 ) -> GroundedSAM:
     """
     加载 Grounded-SAM 模型
@@ -266,6 +1256,15 @@ def load_grounded_sam(
         groundingdino_checkpoint: GroundingDINO 权重文件路径
         sam_checkpoint: SAM 权重文件路径
         device: 设备 ('cuda', 'cpu' 或 None 自动检测)
+        sam_batch_size: SAM 掩码解码器单次前向的最大框数
+        embedding_cache_bytes: SAM 图像嵌入缓存的字节上限
+        dino_feature_cache_bytes: GroundingDINO 图像骨干特征缓存的字节上限
+        text_cache_bytes: BERT 文本编码缓存的字节上限
+        decoded_image_cache_bytes: 解码后图像缓存的字节上限
+        detection_cache_bytes: GroundingDINO 原始输出缓存的字节上限
+        precision: 推理精度 fp32 / int8 / bf16
+        engine: 推理引擎 eager / torchscript / onnxruntime
+        compiled_dir: 导出图的缓存目录，None 时为 weights/compiled
 
     Returns:
         GroundedSAM 实例
@@ -274,26 +1273,101 @@ def load_grounded_sam(
         groundingdino_config=groundingdino_config,
         groundingdino_checkpoint=groundingdino_checkpoint,
         sam_checkpoint=sam_checkpoint,
-        device=device
+        device=device,
+        sam_batch_size=sam_batch_size,
+        embedding_cache_bytes=embedding_cache_bytes,
+        dino_feature_cache_bytes=dino_feature_cache_bytes,
+        text_cache_bytes=text_cache_bytes,
+        decoded_image_cache_bytes=decoded_image_cache_bytes,
+        detection_cache_bytes=detection_cache_bytes,
+        precision=precision,
+        engine=engine,
+        compiled_dir=compiled_dir
     )
 
 
+def _run_batch_cli(model: GroundedSAM, input_dir: str, text_prompt: str, output_dir: str, batch_size: int):
+    """命令行批量模式：处理目录下所有图像，逐个输出结果与耗时"""
+    import time
+
+    extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+    image_paths = sorted(
+        os.path.join(input_dir, name) for name in os.listdir(input_dir)
+        if name.lower().endswith(extensions)
+    )
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"Running batch prediction on {len(image_paths)} images with prompt '{text_prompt}'...")
+    start = time.perf_counter()
+    for result in model.predict_batch(image_paths, text_prompt, batch_size=batch_size):
+        name = os.path.basename(result['image_path'])
+        if 'error' in result:
+            print(f"  [{result['index']}] {name}: {result['error']}")
+            continue
+
+        if result['phrases']:
+            model.annotate(
+                image=result['image_path'],
+                boxes=result['boxes'],
+                masks=result['masks'],
+                logits=result['logits'],
+                phrases=result['phrases'],
+                output_path=os.path.join(output_dir, name.rsplit('.', 1)[0] + "_grounded_sam_result.jpg")
+            )
+
+        timings = " ".join(f"{k}={v * 1000:.0f}ms" for k, v in result['timings'].items())
+        print(f"  [{result['index']}] {name}: {len(result['phrases'])} objects ({timings})")
+
+    elapsed = time.perf_counter() - start
+    if image_paths:
+        print(f"Processed {len(image_paths)} images in {elapsed:.1f}s ({len(image_paths) / elapsed:.2f} images/s)")
+    print(f"Results saved to {output_dir}")
+
+
 if __name__ == "__main__":
     # 测试代码
     import sys
+    import argparse
+
+    # 以脚本方式运行时，确保可以导入 backend 包
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-    if len(sys.argv) < 3:
-        print("Usage: python grounded_sam.py <image_path> <text_prompt>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Grounded-SAM 推理（单张图像或目录批量）")
+    parser.add_argument("image_path", help="图像路径；传入目录时进入批量模式")
+    parser.add_argument("text_prompt", help="文本提示，如 'crane arm'")
+    parser.add_argument("--batch-size", type=int, default=4, help="批量模式下每批图像数")
+    parser.add_argument("--output-dir", default=None, help="批量模式的输出目录（默认 <目录>/grounded_sam_results）")
+    parser.add_argument("--tile-size", type=int, default=0, help="切块模式的图块边长（像素），0 表示不切块")
+    parser.add_argument("--tile-overlap", type=float, default=0.2, help="切块模式相邻图块的重叠比例")
+    parser.add_argument("--precision", default="fp32", choices=["fp32", "int8", "bf16"], help="推理精度")
+    parser.add_argument("--engine", default="eager", choices=["eager", "torchscript", "onnxruntime"], help="推理引擎")
+    args = parser.parse_args()
 
-    image_path = sys.argv[1]
-    text_prompt = sys.argv[2]
+    image_path = args.image_path
+    text_prompt = args.text_prompt
 
     print("Loading Grounded-SAM model...")
-    model = load_grounded_sam()
+    model = load_grounded_sam(precision=args.precision, engine=args.engine)
+
+    if os.path.isdir(image_path):
+        _run_batch_cli(
+            model,
+            image_path,
+            text_prompt,
+            args.output_dir or os.path.join(image_path, "grounded_sam_results"),
+            args.batch_size
+        )
+        sys.exit(0)
 
     print(f"Running prediction on {image_path} with prompt '{text_prompt}'...")
-    result = model.predict(image_path, text_prompt)
+    if args.tile_size > 0:
+        result = model.predict_tiled(
+            image_path, text_prompt,
+            tile_size=args.tile_size, overlap=args.tile_overlap, batch_size=args.batch_size
+        )
+        print(f"Tiled inference over {result['tiles']} tiles")
+    else:
+        result = model.predict(image_path, text_prompt)
 
     print(f"Detected {len(result['phrases'])} objects:")
     for phrase, logit in zip(result['phrases'], result['logits']):
@@ -301,7 +1375,7 @@ if __name__ == "__main__":
 
     output_path = image_path.rsplit('.', 1)[0] + "_grounded_sam_result.jpg"
     model.annotate(
-        image_path=image_path,
+        image=image_path,
         boxes=result['boxes'],
         masks=result['masks'],
         logits=result['logits'],
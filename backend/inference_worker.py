@@ -0,0 +1,241 @@
+"""
+推理工作线程
+
+由单个线程独占 GroundedSAM：SamPredictor 的 set_image 状态和 GroundingDINO 的
+骨干特征注入都会修改模型实例，多个 Flask 线程同时推理会互相破坏结果。
+所有检测/分割请求都提交到这里串行执行（图像以路径 + 内容哈希传入，在推理线程中经
+GroundedSAM.load_image 从解码缓存读取）；在一个很短的时间窗口内到达的请求会被合并：
+
+- 同一图像的分割请求合并为一次 SAM 掩码解码（只装载一次嵌入）
+- 相同图像 + 相同提示词 + 相同阈值的检测请求只计算一次
+- 相同提示词、不同图像且都没有骨干缓存的检测请求合并为一次批量前向
+
+上传时的后台预计算只调用不修改模型状态的编码器（compute_dino_features /
+compute_sam_embedding），因此不经过此线程，避免长耗时任务阻塞在线请求。
+"""
+
+import time
+import types
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+import numpy as np
+
+# 请求类型
+RUN = "run"
+DETECT = "detect"
+SEGMENT = "segment"
+
+
+def _materialize(result):
+    """生成器结果在执行线程/进程内展开，调用方拿到的是完整列表"""
+    return list(result) if isinstance(result, types.GeneratorType) else result
+
+
+class _Request:
+    def __init__(self, kind: str, args: tuple, kwargs: dict):
+        self.kind = kind
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class InferenceWorker:
+    """独占模型的推理线程，带微批合并"""
+
+    def __init__(self, model_getter: Callable, window_ms: float = 10, max_batch: int = 8):
+        """
+        Args:
+            model_getter: 返回 GroundedSAM 实例的函数（在工作线程中首次调用）
+            window_ms: 收到可合并请求后，继续等待同批请求的时间窗口（毫秒）
+            max_batch: 单个批次最多合并的请求数
+        """
+        self._model_getter = model_getter
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue = queue.Queue()
+        self._stats = {"requests": 0, "batches": 0, "coalesced": 0}
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name="inference-worker", daemon=True)
+        self._thread.start()
+
+    # ---- 提交接口（阻塞等待结果） ----
+
+    def submit(self, method: str, *args, **kwargs) -> Future:
+        """
+        提交 GroundedSAM 方法调用（如 "predict"），在推理线程中独占执行
+
+        生成器结果（如 predict_batch）会被展开为列表。
+        """
+        return self._submit(RUN, (method,) + args, kwargs)
+
+    def call(self, method: str, *args, **kwargs):
+        """submit 的阻塞版本"""
+        return self.submit(method, *args, **kwargs).result()
+
+    def detect(
+        self,
+        image_path: str,
+        text_prompt: str,
+        box_threshold: float = 0.35,
+        text_threshold: float = 0.25,
+        image_key: Optional[str] = None
+    ):
+        """GroundingDINO 检测，图像以路径传入，其余参数与返回值同 GroundedSAM.detect_with_groundingdino"""
+        return self._submit(DETECT, (image_path, text_prompt, box_threshold, text_threshold, image_key), {}).result()
+
+    def segment(
+        self,
+        image_path: str,
+        boxes,
+        boxes_normalized: bool = False,
+        image_key: Optional[str] = None
+    ) -> List[np.ndarray]:
+        """SAM 分割，图像以路径传入，其余参数与返回值同 GroundedSAM.segment_with_sam"""
+        return self._submit(SEGMENT, (image_path, boxes, boxes_normalized, image_key), {}).result()
+
+    def _submit(self, kind: str, args: tuple, kwargs: dict) -> Future:
+        request = _Request(kind, args, kwargs)
+        self._queue.put(request)
+        return request.future
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    # ---- 工作线程 ----
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+
+            # 先取走已在排队的请求，再对可合并请求等待一个短窗口
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[0].kind != RUN:
+                deadline = time.monotonic() + self.window
+                while len(batch) < self.max_batch:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+
+            with self._stats_lock:
+                self._stats["requests"] += len(batch)
+                self._stats["batches"] += 1
+
+            try:
+                model = self._model_getter()
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            self._process(model, batch)
+
+    def _process(self, model, batch: List[_Request]):
+        runs = [r for r in batch if r.kind == RUN]
+        detects = [r for r in batch if r.kind == DETECT]
+        segments = [r for r in batch if r.kind == SEGMENT]
+
+        for request in runs:
+            method, args = request.args[0], request.args[1:]
+            self._resolve([request], lambda: _materialize(getattr(model, method)(*args, **request.kwargs)))
+
+        self._process_detects(model, detects)
+        self._process_segments(model, segments)
+
+    def _resolve(self, requests: List[_Request], compute: Callable, split: Callable = None):
+        """执行 compute 并把结果（或异常）交给一组请求；split(result, i) 用于拆分合并结果"""
+        try:
+            result = compute()
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        for i, request in enumerate(requests):
+            request.future.set_result(split(result, i) if split else result)
+
+    def _count_coalesced(self, n: int):
+        if n > 1:
+            with self._stats_lock:
+                self._stats["coalesced"] += n - 1
+
+    def _process_detects(self, model, requests: List[_Request]):
+        # 相同 (提示词, 阈值) 归为一桶，桶内相同图像的请求去重
+        buckets = {}
+        for request in requests:
+            image_path, prompt, box_threshold, text_threshold, image_key = request.args
+            images = buckets.setdefault((prompt, box_threshold, text_threshold), {})
+            images.setdefault(image_key or image_path, []).append(request)
+
+        for (prompt, box_threshold, text_threshold), images in buckets.items():
+            # 没有骨干缓存的多张不同图像合并为一次批量前向（骨干特征与原始输出写入缓存，之后单独检测可复用），
+            # 其余单独检测（可复用骨干缓存或检测结果缓存）
+            uncached = [
+                group for group in images.values()
+                if group[0].args[4] and group[0].args[4] not in model.dino_feature_cache
+                and not model.detection_cached(group[0].args[4], prompt)
+            ]
+            if len(uncached) < 2:
+                uncached = []
+
+            for group in images.values():
+                if any(group is g for g in uncached):
+                    continue
+                self._count_coalesced(len(group))
+                image_path, _, _, _, image_key = group[0].args
+                self._resolve(group, lambda: model.detect_with_groundingdino(
+                    model.load_image(image_path, image_key), prompt, box_threshold, text_threshold,
+                    image_key=image_key
+                ))
+
+            if uncached:
+                flat = [request for group in uncached for request in group]
+                owners = [i for i, group in enumerate(uncached) for _ in group]
+                self._count_coalesced(len(flat))
+                self._resolve(
+                    flat,
+                    lambda: model.detect_batch(
+                        [model.load_image(group[0].args[0], group[0].args[4]) for group in uncached],
+                        prompt, box_threshold, text_threshold,
+                        image_keys=[group[0].args[4] for group in uncached]
+                    ),
+                    lambda results, i: results[owners[i]]
+                )
+
+    def _process_segments(self, model, requests: List[_Request]):
+        # 同一图像的分割请求合并为一次掩码解码
+        groups = {}
+        for request in requests:
+            image_path, _, _, image_key = request.args
+            groups.setdefault(image_key or image_path, []).append(request)
+
+        for group in groups.values():
+            self._count_coalesced(len(group))
+            image_path, _, _, image_key = group[0].args
+            offsets = np.cumsum([0] + [len(r.args[1]) for r in group])
+
+            def compute():
+                import torch
+                image = model.load_image(image_path, image_key)
+                h, w = image.shape[:2]
+                boxes_xyxy = [
+                    model._boxes_to_xyxy(boxes, w, h, boxes_normalized)
+                    for _, boxes, boxes_normalized, _ in (r.args for r in group)
+                ]
+                return model.segment_with_sam(
+                    image, torch.cat(boxes_xyxy), boxes_normalized=False, image_key=image_key
+                )
+
+            self._resolve(group, compute, lambda masks, i: masks[offsets[i]:offsets[i + 1]])
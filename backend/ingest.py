@@ -0,0 +1,248 @@
+"""
+上传图片接收
+
+上传的图片按块流式写入磁盘（边写边计算哈希，超过字节上限立即中止），
+根据文件头识别格式而不是信任扩展名，按内容哈希命名（相同图片只保存一份），
+并在原图之外保存一份工作分辨率副本：
+
+- 长边不超过 max_side 的图片直接作为工作图，不额外保存
+- 超大 JPEG 使用 draft 模式在解码时按 1/2、1/4、1/8 缩小，避免解码出完整的几千万像素数组
+- 工作图已按 EXIF 方向转正（与 cv2.imread 的读取结果一致）
+
+下游的检测、SAM 与渲染都只读取工作图；需要原图分辨率的掩码时用 resize_masks 放大。
+"""
+
+import os
+import uuid
+import hashlib
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+# 文件头特征 -> (格式, 保存扩展名)
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png", ".png"),
+    (b"BM", "bmp", ".bmp"),
+    (b"II*\x00", "tiff", ".tif"),
+    (b"MM\x00*", "tiff", ".tif"),
+)
+
+# EXIF 方向为 5~8 时图像需要转置，宽高互换
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+class UploadError(ValueError):
+    """上传内容不合法（格式不支持、无法解码等）"""
+
+
+class UploadTooLarge(UploadError):
+    """上传文件超过字节上限"""
+
+
+def sniff_format(header: bytes) -> Optional[Tuple[str, str]]:
+    """
+    根据文件头识别图像格式
+
+    Args:
+        header: 文件开头的字节（至少 12 字节）
+
+    Returns:
+        (格式, 扩展名)，无法识别时为 None
+    """
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp", ".webp"
+    for signature, image_format, ext in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format, ext
+    return None
+
+
+def _stream_to_file(stream: BinaryIO, path: str, max_bytes: int, chunk_size: int = 1 << 20) -> Tuple[bytes, str]:
+    """按块写入文件并计算 SHA-256，返回 (文件头, 哈希)；超过上限时删除已写入的部分"""
+    h = hashlib.sha256()
+    header = b""
+    written = 0
+    try:
+        with open(path, "wb") as f:
+            for chunk in iter(lambda: stream.read(chunk_size), b""):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge(f"图片超过大小上限 {max_bytes // (1024 * 1024)} MB")
+                if len(header) < 16:
+                    header += chunk[:16 - len(header)]
+                h.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return header, h.hexdigest()
+
+
+def _working_size(width: int, height: int, max_side: int) -> Tuple[int, int]:
+    """等比缩放到长边不超过 max_side 后的 (宽, 高)"""
+    scale = min(1.0, max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def receive_upload(stream: BinaryIO, dest_dir: str, max_bytes: int) -> Tuple[str, str, str, str]:
+    """
+    流式接收上传内容到临时文件，边写边计算内容哈希并校验格式
+
+    Args:
+        stream: 上传文件的字节流（如 werkzeug FileStorage.stream）
+        dest_dir: 保存目录
+        max_bytes: 原图字节上限
+
+    Returns:
+        (临时文件路径, 内容 SHA-256, 格式, 扩展名)，之后交给 store_upload 落盘
+
+    Raises:
+        UploadTooLarge: 超过字节上限
+        UploadError: 格式不支持
+    """
+    part_path = os.path.join(dest_dir, f".{uuid.uuid4().hex}.part")
+    header, content_hash = _stream_to_file(stream, part_path, max_bytes)
+
+    detected = sniff_format(header)
+    if detected is None:
+        os.remove(part_path)
+        raise UploadError("不支持的图片格式（支持 JPEG / PNG / WebP / BMP / TIFF）")
+    image_format, ext = detected
+    return part_path, content_hash, image_format, ext
+
+
+def store_upload(
+    part_path: str,
+    content_hash: str,
+    image_format: str,
+    ext: str,
+    dest_dir: str,
+    max_side: int
+) -> Dict:
+    """
+    按内容哈希保存原图并生成工作分辨率副本；相同内容的文件已存在时直接复用
+
+    原图保存为 <哈希><扩展名>，工作图为 <哈希>_w<max_side>.jpg（不需要缩放且方向正确时即原图），
+    都先写入唯一的临时文件再原子改名，同一内容的多次 store_upload 可以并发执行。
+    调用方需保证执行期间该内容的文件不会被删除（见 UploadStore，先持有引用再落盘）。
+
+    Args:
+        part_path: receive_upload 返回的临时文件
+        content_hash / image_format / ext: receive_upload 的返回值
+        dest_dir: 保存目录
+        max_side: 工作图长边上限（像素）
+
+    Returns:
+        {
+            "image_path": 工作图路径（下游统一使用），
+            "original_path": 原图路径（未缩放时与 image_path 相同），
+            "image_hash": 原图内容哈希（会话与各级缓存共用的键）,
+            "format": 原图格式,
+            "image_size": [h, w] 工作图尺寸,
+            "original_size": [h, w] 原图尺寸（已按 EXIF 方向转正）,
+            "deduplicated": 相同内容是否已存在
+        }
+
+    Raises:
+        UploadError: 图片无法解码
+    """
+    original_path = os.path.join(dest_dir, f"{content_hash}{ext}")
+    deduplicated = os.path.exists(original_path)
+    if deduplicated:
+        # 重复上传：丢弃临时文件，刷新修改时间以免被陈旧文件清理删除
+        os.remove(part_path)
+        os.utime(original_path)
+    else:
+        os.replace(part_path, original_path)
+
+    try:
+        with Image.open(original_path) as image:
+            width, height = image.size
+            orientation = image.getexif().get(0x0112, 1)
+            if orientation in _TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+            work_w, work_h = _working_size(width, height, max_side)
+
+            if (work_w, work_h) == (width, height) and orientation == 1:
+                working_path = original_path
+            else:
+                working_path = os.path.join(dest_dir, f"{content_hash}_w{max_side}.jpg")
+                if os.path.exists(working_path):
+                    os.utime(working_path)
+                else:
+                    if image_format == "jpeg":
+                        # draft 只能按 2 的幂缩小，解码结果不小于请求尺寸（按未转置的方向请求）
+                        draft_size = (work_h, work_w) if orientation in _TRANSPOSED_ORIENTATIONS else (work_w, work_h)
+                        image.draft("RGB", draft_size)
+                    working = ImageOps.exif_transpose(image.convert("RGB"))
+                    if working.size != (work_w, work_h):
+                        working = working.resize((work_w, work_h), Image.LANCZOS)
+                    # 先写临时文件再改名，读取方不会看到写了一半的工作图
+                    tmp_path = f"{working_path}.{uuid.uuid4().hex}.part"
+                    working.save(tmp_path, "JPEG", quality=95)
+                    os.replace(tmp_path, working_path)
+    except (OSError, Image.DecompressionBombError) as e:
+        if not deduplicated:
+            os.remove(original_path)
+        raise UploadError(f"无法解码图片: {e}")
+
+    return {
+        "image_path": working_path,
+        "original_path": original_path,
+        "image_hash": content_hash,
+        "format": image_format,
+        "image_size": [work_h, work_w],
+        "original_size": [height, width],
+        "deduplicated": deduplicated
+    }
+
+
+def mask_target_size(upload: Dict, mask_resolution: str, tiled: bool = False) -> Optional[List[int]]:
+    """
+    返回掩码需要缩放到的尺寸
+
+    常规推理在工作图上进行，掩码即为工作图尺寸；切块推理在原图上进行，掩码为原图尺寸。
+
+    Args:
+        upload: store_upload 的返回值
+        mask_resolution: "working"（工作图尺寸）或 "original"（原图尺寸）
+        tiled: 掩码是否来自原图上的切块推理
+
+    Returns:
+        [h, w]；掩码已是所需尺寸时为 None
+    """
+    if mask_resolution == "original":
+        return None if tiled else upload["original_size"]
+    return upload["image_size"] if tiled else None
+
+
+def resize_masks(masks: Sequence[np.ndarray], size: Sequence[int]) -> List[np.ndarray]:
+    """
+    把掩码缩放到指定尺寸（如工作图掩码放大到原图尺寸，或原图掩码缩小到工作图尺寸）
+
+    Args:
+        masks: 掩码列表，每个为 (h, w)
+        size: 目标尺寸 [H, W]
+
+    Returns:
+        (H, W) bool 掩码列表
+    """
+    h, w = int(size[0]), int(size[1])
+    resized = []
+    for mask in masks:
+        mask = np.asarray(mask)
+        if mask.shape[:2] == (h, w):
+            resized.append(mask > 0)
+            continue
+        # 放大用线性插值、缩小用区域平均，再取半阈值，边缘比最近邻更平滑
+        shrink = h * w < mask.shape[0] * mask.shape[1]
+        scaled = cv2.resize(
+            (mask > 0).astype(np.uint8) * 255, (w, h),
+            interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR
+        )
+        resized.append(scaled > 127)
+    return resized
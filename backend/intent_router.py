@@ -0,0 +1,161 @@
+"""
+本地意图路由（快速路径）
+
+"确认分割"、"分割第1和第3个"、"分割banner" 这类意图明确的消息不需要大模型规划：
+直接解析为工具调用交给 handle_tool 执行，并用模板生成回复，整轮对话不访问 LLM。
+无法确定意图的消息（否定、闲聊、未知的中文物体名等）返回 None，仍交给 LLM 处理。
+"""
+
+import re
+import threading
+from typing import Dict, List, Optional
+
+# 常见中文物体名 -> GroundingDINO 使用的英文提示词；不在表中的中文物体名交给 LLM 翻译
+OBJECT_VOCABULARY = {
+    "人": "person", "行人": "person", "工人": "worker",
+    "猫": "cat", "狗": "dog", "鸟": "bird",
+    "车": "car", "汽车": "car", "车辆": "vehicle", "卡车": "truck", "自行车": "bicycle",
+    "塔吊": "tower crane", "起重机": "crane", "吊臂": "crane arm", "挖掘机": "excavator",
+    "楼房": "building", "建筑": "building", "房子": "house", "窗户": "window", "门": "door",
+    "横幅": "banner", "标牌": "sign", "路灯": "street light", "树": "tree",
+    "安全帽": "helmet", "杯子": "cup", "瓶子": "bottle", "椅子": "chair", "桌子": "table",
+}
+
+_CHINESE_NUMERALS = {"一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+# 一 ~ 九十九：带"十"的多字数词（十一、二十、三十五）优先于单字匹配
+_NUMBER = r"[0-9]+|[一二两三四五六七八九]?十[一二三四五六七八九]?|[一二两三四五六七八九]"
+
+# 否定、疑问等语气出现时不走快速路径
+_NEGATION = re.compile(r"不|别|取消|算了|为什么|怎么|吗|？|\?")
+# 应答词（好的、对、嗯、继续）单独出现时可能只是在回应别的话，不算确认：
+# 必须带确认词（确认、确定）或分割词（分割、全部分割），如"好的，分割"、"确认"
+_CONFIRM = re.compile(
+    r"^(好的?|是的?|对|可以|行|嗯|ok|okay|yes|y)?"
+    r"(?:(确认|确定)(开始|进行|执行)?(精确)?(分割|全部分割|都分割|分割全部)?"
+    r"|(开始|继续|进行|执行)?(精确)?(分割|全部分割|都分割|分割全部))吧?$",
+    re.IGNORECASE
+)
+_INDEX = re.compile(r"第?\s*(" + _NUMBER + r")\s*个?")
+_INDEX_COMMAND = re.compile(r"^(只)?(要|分割|选|保留)?\s*((第?\s*(" + _NUMBER + r")\s*个?)[\s,，、和与及]*)+(分割)?$")
+_VERBS = r"(检测|识别|找出|找到|标出|框出|分割出?|抠出|抠图)"
+_DIRECT = re.compile(r"^(直接|一次性|一步)")
+_FILLER = re.compile(r"^(请|帮我|麻烦|给我|我想|我要)+|(一下|吧|。|！|!)+$")
+_OBJECT_PREFIX = re.compile(r"^(图片|图像|照片|图)?(中|里)?的?")
+_SEPARATORS = re.compile(r"\s*(?:、|,|，|和|与|及|以及|还有|\band\b)\s*")
+
+
+def _parse_number(token: str) -> int:
+    """阿拉伯数字或一 ~ 九十九的中文数词（十一 -> 11，二十 -> 20）"""
+    if token.isdigit():
+        return int(token)
+    if "十" not in token:
+        return _CHINESE_NUMERALS[token]
+    tens, _, ones = token.partition("十")
+    return (_CHINESE_NUMERALS[tens] if tens else 1) * 10 + (_CHINESE_NUMERALS[ones] if ones else 0)
+
+
+def _translate(name: str) -> Optional[str]:
+    """物体名转为英文提示词：英文原样保留，中文查表，无法翻译时返回 None"""
+    name = name.strip().strip("\"'“”‘’")
+    if not name:
+        return None
+    if re.fullmatch(r"[A-Za-z][A-Za-z0-9 \-_]*", name):
+        return name.lower()
+    return OBJECT_VOCABULARY.get(name)
+
+
+class IntentRouter:
+    """识别确认 / 序号选择 / 分割指令，返回可直接执行的工具调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"routed": 0, "fallback": 0}
+
+    def route(self, message: str, detection: Optional[dict] = None) -> Optional[Dict]:
+        """
+        解析用户消息
+
+        Args:
+            message: 用户消息
+            detection: 会话中最近一次检测结果（make_detection 的输出），没有时为 None
+
+        Returns:
+            {"tool": 工具名, "inputs": 工具参数}（不含 image_path），无法确定意图时为 None
+        """
+        intent = self._parse(message, detection)
+        with self._lock:
+            self._stats["routed" if intent else "fallback"] += 1
+        return intent
+
+    def _parse(self, message: str, detection: Optional[dict]) -> Optional[Dict]:
+        text = _FILLER.sub("", message.strip())
+        if not text or _NEGATION.search(text):
+            return None
+        compact = re.sub(r"[\s,，。.!！~]+", "", text)
+        spaceless = re.sub(r"\s+", "", text)
+
+        num_detected = len(detection["phrases"]) if detection is not None else 0
+
+        # 1. 确认：对已有检测结果全部分割（只有标点 / 表情的消息去掉符号后为空，不算确认）
+        if num_detected and compact and _CONFIRM.fullmatch(compact):
+            return {"tool": "segment_with_sam", "inputs": {}}
+
+        # 2. 序号选择：分割第1和第3个
+        if num_detected and _INDEX_COMMAND.fullmatch(spaceless):
+            indices = sorted({_parse_number(m.group(1)) - 1 for m in _INDEX.finditer(spaceless)})
+            if indices and all(0 <= i < num_detected for i in indices):
+                return {"tool": "segment_with_sam", "inputs": {"object_indices": indices}}
+            return None
+
+        # 3. 分割 / 检测指令：分割banner、检测塔吊和楼房
+        match = re.fullmatch(r"(直接|一次性|一步)?" + _VERBS + r"(.+)", text)
+        if not match:
+            return None
+        names = _SEPARATORS.split(_OBJECT_PREFIX.sub("", match.group(3).strip()))
+        prompts: List[str] = []
+        for name in names:
+            prompt = _translate(name)
+            if prompt is None:
+                return None
+            if prompt not in prompts:
+                prompts.append(prompt)
+        if not prompts:
+            return None
+
+        if _DIRECT.match(text):
+            if len(prompts) > 1:
+                return None
+            return {"tool": "segment_object_with_sam", "inputs": {"object_prompt": prompts[0]}}
+        if len(prompts) > 1:
+            return {"tool": "detect_multiple_objects", "inputs": {"object_prompts": prompts}}
+        return {"tool": "detect_objects", "inputs": {"object_prompt": prompts[0]}}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+def describe_result(result: dict) -> str:
+    """
+    根据工具结果生成回复（代替 LLM 的总结）
+
+    Args:
+        result: handle_tool 的返回值
+
+    Returns:
+        回复文本
+    """
+    if "error" in result:
+        return f"处理失败：{result['error']}"
+
+    detected = result.get("detected", [])
+    if not detected:
+        return result.get("message") or "未检测到目标，可以换一种描述再试试。"
+
+    listing = "、".join(f"{i + 1}. {phrase}" for i, phrase in enumerate(detected))
+    if result.get("method") == "detection_only":
+        return (
+            f"检测到 {len(detected)} 个目标：{listing}。"
+            f"回复“确认分割”对全部目标进行精确分割，或指定序号（如“分割第1和第3个”）。"
+        )
+    return f"已完成 {len(detected)} 个目标的精确分割：{listing}。"
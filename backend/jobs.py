@@ -0,0 +1,195 @@
+"""
+异步任务队列
+
+聊天请求（LLM 规划 + 模型推理）提交为任务，由有界工作线程池执行。
+客户端可轮询任务状态，或通过 Server-Sent Events 订阅各阶段进度。
+队列已满时拒绝新任务（背压），避免慢请求占满服务线程。
+"""
+
+import time
+import uuid
+import queue
+import threading
+from typing import Callable, Dict, Iterator, Optional
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    """任务队列已满"""
+
+
+class Job:
+    """单个异步任务及其进度事件"""
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict):
+        self.id = str(uuid.uuid4())
+        self.status = QUEUED
+        self.stage = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = []  # [{"seq", "stage", "data", "time"}]
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._cond = threading.Condition()
+
+    def emit(self, stage: str, **data):
+        """记录进度事件并唤醒订阅者"""
+        with self._cond:
+            self._append_event(stage, data)
+
+    def _append_event(self, stage: str, data: dict):
+        # 调用方需持有 self._cond
+        self.stage = stage
+        self.events.append({
+            "seq": len(self.events),
+            "stage": stage,
+            "data": data,
+            "time": time.time()
+        })
+        self._cond.notify_all()
+
+    def _run(self):
+        with self._cond:
+            self.status = RUNNING
+        try:
+            result = self._fn(self, *self._args, **self._kwargs)
+        except Exception as e:
+            # 状态变更与终止事件在同一临界区内完成，订阅者不会错过最后一个事件
+            with self._cond:
+                self.status = FAILED
+                self.error = str(e)
+                self.finished_at = time.time()
+                self._append_event(FAILED, {"error": str(e)})
+        else:
+            with self._cond:
+                self.status = SUCCEEDED
+                self.result = result
+                self.finished_at = time.time()
+                self._append_event("done", {})
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """阻塞等待任务结束，返回是否已结束"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.finished, timeout=timeout)
+
+    def iter_events(self, after: int = 0, heartbeat: float = 15.0) -> Iterator[Optional[dict]]:
+        """
+        依次产出 seq >= after 的事件，直到任务结束
+
+        超过 heartbeat 秒没有新事件时产出 None，供 SSE 发送保活注释。
+        """
+        index = after
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: len(self.events) > index or self.finished,
+                    timeout=heartbeat
+                )
+                pending = self.events[index:]
+                finished = self.finished
+            if not pending and not finished:
+                yield None
+                continue
+            for event in pending:
+                yield event
+            index += len(pending)
+            if finished and index >= len(self.events):
+                return
+
+    def to_dict(self) -> dict:
+        """任务状态快照（用于轮询接口）"""
+        with self._cond:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "stage": self.stage,
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at
+            }
+
+
+class JobManager:
+    """有界工作线程池 + 有界等待队列"""
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, retention_seconds: float = 600):
+        """
+        Args:
+            max_workers: 同时执行的任务数
+            max_pending: 排队等待的最大任务数，超出时 submit 抛出 JobQueueFull
+            retention_seconds: 已结束任务保留多久（秒）以供查询
+        """
+        self.retention_seconds = retention_seconds
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job._run()
+            finally:
+                self._queue.task_done()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Job:
+        """
+        提交任务，fn 的第一个参数为 Job（用于 job.emit 上报进度）
+
+        Raises:
+            JobQueueFull: 等待队列已满
+        """
+        self._prune()
+        job = Job(fn, args, kwargs)
+        job.emit(QUEUED, position=self._queue.qsize())
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise JobQueueFull("任务队列已满")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        """清理超过保留期的已结束任务"""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.finished and job.finished_at and job.finished_at < cutoff:
+                    del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize(),
+            "max_pending": self._queue.maxsize,
+            "running": sum(1 for job in jobs if job.status == RUNNING),
+            "tracked": len(jobs)
+        }
@@ -0,0 +1,100 @@
+"""
+流式 LLM 补全
+
+以 stream=True 调用 chat.completions：文本增量通过 on_text 实时转发（SSE 推送给客户端），
+工具调用的参数按增量拼接，参数 JSON 一旦完整就通过 on_tool_call 立即派发，
+不必等待整个补全结束。首个反馈的延迟约等于 LLM 的首 token 延迟。
+"""
+
+import json
+from typing import Callable, Dict, List, Optional
+
+
+class _PendingToolCall:
+    """正在拼接中的工具调用"""
+
+    def __init__(self):
+        self.id = ""
+        self.name = ""
+        self.arguments = ""
+        self.dispatched = False
+
+    def parsed_arguments(self) -> Optional[dict]:
+        """参数 JSON 已完整时返回解析结果，否则为 None"""
+        if not self.name or not self.arguments.rstrip().endswith("}"):
+            return None
+        try:
+            arguments = json.loads(self.arguments)
+        except ValueError:
+            return None
+        return arguments if isinstance(arguments, dict) else None
+
+    def to_message(self) -> dict:
+        return {
+            "id": self.id,
+            "type": "function",
+            "function": {"name": self.name, "arguments": self.arguments}
+        }
+
+
+def stream_completion(
+    client,
+    on_text: Callable[[str], None],
+    on_tool_call: Callable[[str, str, Optional[dict]], None],
+    **kwargs
+) -> Dict:
+    """
+    执行一次流式补全
+
+    Args:
+        client: OpenAI 兼容客户端
+        on_text: on_text(delta)，收到文本增量时调用
+        on_tool_call: on_tool_call(tool_call_id, name, arguments)，参数完整时按工具调用的顺序调用；
+                      流结束时参数仍无法解析的调用以 arguments=None 派发
+        **kwargs: 透传给 chat.completions.create 的参数（model / messages / tools 等）
+
+    Returns:
+        可直接追加到消息历史的 assistant 消息 dict（含 tool_calls 时带 tool_calls 字段）
+    """
+    calls: List[_PendingToolCall] = []
+    content = []
+
+    def dispatch_ready(final: bool = False):
+        # 按顺序派发：前一个调用未派发时后面的不派发，保证工具执行顺序与 LLM 输出一致
+        for call in calls:
+            if call.dispatched:
+                continue
+            arguments = call.parsed_arguments()
+            if arguments is None and not final:
+                return
+            call.dispatched = True
+            on_tool_call(call.id, call.name, arguments)
+
+    stream = client.chat.completions.create(stream=True, **kwargs)
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+
+        if delta.content:
+            content.append(delta.content)
+            on_text(delta.content)
+
+        for tool_delta in delta.tool_calls or []:
+            while len(calls) <= tool_delta.index:
+                calls.append(_PendingToolCall())
+            call = calls[tool_delta.index]
+            if tool_delta.id:
+                call.id = tool_delta.id
+            if tool_delta.function is not None:
+                call.name += tool_delta.function.name or ""
+                call.arguments += tool_delta.function.arguments or ""
+        if delta.tool_calls:
+            dispatch_ready()
+
+    dispatch_ready(final=True)
+
+    message = {"role": "assistant", "content": "".join(content)}
+    if calls:
+        message["tool_calls"] = [call.to_message() for call in calls]
+    return message
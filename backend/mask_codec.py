@@ -0,0 +1,157 @@
+"""
+掩码编码
+
+把 SAM 输出的二值掩码编码为紧凑的 JSON 友好格式，供 API 客户端自行渲染：
+
+- rle: COCO 压缩 RLE（{"size": [h, w], "counts": "..."}），与 pycocotools.mask.decode 兼容
+- polygon: 外轮廓多边形（经 approxPolyDP 简化），每个多边形为 [x1, y1, x2, y2, ...]
+"""
+
+from typing import Dict, List, Sequence
+
+import cv2
+import numpy as np
+
+MASK_FORMATS = ("rle", "polygon")
+
+
+def rle_counts(mask: np.ndarray) -> List[int]:
+    """
+    计算按列优先展开的游程长度（COCO 约定：第一个游程为 0 值，可以为 0）
+
+    Args:
+        mask: (H, W) 二值掩码
+
+    Returns:
+        游程长度列表
+    """
+    flat = np.asarray(mask, dtype=bool).ravel(order="F")
+    if flat.size == 0:
+        return []
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], changes, [flat.size]))).tolist()
+    if flat[0]:
+        counts.insert(0, 0)
+    return counts
+
+
+def _counts_to_string(counts: Sequence[int]) -> str:
+    # 与 pycocotools rleToString 相同：与前前个游程做差分后按 5 位分组、可变长编码
+    chars = []
+    for i, x in enumerate(counts):
+        if i > 2:
+            x -= counts[i - 2]
+        more = True
+        while more:
+            c = x & 0x1f
+            x >>= 5
+            more = x != -1 if c & 0x10 else x != 0
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return "".join(chars)
+
+
+def _string_to_counts(s: str) -> List[int]:
+    counts = []
+    p = 0
+    while p < len(s):
+        x, k, more = 0, 0, True
+        while more:
+            c = ord(s[p]) - 48
+            x |= (c & 0x1f) << (5 * k)
+            more = bool(c & 0x20)
+            p += 1
+            k += 1
+            if not more and c & 0x10:
+                x |= -1 << (5 * k)
+        if len(counts) > 2:
+            x += counts[-2]
+        counts.append(x)
+    return counts
+
+
+def encode_rle(mask: np.ndarray) -> Dict:
+    """
+    编码为 COCO 压缩 RLE
+
+    Args:
+        mask: (H, W) 二值掩码
+
+    Returns:
+        {"size": [h, w], "counts": str}
+    """
+    h, w = mask.shape[:2]
+    return {"size": [int(h), int(w)], "counts": _counts_to_string(rle_counts(mask))}
+
+
+def decode_rle(rle: Dict) -> np.ndarray:
+    """
+    解码 COCO 压缩 RLE
+
+    Args:
+        rle: {"size": [h, w], "counts": str}
+
+    Returns:
+        (H, W) bool 掩码
+    """
+    h, w = rle["size"]
+    counts = _string_to_counts(rle["counts"])
+    values = np.zeros(len(counts), dtype=bool)
+    values[1::2] = True
+    flat = np.repeat(values, counts)
+    return flat.reshape((w, h)).T
+
+
+def encode_polygons(mask: np.ndarray, tolerance: float = 1.0, min_area: float = 4.0) -> List[List[int]]:
+    """
+    提取外轮廓并简化为多边形
+
+    Args:
+        mask: (H, W) 二值掩码
+        tolerance: approxPolyDP 的最大偏差（像素），越大点数越少
+        min_area: 面积小于该值的碎片轮廓被丢弃
+
+    Returns:
+        多边形列表，每个为 [x1, y1, x2, y2, ...]（像素坐标）
+    """
+    mask = np.asarray(mask)
+    rows = np.flatnonzero(mask.any(axis=1))
+    if len(rows) == 0:
+        return []
+    cols = np.flatnonzero(mask.any(axis=0))
+    y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+    # 只在外接框内提取轮廓
+    contours, _ = cv2.findContours(
+        (mask[y0:y1, x0:x1] > 0).astype(np.uint8),
+        cv2.RETR_EXTERNAL,
+        cv2.CHAIN_APPROX_SIMPLE,
+        offset=(int(x0), int(y0))
+    )
+    polygons = []
+    for contour in contours:
+        if cv2.contourArea(contour) < min_area:
+            continue
+        approx = cv2.approxPolyDP(contour, tolerance, True) if tolerance > 0 else contour
+        if len(approx) >= 3:
+            polygons.append(approx.reshape(-1).astype(int).tolist())
+    return polygons
+
+
+def encode_masks(masks: Sequence[np.ndarray], mask_format: str) -> List:
+    """
+    按指定格式批量编码掩码
+
+    Args:
+        masks: 掩码列表
+        mask_format: "rle" 或 "polygon"
+
+    Returns:
+        与 masks 一一对应的编码结果
+    """
+    if mask_format == "rle":
+        return [encode_rle(mask) for mask in masks]
+    if mask_format == "polygon":
+        return [encode_polygons(mask) for mask in masks]
+    raise ValueError(f"不支持的掩码格式: {mask_format}，可选 {MASK_FORMATS}")
@@ -0,0 +1,119 @@
+"""
+模型注册表
+
+进程内共享的 GroundingDINO / SAM 单例（tokenizer 即 GroundingDINO 模型自带的实例）。
+所有推理路径（两步式检测、SAM 分割、一次性分割）都从这里取模型，
+保证每个权重文件在内存中只有一份，并记录加载耗时。
+"""
+
+import os
+import time
+import threading
+from typing import Dict, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEIGHTS_FOLDER = os.path.join(ROOT_DIR, "weights")
+
+DEFAULT_GROUNDINGDINO_CONFIG = os.path.join(WEIGHTS_FOLDER, "GroundingDINO_SwinT_OGC.py")
+DEFAULT_GROUNDINGDINO_CHECKPOINT = os.path.join(WEIGHTS_FOLDER, "groundingdino_swint_ogc.pth")
+DEFAULT_SAM_CHECKPOINT = os.path.join(WEIGHTS_FOLDER, "sam_vit_b_01ec64.pth")
+
+# {(模型类型, 权重路径..., 设备, 精度): 模型实例}
+_models = {}
+# {模型名称: 加载耗时（秒）}
+_load_times = {}
+_lock = threading.RLock()
+
+
+def default_device() -> str:
+    """自动选择推理设备"""
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def get_groundingdino(
+    config: str = DEFAULT_GROUNDINGDINO_CONFIG,
+    checkpoint: str = DEFAULT_GROUNDINGDINO_CHECKPOINT,
+    device: Optional[str] = None,
+    precision: str = "fp32"
+):
+    """
+    获取 GroundingDINO 模型（首次调用时加载）
+
+    Args:
+        config: GroundingDINO 配置文件路径
+        checkpoint: GroundingDINO 权重文件路径
+        device: 设备 ('cuda', 'cpu' 或 None 自动检测)
+        precision: 精度模式（见 backend.precision），int8 时加载后原地做动态量化
+
+    Returns:
+        已加载到 device 上的 GroundingDINO 模型（eval 模式）
+    """
+    device = device or default_device()
+    key = ("groundingdino", os.path.abspath(config), os.path.abspath(checkpoint), device, precision)
+
+    with _lock:
+        if key not in _models:
+            from groundingdino.util.inference import load_model
+
+            start = time.perf_counter()
+            model = load_model(config, checkpoint, device=device)
+            model.to(device)
+            model.eval()
+            if precision == "int8":
+                from backend.precision import quantize_groundingdino
+                quantize_groundingdino(model)
+            _load_times["groundingdino"] = time.perf_counter() - start
+            print(f"GroundingDINO loaded in {_load_times['groundingdino']:.2f}s")
+            _models[key] = model
+        return _models[key]
+
+
+def get_sam(
+    checkpoint: str = DEFAULT_SAM_CHECKPOINT,
+    model_type: str = "vit_b",
+    device: Optional[str] = None,
+    precision: str = "fp32"
+):
+    """
+    获取 SAM 模型（首次调用时加载）
+
+    注意：返回的是无状态的 Sam 模型本身，SamPredictor 持有 set_image 状态，
+    由调用方各自创建。
+
+    Args:
+        checkpoint: SAM 权重文件路径
+        model_type: SAM 模型类型，如 'vit_b'
+        device: 设备 ('cuda', 'cpu' 或 None 自动检测)
+        precision: 精度模式（见 backend.precision），int8 时加载后原地量化图像编码器
+    """
+    device = device or default_device()
+    key = ("sam", model_type, os.path.abspath(checkpoint), device, precision)
+
+    with _lock:
+        if key not in _models:
+            from segment_anything import sam_model_registry
+
+            start = time.perf_counter()
+            sam = sam_model_registry[model_type](checkpoint=checkpoint)
+            sam.to(device=device)
+            sam.eval()
+            if precision == "int8":
+                from backend.precision import quantize_sam
+                quantize_sam(sam)
+            _load_times["sam"] = time.perf_counter() - start
+            print(f"SAM ({model_type}) loaded in {_load_times['sam']:.2f}s")
+            _models[key] = sam
+        return _models[key]
+
+
+def load_times() -> Dict[str, float]:
+    """返回已加载模型的加载耗时（秒）"""
+    with _lock:
+        return dict(_load_times)
+
+
+def is_loaded() -> bool:
+    """是否已有模型加载完成"""
+    with _lock:
+        return bool(_models)
@@ -0,0 +1,176 @@
+"""
+推理精度模式
+
+CPU 部署时可选择降低精度换取速度与内存：
+
+- fp32: 默认，与原始权重一致
+- int8: 动态量化（torch.ao.quantization.quantize_dynamic），把 SAM ViT-B 图像编码器与
+        GroundingDINO 的 Swin 骨干 / BERT / Transformer 中的 nn.Linear 换成 int8 权重，
+        激活在运行时按批量化；仅支持 CPU
+- bf16: 在 bfloat16 autocast 下运行 GroundingDINO 与 SAM 图像编码器，权重保持 fp32；
+        需要 CPU 支持 AVX512-BF16 / AMX（或 CUDA）
+
+SAM 掩码解码器始终以 fp32 运行（计算量很小，且直接决定掩码边缘）。
+各模式相对 fp32 的精度、速度与内存对比见 scripts/benchmark_precision.py。
+"""
+
+import io
+import contextlib
+from typing import Dict, Sequence
+
+import numpy as np
+
+PRECISIONS = ("fp32", "int8", "bf16")
+
+# 动态量化的 GroundingDINO 子模块（输入投影、检测头等小模块保持 fp32）
+GROUNDINGDINO_QUANTIZED_MODULES = ("backbone", "bert", "transformer")
+
+
+def bf16_supported(device: str) -> bool:
+    """设备是否支持 bfloat16 计算（CPU 需要原生 bf16 指令，否则 autocast 反而更慢）"""
+    import torch
+
+    if device.startswith("cuda"):
+        return torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def resolve_precision(precision: str, device: str) -> str:
+    """
+    校验精度模式，当前设备不支持时回退到 fp32
+
+    Args:
+        precision: fp32 / int8 / bf16
+        device: 推理设备
+
+    Returns:
+        实际使用的精度模式
+
+    Raises:
+        ValueError: 未知的精度模式
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"未知的精度模式: {precision}（可选 {', '.join(PRECISIONS)}）")
+    if precision == "int8" and not device.startswith("cpu"):
+        print(f"int8 动态量化仅支持 CPU，{device} 上使用 fp32")
+        return "fp32"
+    if precision == "bf16" and not bf16_supported(device):
+        print(f"{device} 不支持 bfloat16，使用 fp32")
+        return "fp32"
+    return precision
+
+
+def quantize_linear(module):
+    """把模块中的 nn.Linear 原地替换为 int8 动态量化版本"""
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def quantize_groundingdino(model):
+    """对 GroundingDINO 的骨干、文本编码器与 Transformer 做 int8 动态量化（原地修改）"""
+    for name in GROUNDINGDINO_QUANTIZED_MODULES:
+        submodule = getattr(model, name, None)
+        if submodule is not None:
+            quantize_linear(submodule)
+    return model
+
+
+def quantize_sam(sam):
+    """对 SAM 图像编码器做 int8 动态量化（原地修改），提示编码器与掩码解码器保持 fp32"""
+    quantize_linear(sam.image_encoder)
+    return sam
+
+
+def autocast(precision: str, device: str):
+    """
+    返回模型前向使用的上下文：bf16 时为 bfloat16 autocast，其余模式为空上下文
+
+    Args:
+        precision: resolve_precision 的返回值
+        device: 推理设备
+    """
+    import torch
+
+    if precision != "bf16":
+        return contextlib.nullcontext()
+    return torch.autocast(device_type="cuda" if device.startswith("cuda") else "cpu", dtype=torch.bfloat16)
+
+
+def serialized_nbytes(module) -> int:
+    """模块 state_dict 序列化后的字节数（包含量化层打包后的权重，近似权重内存占用）"""
+    import torch
+
+    buffer = io.BytesIO()
+    torch.save(module.state_dict(), buffer)
+    return buffer.tell()
+
+
+def mask_iou(reference: np.ndarray, candidate: np.ndarray) -> float:
+    """两个掩码的 IoU，两者都为空时为 1.0"""
+    reference, candidate = np.asarray(reference) > 0, np.asarray(candidate) > 0
+    union = np.logical_or(reference, candidate).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(reference, candidate).sum() / union)
+
+
+def box_agreement(
+    reference: np.ndarray,
+    candidate: np.ndarray,
+    iou_threshold: float = 0.5
+) -> Dict[str, float]:
+    """
+    比较两组检测框（像素坐标 [x1, y1, x2, y2]）
+
+    每个参考框与尚未匹配、IoU 最高的候选框贪心配对。
+
+    Args:
+        reference: (N, 4) fp32 模式的检测框
+        candidate: (M, 4) 待评估模式的检测框
+        iou_threshold: IoU 达到该值视为同一目标
+
+    Returns:
+        {"recall": 参考框被匹配的比例, "precision": 候选框被匹配的比例,
+         "mean_iou": 匹配框的平均 IoU}；两组都为空时均为 1.0
+    """
+    reference = np.asarray(reference, dtype=np.float32).reshape(-1, 4)
+    candidate = np.asarray(candidate, dtype=np.float32).reshape(-1, 4)
+    if len(reference) == 0 and len(candidate) == 0:
+        return {"recall": 1.0, "precision": 1.0, "mean_iou": 1.0}
+    if len(reference) == 0 or len(candidate) == 0:
+        return {"recall": 0.0, "precision": 0.0, "mean_iou": 0.0}
+
+    def area(boxes):
+        return np.clip(boxes[:, 2:] - boxes[:, :2], 0, None).prod(axis=1)
+
+    lt = np.maximum(reference[:, None, :2], candidate[None, :, :2])
+    rb = np.minimum(reference[:, None, 2:], candidate[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    ious = inter / np.maximum(area(reference)[:, None] + area(candidate)[None, :] - inter, 1e-6)
+
+    matched = []
+    used = set()
+    for i in np.argsort(-ious.max(axis=1)):
+        for j in np.argsort(-ious[i]):
+            if ious[i, j] < iou_threshold:
+                break
+            if j not in used:
+                used.add(j)
+                matched.append(float(ious[i, j]))
+                break
+    return {
+        "recall": len(matched) / len(reference),
+        "precision": len(matched) / len(candidate),
+        "mean_iou": float(np.mean(matched)) if matched else 0.0
+    }
+
+
+def mean_mask_iou(reference: Sequence[np.ndarray], candidate: Sequence[np.ndarray]) -> float:
+    """按顺序配对的掩码平均 IoU（用于同一组框分别在两种精度下分割的结果）"""
+    if len(reference) == 0:
+        return 1.0
+    return float(np.mean([mask_iou(r, c) for r, c in zip(reference, candidate)]))
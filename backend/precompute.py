@@ -0,0 +1,138 @@
+"""
+图像特征预计算
+
+会话创建（上传图片）时，在后台线程池中提前计算 GroundingDINO 图像骨干特征
+（检测阶段先用到）和 SAM 图像嵌入，写入 GroundedSAM 的缓存。
+用户确认分割时嵌入通常已经就绪，SAM 阶段只剩掩码解码器的开销。
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, Optional, Set
+
+# 预计算阶段，按顺序执行
+STAGES = ("dino", "sam")
+
+
+class EmbeddingPrecomputer:
+    """后台图像特征预计算器（推测执行）"""
+
+    def __init__(self, run_stage: Callable[[str, str, str], None], max_workers: int = 1):
+        """
+        Args:
+            run_stage: run_stage(stage, image_path, image_hash)，计算指定阶段并写入对应缓存；
+                       单进程时直接调用 GroundedSAM.precompute，多进程时转发到负责该图像的工作进程
+            max_workers: 后台工作线程数
+        """
+        self._run_stage = run_stage
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="precompute")
+        self._lock = threading.Lock()
+        self._futures: Dict[str, Dict[str, Future]] = {}  # {image_hash: {stage: Future}}
+        self._completed: Set[str] = set()                # SAM 嵌入已预计算完成的 image_hash
+        self._sessions: Dict[str, str] = {}              # {session_id: image_hash}
+        self._used: Set[str] = set()                     # 已进行过分割的 session_id
+        self._stats = {
+            "scheduled": 0,   # 提交的预计算任务数
+            "completed": 0,   # 成功完成的任务数
+            "failed": 0,      # 失败的任务数
+            "hits": 0,        # 分割时嵌入已就绪
+            "waited": 0,      # 分割时预计算仍在进行，等待其完成
+            "misses": 0,      # 分割时没有对应的预计算任务
+            "wasted": 0       # 会话结束时仍未被使用的预计算
+        }
+
+    def schedule(self, session_id: str, image_path: str, image_hash: str):
+        """
+        为会话的上传图片调度预计算（相同图片同时只计算一次）
+
+        Args:
+            session_id: 会话ID
+            image_path: 图片路径
+            image_hash: 图片内容哈希（即缓存键）
+        """
+        with self._lock:
+            self._sessions[session_id] = image_hash
+            if image_hash in self._futures:
+                return
+            futures = {stage: Future() for stage in STAGES}
+            self._futures[image_hash] = futures
+            self._executor.submit(self._run, image_path, image_hash, futures)
+            self._stats["scheduled"] += 1
+
+    def _run(self, image_path: str, image_hash: str, futures: Dict[str, Future]):
+        """后台任务：先算骨干特征，再算 SAM 嵌入"""
+        stat = "completed"
+        for stage in STAGES:
+            try:
+                self._run_stage(stage, image_path, image_hash)
+                futures[stage].set_result(None)
+            except Exception as e:
+                # 骨干特征失败不影响 SAM 嵌入的预计算
+                print(f"Precompute stage '{stage}' failed for {image_path}: {e}")
+                futures[stage].set_exception(e)
+                stat = "failed"
+        with self._lock:
+            self._stats[stat] += 1
+            self._futures.pop(image_hash, None)
+            if futures["sam"].exception() is None:
+                self._completed.add(image_hash)
+
+    def wait_features(self, image_hash: Optional[str], timeout: Optional[float] = None):
+        """检测前调用：若骨干特征正在后台计算，等待其完成，避免重复计算"""
+        if not image_hash:
+            return
+        with self._lock:
+            future = self._futures.get(image_hash, {}).get("dino")
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+
+    def wait(self, session_id: str, image_hash: Optional[str], timeout: Optional[float] = None):
+        """
+        分割前调用：等待该图片的 SAM 嵌入预计算完成并记录命中情况
+
+        预计算失败或超时不会抛出异常，调用方会回退为同步计算嵌入。
+        """
+        if not image_hash:
+            return
+
+        with self._lock:
+            future = self._futures.get(image_hash, {}).get("sam")
+            completed = image_hash in self._completed
+            # 同一会话的后续分割轮次不重复计入命中率
+            first_use = session_id not in self._used
+            self._used.add(session_id)
+
+        if future is not None:
+            stat = "waited"
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                stat = "misses"
+        else:
+            stat = "hits" if completed else "misses"
+
+        if first_use:
+            with self._lock:
+                self._stats[stat] += 1
+
+    def discard(self, session_id: str):
+        """会话删除时调用：统计未被使用的预计算"""
+        with self._lock:
+            image_hash = self._sessions.pop(session_id, None)
+            if image_hash is not None and session_id not in self._used:
+                self._stats["wasted"] += 1
+            self._used.discard(session_id)
+            if image_hash is not None and image_hash not in self._sessions.values():
+                self._completed.discard(image_hash)
+
+    def stats(self) -> dict:
+        """返回预计算统计（含命中率）"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._futures)
+        used = stats["hits"] + stats["waited"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["waited"]) / used if used else None
+        return stats
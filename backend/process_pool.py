@@ -0,0 +1,283 @@
+"""
+多进程推理池（pre-fork）
+
+纯 CPU 部署时，单进程推理只能用到一组 PyTorch 计算线程，吞吐随核数增长有限。
+本模块在父进程加载好模型之后 fork 出多个工作进程：
+
+- 权重先通过 share_memory() 移入共享内存，fork 后所有进程映射同一份物理页，
+  常驻内存不随进程数线性增长（Python 对象头的引用计数写入只会复制少量页）
+- 每个工作进程内部仍是一个 InferenceWorker，保留请求合并，并把
+  torch.set_num_threads 设为 CPU 核数 / 进程数，避免进程间互相抢核
+- 父进程按图像内容哈希把请求路由到固定进程（会话亲和），该图像的解码结果、DINO 骨干特征、
+  SAM 嵌入和上传时的预计算都留在同一进程的缓存里；没有哈希的请求轮询分配
+- 请求只传图像路径与内容哈希，由工作进程从自己的解码缓存读取，像素数据不跨进程传输
+
+接口与 InferenceWorker 一致（submit / call / detect / segment / stats），
+server.py 可以无差别地替换使用。
+
+注意：必须在父进程执行任何前向推理、启动任何后台线程之前 fork（OpenMP 线程池在 fork 后不可用，
+其他线程持有的锁会以加锁状态复制到子进程），且只支持 CPU（CUDA 上下文不能跨 fork 使用）。
+"""
+
+import os
+import zlib
+import pickle
+import itertools
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 请求：(req_id, method, args, kwargs)；响应：(req_id, ok, result 或错误信息)
+
+
+def _send(conn, lock: threading.Lock, message):
+    # 用标准 pickle 序列化，张量按值拷贝，不依赖 torch 的共享内存句柄传递
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    with lock:
+        conn.send_bytes(data)
+
+
+def _recv(conn):
+    return pickle.loads(conn.recv_bytes())
+
+
+def _worker_main(conn, inherited, model, num_threads: int, window_ms: float, max_batch: int, compile_engine: bool):
+    """工作进程主循环：接收请求，交给进程内的推理线程执行，完成后回传结果"""
+    import torch
+    from backend.inference_worker import InferenceWorker
+
+    # 关闭 fork 继承来的父进程端连接，父进程退出时 recv 才能收到 EOF
+    for other in inherited:
+        other.close()
+
+    torch.set_num_threads(num_threads)
+
+    # 导出 / 加载推理图需要运行前向，只能在 fork 之后的工作进程中进行；
+    # 导出结果写入共享的缓存目录（临时文件 + 改名），先完成的进程导出、其余进程直接加载
+    if compile_engine and model.engine is not None:
+        model.engine.compile_all()
+
+    worker = InferenceWorker(lambda: model, window_ms=window_ms, max_batch=max_batch)
+    handlers = {
+        "detect": worker.detect,
+        "segment": worker.segment,
+        # 预计算只调用无状态编码器，不经过推理线程，与在线请求并发
+        "precompute": model.precompute,
+        "stats": lambda: {
+            "caches": {
+                "sam_embedding": model.embedding_cache.stats(),
+                "dino_backbone": model.dino_feature_cache.stats(),
+                "text_encoder": model.text_cache.stats(),
+                "decoded_image": model.decoded_image_cache.stats(),
+                "detection": model.detection_cache.stats()
+            },
+            "inference": worker.stats(),
+            "engine": model.engine.stats() if model.engine else None
+        }
+    }
+    # 阻塞等待结果的调用放在线程里，同批到达的请求才能在推理线程中合并
+    executor = ThreadPoolExecutor(max_workers=max(4, max_batch * 2), thread_name_prefix="pool-request")
+    send_lock = threading.Lock()
+
+    def handle(req_id, method, args, kwargs):
+        try:
+            handler = handlers.get(method)
+            if handler is not None:
+                result = handler(*args, **kwargs)
+            else:
+                result = worker.call(method, *args, **kwargs)
+            message = (req_id, True, result)
+        except Exception as e:
+            message = (req_id, False, f"{type(e).__name__}: {e}")
+        try:
+            _send(conn, send_lock, message)
+        except Exception as e:
+            # 结果无法序列化时至少让调用方拿到错误
+            _send(conn, send_lock, (req_id, False, f"结果回传失败: {e}"))
+
+    while True:
+        try:
+            req_id, method, args, kwargs = _recv(conn)
+        except (EOFError, OSError):
+            break
+        executor.submit(handle, req_id, method, args, kwargs)
+    os._exit(0)
+
+
+class _WorkerHandle:
+    """父进程侧的单个工作进程：连接、待完成请求与结果读取线程"""
+
+    def __init__(self, index: int, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.pending: Dict[int, Future] = {}
+        self.pending_lock = threading.Lock()
+        self.requests = 0
+        self.alive = True
+        self.reader = threading.Thread(target=self._read_loop, name=f"pool-reader-{index}", daemon=True)
+
+    def _read_loop(self):
+        while True:
+            try:
+                req_id, ok, result = _recv(self.conn)
+            except (EOFError, OSError):
+                break
+            with self.pending_lock:
+                future = self.pending.pop(req_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(result))
+
+        # 进程退出：让所有等待中的请求失败，而不是永久阻塞
+        self.alive = False
+        with self.pending_lock:
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError(f"推理进程 {self.process.pid} 已退出"))
+
+    def send(self, req_id: int, method: str, args: tuple, kwargs: dict) -> Future:
+        future = Future()
+        with self.pending_lock:
+            if not self.alive:
+                raise RuntimeError(f"推理进程 {self.process.pid} 已退出")
+            self.pending[req_id] = future
+            self.requests += 1
+        try:
+            _send(self.conn, self.send_lock, (req_id, method, args, kwargs))
+        except Exception as e:
+            with self.pending_lock:
+                self.pending.pop(req_id, None)
+            future.set_exception(e)
+        return future
+
+
+class ProcessPool:
+    """pre-fork 推理进程池，按图像哈希做会话亲和路由"""
+
+    def __init__(
+        self,
+        model,
+        num_workers: int,
+        threads_per_worker: Optional[int] = None,
+        window_ms: float = 10,
+        max_batch: int = 8,
+        compile_engine: bool = False
+    ):
+        """
+        Args:
+            model: 已加载的 GroundedSAM 实例（在父进程中加载，fork 后共享权重）
+            num_workers: 工作进程数
+            threads_per_worker: 每个进程的 PyTorch 计算线程数，None 时为 CPU 核数 / 进程数
+            window_ms / max_batch: 进程内推理线程的请求合并参数，同 InferenceWorker
+            compile_engine: 各工作进程启动后预先导出 / 加载全部尺寸桶的推理图（model.engine 不为 None 时）
+        """
+        if str(model.device).startswith("cuda"):
+            raise ValueError("多进程推理池只支持 CPU 设备")
+
+        # 权重移入共享内存：fork 后各进程读取同一份物理页
+        model.groundingdino.share_memory()
+        model.sam_predictor.model.share_memory()
+
+        threads = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+        context = mp.get_context("fork")
+        self._workers: List[_WorkerHandle] = []
+        for i in range(num_workers):
+            parent_conn, child_conn = context.Pipe()
+            inherited = [parent_conn] + [w.conn for w in self._workers]
+            process = context.Process(
+                target=_worker_main,
+                args=(child_conn, inherited, model, threads, window_ms, max_batch, compile_engine),
+                name=f"inference-{i}",
+                daemon=True
+            )
+            process.start()
+            child_conn.close()
+            self._workers.append(_WorkerHandle(i, process, parent_conn))
+        # 读取线程在全部进程 fork 完成后才启动，fork 时父进程中没有其他线程
+        for worker in self._workers:
+            worker.reader.start()
+
+        self.threads_per_worker = threads
+        self._ids = itertools.count()
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        print(f"Inference pool started: {num_workers} processes x {threads} threads")
+
+    def _route(self, image_key: Optional[str]) -> _WorkerHandle:
+        """同一图像固定路由到同一进程；该进程已退出时顺延到下一个存活进程"""
+        with self._lock:
+            start = zlib.crc32(image_key.encode()) if image_key else next(self._round_robin)
+        n = len(self._workers)
+        for offset in range(n):
+            worker = self._workers[(start + offset) % n]
+            if worker.alive:
+                return worker
+        raise RuntimeError("没有可用的推理进程")
+
+    # ---- 提交接口（与 InferenceWorker 一致） ----
+
+    def submit(self, method: str, *args, **kwargs) -> Future:
+        """
+        提交 GroundedSAM 方法调用，在亲和进程中执行
+
+        按关键字参数 image_key 路由；生成器结果（如 predict_batch）在工作进程中展开为列表。
+        """
+        worker = self._route(kwargs.get("image_key"))
+        return worker.send(next(self._ids), method, args, kwargs)
+
+    def call(self, method: str, *args, **kwargs):
+        """submit 的阻塞版本"""
+        return self.submit(method, *args, **kwargs).result()
+
+    def detect(
+        self,
+        image_path: str,
+        text_prompt: str,
+        box_threshold: float = 0.35,
+        text_threshold: float = 0.25,
+        image_key: Optional[str] = None
+    ):
+        """GroundingDINO 检测，参数与返回值同 InferenceWorker.detect"""
+        return self.call(
+            "detect", image_path, text_prompt, box_threshold, text_threshold, image_key=image_key
+        )
+
+    def segment(
+        self,
+        image_path: str,
+        boxes,
+        boxes_normalized: bool = False,
+        image_key: Optional[str] = None
+    ) -> List[np.ndarray]:
+        """SAM 分割，参数与返回值同 InferenceWorker.segment"""
+        return self.call("segment", image_path, boxes, boxes_normalized, image_key=image_key)
+
+    def stats(self, timeout: float = 1.0) -> dict:
+        """各进程状态；缓存与合并统计向工作进程查询，繁忙超时时为 None"""
+        workers = []
+        for worker in self._workers:
+            with worker.pending_lock:
+                info = {
+                    "pid": worker.process.pid,
+                    "alive": worker.alive,
+                    "requests": worker.requests,
+                    "in_flight": len(worker.pending)
+                }
+            try:
+                info.update(worker.send(next(self._ids), "stats", (), {}).result(timeout=timeout))
+            except Exception:
+                info.update({"caches": None, "inference": None})
+            workers.append(info)
+        return {
+            "processes": len(self._workers),
+            "threads_per_worker": self.threads_per_worker,
+            "workers": workers
+        }
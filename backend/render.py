@@ -0,0 +1,145 @@
+"""
+掩码叠加渲染
+
+把全部掩码先合成到一张标签图中（后面的掩码覆盖前面的），再只在掩码外接框的
+并集区域内做一次颜色混合，渲染开销与掩码覆盖面积相关，而不是 掩码数 × 整幅图像。
+标签图与混合缓冲区按图像尺寸预分配，并在多次渲染之间复用。
+"""
+
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+# 默认掩码颜色（绿色，RGB 与 BGR 相同）
+DEFAULT_COLOR = (0, 255, 0)
+
+
+class _Buffers:
+    """一组渲染缓冲区：标签图 + 颜色图 + 混合结果（后两者按需截取为 ROI 大小）"""
+
+    def __init__(self, shape: Tuple[int, int]):
+        h, w = shape
+        self.shape = shape
+        self.labels = np.zeros((h, w), dtype=np.uint16)
+        self.colors = np.empty(h * w * 3, dtype=np.uint8)
+        self.blended = np.empty(h * w * 3, dtype=np.uint8)
+
+    def roi(self, flat: np.ndarray, h: int, w: int) -> np.ndarray:
+        # 从扁平缓冲区切出连续的 (h, w, 3) 视图，可直接作为 OpenCV 的 dst
+        return flat[:h * w * 3].reshape(h, w, 3)
+
+
+class MaskRenderer:
+    """掩码叠加渲染器（线程安全，缓冲区在调用之间复用）"""
+
+    def __init__(self, alpha: float = 0.3, max_buffers: int = 2):
+        """
+        Args:
+            alpha: 掩码颜色的混合权重
+            max_buffers: 最多保留的空闲缓冲区组数（并发渲染时每个线程占用一组）
+        """
+        self.alpha = alpha
+        self.max_buffers = max_buffers
+        self._free: List[_Buffers] = []
+        self._lock = threading.Lock()
+
+    def _acquire(self, shape: Tuple[int, int]) -> _Buffers:
+        with self._lock:
+            for i, buffers in enumerate(self._free):
+                if buffers.shape == shape:
+                    return self._free.pop(i)
+        return _Buffers(shape)
+
+    def _release(self, buffers: _Buffers):
+        with self._lock:
+            self._free.append(buffers)
+            if len(self._free) > self.max_buffers:
+                self._free.pop(0)
+
+    def render(
+        self,
+        image: np.ndarray,
+        masks: Sequence[np.ndarray],
+        colors: Optional[Sequence[Sequence[int]]] = None,
+        contour_thickness: int = 2
+    ) -> np.ndarray:
+        """
+        在图像上原地叠加掩码与轮廓
+
+        Args:
+            image: (H, W, 3) uint8 图像，会被原地修改
+            masks: 掩码列表，每个为 (H, W)，非零即前景
+            colors: 每个掩码的颜色（与 image 的通道顺序一致），None 时全部使用 DEFAULT_COLOR
+            contour_thickness: 轮廓线宽，0 表示不画轮廓
+
+        Returns:
+            image（同一数组）
+        """
+        if len(masks) == 0:
+            return image
+        if len(masks) >= np.iinfo(np.uint16).max:
+            raise ValueError(f"掩码数量过多: {len(masks)}")
+
+        h, w = image.shape[:2]
+        palette = np.zeros((len(masks) + 1, 3), dtype=np.uint8)
+        palette[1:] = colors if colors is not None else DEFAULT_COLOR
+
+        # 中途出错时这组缓冲区不放回（标签图可能残留数据），直接丢弃
+        buffers = self._acquire((h, w))
+        labels = buffers.labels
+
+        # 1. 合成标签图，记录每个掩码的外接框
+        bboxes = []
+        for i, mask in enumerate(masks):
+            mask = np.asarray(mask)
+            mask = mask if mask.dtype == np.bool_ else mask > 0
+            rows = np.flatnonzero(mask.any(axis=1))
+            if len(rows) == 0:
+                bboxes.append(None)
+                continue
+            cols = np.flatnonzero(mask.any(axis=0))
+            y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+            roi_mask = mask[y0:y1, x0:x1]
+            labels[y0:y1, x0:x1][roi_mask] = i + 1
+            bboxes.append((y0, y1, x0, x1, roi_mask))
+
+        present = [b for b in bboxes if b is not None]
+        if not present:
+            self._release(buffers)
+            return image
+
+        # 2. 在外接框并集内一次性混合
+        y0 = min(b[0] for b in present)
+        y1 = max(b[1] for b in present)
+        x0 = min(b[2] for b in present)
+        x1 = max(b[3] for b in present)
+        rh, rw = y1 - y0, x1 - x0
+
+        roi_labels = labels[y0:y1, x0:x1]
+        roi_image = image[y0:y1, x0:x1]
+        roi_colors = buffers.roi(buffers.colors, rh, rw)
+        roi_blended = buffers.roi(buffers.blended, rh, rw)
+        np.take(palette, roi_labels, axis=0, out=roi_colors)
+        cv2.addWeighted(roi_image, 1 - self.alpha, roi_colors, self.alpha, 0, dst=roi_blended)
+        np.copyto(roi_image, roi_blended, where=(roi_labels > 0)[:, :, None])
+
+        # 3. 轮廓只在各自的外接框内提取
+        if contour_thickness > 0:
+            for i, bbox in enumerate(bboxes):
+                if bbox is None:
+                    continue
+                by0, _, bx0, _, roi_mask = bbox
+                contours, _ = cv2.findContours(
+                    roi_mask.astype(np.uint8),
+                    cv2.RETR_EXTERNAL,
+                    cv2.CHAIN_APPROX_SIMPLE,
+                    offset=(int(bx0), int(by0))
+                )
+                cv2.drawContours(image, contours, -1, palette[i + 1].tolist(), contour_thickness)
+
+        # 复用前只需清零本次写过的区域
+        roi_labels.fill(0)
+        self._release(buffers)
+        return image
@@ -3,7 +3,9 @@ import sys
 import json
 import uuid
 import base64
-from flask import Flask, request, jsonify
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, request, jsonify, Response, stream_with_context, send_from_directory
 from flask_cors import CORS
 from openai import OpenAI
 
@@ -24,36 +26,214 @@ WEIGHTS_FOLDER = os.path.join(ROOT_DIR, 'weights')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULT_FOLDER, exist_ok=True)
 
+# 上传限制：单张图片字节上限、单个请求体上限（批量上传时包含多张图片）
+UPLOAD_MAX_MB = int(os.environ.get("UPLOAD_MAX_MB", "50"))
+MAX_REQUEST_MB = int(os.environ.get("MAX_REQUEST_MB", "512"))
+# 工作图长边上限（像素）：更大的上传图片另存缩小副本，检测 / SAM / 渲染只处理副本
+# 默认 1333 与 GroundingDINO 的输入长边上限一致，不影响常见比例图片的检测输入
+UPLOAD_WORKING_MAX_SIDE = int(os.environ.get("UPLOAD_WORKING_MAX_SIDE", "1333"))
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_MB * 1024 * 1024
+
 # DeepSeek 客户端
 client = OpenAI(
     api_key=os.environ.get("ANTHROPIC_API_KEY"),
     base_url="https://api.deepseek.com"
 )
 
-# 会话存储 {session_id: {"messages": [...], "image_path": "...", "result_count": 0, "detection_cache": {...}}}
-sessions = {}
-
-# 检测结果缓存（用于用户确认后的 SAM 分割）
-_detection_cache = {}  # {session_id: {"boxes": ..., "logits": ..., "phrases": ..., "image_path": ...}}
+# 会话存储：空闲超过 TTL 过期，总字节数（含检测结果中的图像数组与消息历史）超出预算时按 LRU 淘汰
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", "7200"))
+SESSION_STORE_MB = int(os.environ.get("SESSION_STORE_MB", "1024"))
+# 会话存储后端：memory（进程内）或 sqlite（多个服务进程共享同一数据库文件）
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", os.path.join(ROOT_DIR, "sessions.db"))
+# 后台清理间隔（秒）：移除过期会话，并删除 uploads/、results/ 中超过 TTL 且无会话引用的文件
+SESSION_SWEEP_SECONDS = int(os.environ.get("SESSION_SWEEP_SECONDS", "60"))
+
+# SAM 掩码解码器单次前向的最大框数
+SAM_BATCH_SIZE = int(os.environ.get("SAM_BATCH_SIZE", "16"))
+# 推理精度：fp32（默认）/ int8（CPU 动态量化）/ bf16（bfloat16 autocast），设备不支持时回退到 fp32
+INFERENCE_PRECISION = os.environ.get("INFERENCE_PRECISION", "fp32")
+# 推理引擎：eager（默认）/ torchscript / onnxruntime，导出的图缓存在 weights/compiled/，不支持时回退到 eager
+INFERENCE_ENGINE = os.environ.get("INFERENCE_ENGINE", "eager")
+# SAM 图像嵌入缓存上限（MB），按图像内容哈希跨会话共享
+SAM_EMBEDDING_CACHE_MB = int(os.environ.get("SAM_EMBEDDING_CACHE_MB", "512"))
+# GroundingDINO 图像骨干特征缓存上限（MB），同一图像换提示词时复用
+DINO_FEATURE_CACHE_MB = int(os.environ.get("DINO_FEATURE_CACHE_MB", "512"))
+# BERT 文本编码缓存上限（MB），同一提示词只编码一次
+TEXT_CACHE_MB = int(os.environ.get("TEXT_CACHE_MB", "32"))
+# 解码后图像缓存上限（MB），两步式流程的检测、SAM 与渲染共用同一份解码结果
+DECODED_IMAGE_CACHE_MB = int(os.environ.get("DECODED_IMAGE_CACHE_MB", "256"))
+# 检测结果缓存上限（MB），相同图像 + 提示词重复检测或只改阈值时不再运行 GroundingDINO
+DETECTION_CACHE_MB = int(os.environ.get("DETECTION_CACHE_MB", "64"))
+
+# 上传图片时是否在后台预计算图像特征（GroundingDINO 骨干 + SAM 嵌入）
+PRECOMPUTE_EMBEDDINGS = os.environ.get("PRECOMPUTE_EMBEDDINGS", "1") != "0"
+
+# 推理线程合并请求的时间窗口（毫秒）与单批最大请求数
+INFERENCE_BATCH_WINDOW_MS = float(os.environ.get("INFERENCE_BATCH_WINDOW_MS", "10"))
+INFERENCE_MAX_BATCH = int(os.environ.get("INFERENCE_MAX_BATCH", "8"))
+
+# 结果图的 HTTP 缓存时间（秒）：文件名按会话与轮次唯一，写入后不再修改
+RESULT_MAX_AGE = int(os.environ.get("RESULT_MAX_AGE", "86400"))
+
+# 推理进程数：>1 时启动后 fork 出多个工作进程（仅 CPU），按图像哈希路由以复用进程内缓存
+INFERENCE_PROCESSES = int(os.environ.get("INFERENCE_PROCESSES", "1"))
+
+# 启动时预热：加载模型，并导出 / 加载推理引擎的全部尺寸桶（0 关闭）
+WARMUP_MODELS = os.environ.get("WARMUP_MODELS", "1") != "0"
+
+# 本地意图路由：确认 / 序号选择 / 明确的分割指令直接执行工具，不调用 LLM（0 关闭）
+FAST_INTENT_ROUTER = os.environ.get("FAST_INTENT_ROUTER", "1") != "0"
+
+# 对话任务池：并发执行的轮次数与最大排队数
+CHAT_WORKERS = int(os.environ.get("CHAT_WORKERS", "2"))
+CHAT_QUEUE_SIZE = int(os.environ.get("CHAT_QUEUE_SIZE", "16"))
 
 # Grounded-SAM 模型实例（延迟加载）
 _grounded_sam_model = None
+_grounded_sam_lock = threading.Lock()
 
 
 def get_grounded_sam_model():
-    """获取或创建 Grounded-SAM 模型单例"""
+    """获取或创建 Grounded-SAM 模型单例（线程安全，后台预计算线程也会调用）"""
     global _grounded_sam_model
-    if _grounded_sam_model is None:
-        from backend.grounded_sam import load_grounded_sam
-        print("Loading Grounded-SAM model...")
-        _grounded_sam_model = load_grounded_sam(
-            groundingdino_config=os.path.join(WEIGHTS_FOLDER, "GroundingDINO_SwinT_OGC.py"),
-            groundingdino_checkpoint=os.path.join(WEIGHTS_FOLDER, "groundingdino_swint_ogc.pth"),
-            sam_checkpoint=os.path.join(WEIGHTS_FOLDER, "sam_vit_b_01ec64.pth")
-        )
-        print("Grounded-SAM model loaded successfully!")
+    with _grounded_sam_lock:
+        if _grounded_sam_model is None:
+            from backend.grounded_sam import load_grounded_sam
+            print("Loading Grounded-SAM model...")
+            _grounded_sam_model = load_grounded_sam(
+                groundingdino_config=os.path.join(WEIGHTS_FOLDER, "GroundingDINO_SwinT_OGC.py"),
+                groundingdino_checkpoint=os.path.join(WEIGHTS_FOLDER, "groundingdino_swint_ogc.pth"),
+                sam_checkpoint=os.path.join(WEIGHTS_FOLDER, "sam_vit_b_01ec64.pth"),
+                sam_batch_size=SAM_BATCH_SIZE,
+                precision=INFERENCE_PRECISION,
+                engine=INFERENCE_ENGINE,
+                compiled_dir=os.path.join(WEIGHTS_FOLDER, "compiled"),
+                embedding_cache_bytes=SAM_EMBEDDING_CACHE_MB * 1024 * 1024,
+                dino_feature_cache_bytes=DINO_FEATURE_CACHE_MB * 1024 * 1024,
+                text_cache_bytes=TEXT_CACHE_MB * 1024 * 1024,
+                decoded_image_cache_bytes=DECODED_IMAGE_CACHE_MB * 1024 * 1024,
+                detection_cache_bytes=DETECTION_CACHE_MB * 1024 * 1024
+            )
+            print("Grounded-SAM model loaded successfully!")
     return _grounded_sam_model
 
+
+# 推理线程：独占模型，所有检测/分割在此串行执行并做微批合并
+# INFERENCE_PROCESSES > 1 时改用多进程推理池（接口相同）。fork 必须早于任何后台线程的启动
+# （下面的任务池、预计算与会话清理）和任何前向推理，因此在这里创建：父进程只加载权重，
+# 推理图由各工作进程启动后导出 / 加载
+if INFERENCE_PROCESSES > 1:
+    from backend.process_pool import ProcessPool
+    _inference = ProcessPool(
+        get_grounded_sam_model(),
+        INFERENCE_PROCESSES,
+        window_ms=INFERENCE_BATCH_WINDOW_MS,
+        max_batch=INFERENCE_MAX_BATCH,
+        compile_engine=WARMUP_MODELS
+    )
+else:
+    from backend.inference_worker import InferenceWorker
+    _inference = InferenceWorker(
+        get_grounded_sam_model,
+        window_ms=INFERENCE_BATCH_WINDOW_MS,
+        max_batch=INFERENCE_MAX_BATCH
+    )
+
+# 意图明确的消息绕过 LLM
+from backend.intent_router import IntentRouter, describe_result
+_intent_router = IntentRouter() if FAST_INTENT_ROUTER else None
+
+# 对话任务池（同步与异步 chat 均经由它执行）
+from backend.jobs import JobManager, JobQueueFull
+_job_manager = JobManager(max_workers=CHAT_WORKERS, max_pending=CHAT_QUEUE_SIZE)
+
+# 会话级锁 {session_id: Lock}
+_session_locks = {}
+_session_locks_guard = threading.Lock()
+
+
+def _precompute_stage(stage, image_path, image_hash):
+    """预计算单个阶段：多进程时在负责该图像的工作进程中执行，缓存才会留在该进程"""
+    if INFERENCE_PROCESSES > 1:
+        _inference.call("precompute", stage, image_path, image_key=image_hash)
+    else:
+        get_grounded_sam_model().precompute(stage, image_path, image_key=image_hash)
+
+
+# 图像特征后台预计算（会话创建时调度）
+from backend.precompute import EmbeddingPrecomputer
+_precomputer = EmbeddingPrecomputer(_precompute_stage) if PRECOMPUTE_EMBEDDINGS else None
+
+
+def _result_paths(session_id: str, session: dict):
+    """会话已生成的结果图路径"""
+    return [
+        os.path.join(RESULT_FOLDER, f"{session_id}_result_{i}.jpg")
+        for i in range(1, session.get("result_count", 0) + 1)
+    ]
+
+
+# 上传图片按内容哈希去重保存，会话持有引用；多个服务进程共享会话（sqlite）时
+# 其他进程的引用不可见，不立即删除，由后台陈旧文件清理处理
+from backend.upload_store import UploadStore
+_uploads = UploadStore(
+    UPLOAD_FOLDER,
+    max_bytes=UPLOAD_MAX_MB * 1024 * 1024,
+    max_side=UPLOAD_WORKING_MAX_SIDE,
+    delete_on_release=SESSION_BACKEND != "sqlite"
+)
+
+
+def _on_session_removed(session_id: str, session: dict):
+    """会话被删除、过期或淘汰后清理关联资源：释放上传图片引用，删除结果图、会话锁与预计算记录"""
+    _uploads.release(session.get("image_hash"))
+    for path in _result_paths(session_id, session):
+        if os.path.exists(path):
+            os.remove(path)
+    with _session_locks_guard:
+        _session_locks.pop(session_id, None)
+    if _precomputer:
+        _precomputer.discard(session_id)
+
+
+def _referenced_files():
+    """仍被会话或进行中的批量任务引用的文件（后台清理时保留）"""
+    paths = _uploads.referenced()
+    for session_id, session in sessions.items():
+        paths.append(session["image_path"])
+        if session.get("original_path"):
+            paths.append(session["original_path"])
+        paths.extend(_result_paths(session_id, session))
+    return paths
+
+
+# 会话存储 {session_id: {"messages": [...], "image_path": "...", "image_hash": "...", "result_count": 0,
+#                        "original_path": "...", "original_size": [h, w], "detection": {...}}}
+# image_path 为工作分辨率图片，detection 为最近一次检测结果（用于用户确认后的 SAM 分割）
+from backend.session_store import MemorySessionStore, SQLiteSessionStore, make_detection, cache_masks, cached_masks
+if SESSION_BACKEND == "sqlite":
+    sessions = SQLiteSessionStore(
+        SESSION_DB_PATH,
+        max_bytes=SESSION_STORE_MB * 1024 * 1024,
+        ttl_seconds=SESSION_TTL_SECONDS,
+        on_remove=_on_session_removed
+    )
+else:
+    sessions = MemorySessionStore(
+        max_bytes=SESSION_STORE_MB * 1024 * 1024,
+        ttl_seconds=SESSION_TTL_SECONDS,
+        on_remove=_on_session_removed
+    )
+# 持久化的会话（sqlite）在重启后恢复对上传图片的引用
+for _, _session in sessions.items():
+    _uploads.acquire(_session.get("image_hash"), [_session.get("image_path"), _session.get("original_path")])
+sessions.start_sweeper(
+    SESSION_SWEEP_SECONDS,
+    stale_folders=[UPLOAD_FOLDER, RESULT_FOLDER],
+    referenced_files=_referenced_files
+)
+
 # 工具定义
 tools = [
     {
@@ -71,6 +251,22 @@ tools = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "detect_multiple_objects",
+            "description": "一次检测多个类别的物体（如 banner、building、crane），单次模型推理，显示边界框预览（第一步：检测）",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "image_path": {"type": "string", "description": "图像路径"},
+                    "object_prompts": {"type": "array", "items": {"type": "string"}, "description": "物体描述列表，如 ['banner', 'building', 'crane']"},
+                    "box_thresholds": {"type": "object", "additionalProperties": {"type": "number"}, "description": "可选，按类别指定的置信度阈值，如 {'crane': 0.3}，未指定的类别使用默认阈值 0.35"}
+                },
+                "required": ["image_path", "object_prompts"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -104,74 +300,125 @@ tools = [
 ]
 
 
-def handle_tool(name: str, inputs: dict, result_path: str, session_id: str = None) -> dict:
-    """工具处理函数"""
-    if name == "detect_objects":
+def _no_progress(stage: str, **data):
+    """默认的进度回调（不上报）"""
+
+
+def handle_tool(
+    name: str,
+    inputs: dict,
+    result_path: str,
+    session_id: str = None,
+    progress=_no_progress,
+    render: bool = True,
+    output: dict = None,
+    session: dict = None
+) -> dict:
+    """
+    工具处理函数
+
+    progress(stage, **data) 用于上报推理阶段（detection / sam / rendering），
+    异步任务通过它向客户端推送进度。
+    render=False 时跳过服务端结果图渲染；传入 output 字典时写入结构化结果
+    （image_size / boxes / logits / phrases / masks），供 API 客户端自行渲染。
+    session 为调用方持有的会话（检测结果写入其中，由调用方写回会话存储），
+    为 None 时按 session_id 从会话存储读取。
+    """
+    if session is None and session_id:
+        session = sessions.get(session_id)
+
+    if name in ("detect_objects", "detect_multiple_objects"):
         # 第一步：GroundingDINO 检测，缓存结果供后续 SAM 使用
-        from groundingdino.util.inference import load_model, load_image, predict, annotate
+        # 复用已预热的共享模型，不再每次请求重新加载权重
+        from groundingdino.util.inference import annotate
         import cv2
+        import torch
 
-        model = load_model(
-            os.path.join(WEIGHTS_FOLDER, "GroundingDINO_SwinT_OGC.py"),
-            os.path.join(WEIGHTS_FOLDER, "groundingdino_swint_ogc.pth")
-        )
-
-        image_source, image = load_image(inputs['image_path'])
+        model = get_grounded_sam_model()
 
-        TEXT_PROMPT = inputs['object_prompt']
         BOX_THRESHOLD = 0.35
         TEXT_THRESHOLD = 0.25
 
-        boxes, logits, phrases = predict(
-            model=model,
-            image=image,
-            caption=TEXT_PROMPT,
-            box_threshold=BOX_THRESHOLD,
-            text_threshold=TEXT_THRESHOLD
-        )
+        # 骨干特征按图像缓存，同一会话换提示词时只重跑文本与跨模态部分
+        image_hash = session.get("image_hash") if session else None
+
+        # 推理以图像路径 + 哈希提交，由执行推理的线程 / 进程从自己的解码缓存读取（多进程时不跨进程传输像素）；
+        # 本进程只在渲染预览或返回图像尺寸时解码（单进程时与推理共用同一解码缓存）
+        image = model.load_image(inputs['image_path'], image_hash) if render or output is not None else None
+        progress("detection", tool=name)
+        if _precomputer:
+            _precomputer.wait_features(image_hash)
+
+        per_class = None
+        if name == "detect_multiple_objects":
+            # 多个类别拼接为一个 caption，单次前向后按类别拆分
+            per_class = _inference.call(
+                "detect_multiple",
+                inputs['image_path'],
+                inputs['object_prompts'],
+                box_threshold=BOX_THRESHOLD,
+                text_threshold=TEXT_THRESHOLD,
+                class_thresholds=inputs.get('box_thresholds'),
+                image_key=image_hash
+            )
+            boxes = torch.cat([r[0] for r in per_class.values()]) if per_class else torch.zeros((0, 4))
+            logits = torch.cat([r[1] for r in per_class.values()]) if per_class else torch.zeros((0,))
+            phrases = [phrase for r in per_class.values() for phrase in r[2]]
+        else:
+            TEXT_PROMPT = inputs['object_prompt']
+            boxes, logits, phrases = _inference.detect(
+                inputs['image_path'],
+                TEXT_PROMPT,
+                box_threshold=BOX_THRESHOLD,
+                text_threshold=TEXT_THRESHOLD,
+                image_key=image_hash
+            )
 
         # 生成预览图（仅边界框）
-        annotated_frame = annotate(
-            image_source=image_source,
-            boxes=boxes,
-            logits=logits,
-            phrases=phrases
-        )
-        cv2.imwrite(result_path, annotated_frame)
-
-        # 缓存检测结果供后续 SAM 使用
-        if session_id:
-            _detection_cache[session_id] = {
-                "boxes": boxes,
-                "logits": logits,
-                "phrases": phrases,
-                "image_path": inputs['image_path'],
-                "image_source": image_source
-            }
-
-        return {
+        if render:
+            progress("rendering", num_objects=len(phrases))
+            annotated_frame = annotate(
+                image_source=image.rgb,
+                boxes=boxes,
+                logits=logits,
+                phrases=phrases
+            )
+            cv2.imwrite(result_path, annotated_frame)
+        if output is not None:
+            output.update(
+                image_size=image.shape[:2], boxes=boxes, logits=logits, phrases=phrases, masks=None
+            )
+
+        # 检测结果以紧凑数组存入会话供后续 SAM 使用（不保存图像，任何进程都可以继续分割）
+        if session is not None:
+            session["detection"] = make_detection(boxes, logits, phrases, inputs['image_path'], image_hash)
+
+        result = {
             "success": True,
-            "result_saved": result_path,
+            "result_saved": result_path if render else None,
             "detected": phrases,
             "num_objects": len(phrases),
             "method": "detection_only",
             "message": f"检测到 {len(phrases)} 个目标，已显示边界框预览。确认后请使用 '确认分割' 或 'segment_with_sam' 进行精确分割。"
         }
+        if per_class is not None:
+            result["per_class"] = {cls: len(r[2]) for cls, r in per_class.items()}
+        return result
 
     elif name == "segment_with_sam":
         # 第二步：用户确认后，使用缓存的检测结果进行 SAM 分割
-        if session_id not in _detection_cache:
+        cached = session.get("detection") if session else None
+        if cached is None:
             return {"error": "请先执行检测 (detect_objects)"}
 
-        cached = _detection_cache[session_id]
-
         # 获取用户指定的物体索引，默认分割所有
         object_indices = inputs.get('object_indices', list(range(len(cached['phrases']))))
 
         # 过滤出用户选择的物体
-        selected_boxes = cached['boxes'][object_indices] if len(object_indices) < len(cached['boxes']) else cached['boxes']
-        selected_phrases = [cached['phrases'][i] for i in object_indices] if len(object_indices) < len(cached['phrases']) else cached['phrases']
-        selected_logits = cached['logits'][object_indices] if len(object_indices) < len(cached['logits']) else cached['logits']
+        import torch
+        selected_boxes = torch.as_tensor(cached['boxes'][object_indices])
+        selected_phrases = [cached['phrases'][i] for i in object_indices]
+        selected_logits = torch.as_tensor(cached['logits'][object_indices])
 
         if len(selected_boxes) == 0:
             return {
@@ -186,28 +433,54 @@ def handle_tool(name: str, inputs: dict, result_path: str, session_id: str = Non
         # 使用 Grounded-SAM 的 SAM 部分进行分割
         model = get_grounded_sam_model()
 
-        import cv2
-        image_rgb = cv2.cvtColor(cached['image_source'], cv2.COLOR_BGR2RGB)
-
-        # SAM 分割（boxes 是归一化的 [cx, cy, w, h] 格式）
-        masks = model.segment_with_sam(image_rgb, selected_boxes, boxes_normalized=True)
+        # 之前分割过的框直接取会话中缓存的掩码，只对新选择的框运行 SAM
+        masks = cached_masks(cached, object_indices)
+        missing = sorted({i for i, mask in zip(object_indices, masks) if mask is None})
+
+        # 会话中只保存检测框和图像路径；分割在推理线程 / 进程内按路径读取图像，本进程只在渲染时解码
+        image = None
+        if render:
+            image = model.load_image(cached['image_path'], cached.get('image_hash'))
+
+        progress("sam", num_objects=len(selected_phrases), cached=len(selected_phrases) - len(missing))
+        if missing:
+            # 若上传时已调度嵌入预计算，等待其完成（通常已就绪）
+            if _precomputer:
+                _precomputer.wait(session_id, cached.get('image_hash'))
+
+            # SAM 分割（boxes 是归一化的 [cx, cy, w, h] 格式）
+            # 以上传图片的内容哈希作为嵌入缓存键，同一图片的多轮分割跳过图像编码器
+            new_masks = _inference.segment(
+                cached['image_path'],
+                torch.as_tensor(cached['boxes'][missing]),
+                boxes_normalized=True,
+                image_key=cached.get('image_hash')
+            )
+            # 掩码随检测结果写回会话（调用方在本轮结束时保存会话）
+            cache_masks(cached, missing, new_masks)
+            by_index = dict(zip(missing, new_masks))
+            masks = [by_index[i] if mask is None else mask for i, mask in zip(object_indices, masks)]
 
         # 生成结果图
-        model.annotate(
-            image_path=cached['image_path'],
-            boxes=selected_boxes,
-            masks=masks,
-            logits=selected_logits,
-            phrases=selected_phrases,
-            output_path=result_path
-        )
-
-        # 清除缓存（可选）
-        # del _detection_cache[session_id]
+        if render:
+            progress("rendering", num_objects=len(selected_phrases))
+            model.annotate(
+                image=image,
+                boxes=selected_boxes,
+                masks=masks,
+                logits=selected_logits,
+                phrases=selected_phrases,
+                output_path=result_path
+            )
+        if output is not None:
+            output.update(
+                image_size=masks[0].shape[:2], boxes=selected_boxes, logits=selected_logits,
+                phrases=selected_phrases, masks=masks
+            )
 
         return {
             "success": True,
-            "result_saved": result_path,
+            "result_saved": result_path if render else None,
             "detected": selected_phrases,
             "num_objects": len(selected_phrases),
             "method": "sam_segmentation",
@@ -218,11 +491,18 @@ def handle_tool(name: str, inputs: dict, result_path: str, session_id: str = Non
         # 一次性完成检测和分割（原有功能保留）
         model = get_grounded_sam_model()
 
-        result = model.predict(
+        image_hash = session.get("image_hash") if session else None
+        progress("detection", tool=name)
+        if _precomputer:
+            _precomputer.wait(session_id, image_hash)
+
+        result = _inference.call(
+            "predict",
             image_path=inputs['image_path'],
             text_prompt=inputs['object_prompt'],
             box_threshold=0.35,
-            text_threshold=0.25
+            text_threshold=0.25,
+            image_key=image_hash
         )
 
         if len(result['phrases']) == 0:
@@ -235,18 +515,25 @@ def handle_tool(name: str, inputs: dict, result_path: str, session_id: str = Non
                 "message": "未检测到目标"
             }
 
-        model.annotate(
-            image_path=inputs['image_path'],
-            boxes=result['boxes'],
-            masks=result['masks'],
-            logits=result['logits'],
-            phrases=result['phrases'],
-            output_path=result_path
-        )
+        if render:
+            progress("rendering", num_objects=len(result['phrases']))
+            model.annotate(
+                image=model.load_image(inputs['image_path'], image_hash),
+                boxes=result['boxes'],
+                masks=result['masks'],
+                logits=result['logits'],
+                phrases=result['phrases'],
+                output_path=result_path
+            )
+        if output is not None:
+            output.update(
+                image_size=result['image_size'], boxes=result['boxes'], logits=result['logits'],
+                phrases=result['phrases'], masks=result['masks']
+            )
 
         return {
             "success": True,
-            "result_saved": result_path,
+            "result_saved": result_path if render else None,
             "detected": result['phrases'],
             "num_objects": len(result['phrases']),
             "method": "grounded_sam"
@@ -255,8 +542,36 @@ def handle_tool(name: str, inputs: dict, result_path: str, session_id: str = Non
     return {"error": "未知工具"}
 
 
-def run_agent_turn(session_id: str, user_message: str) -> dict:
-    """执行一轮对话，支持多轮交互"""
+def _run_tool(session_id: str, session: dict, name: str, inputs: dict, progress, render: bool):
+    """
+    执行一次工具调用（LLM 规划或本地意图路由），分配结果图路径
+
+    Returns:
+        (tool_result, result_path, tool_output)
+    """
+    session["result_count"] += 1
+    result_path = os.path.join(
+        RESULT_FOLDER,
+        f"{session_id}_result_{session['result_count']}.jpg"
+    )
+
+    tool_output = {}
+    tool_result = handle_tool(
+        name, inputs, result_path, session_id, progress,
+        render=render, output=tool_output, session=session
+    )
+    return tool_result, result_path, tool_output
+
+
+def run_agent_turn(session_id: str, user_message: str, progress=_no_progress, render: bool = True) -> dict:
+    """
+    执行一轮对话，支持多轮交互
+
+    progress(stage, **data) 上报 LLM 规划与工具执行阶段。
+    render=False 时工具不生成结果图，结构化结果见返回值中的 output。
+    意图明确的消息由本地意图路由直接执行工具并按模板回复，整轮不调用 LLM；
+    工具调用与回复同样写入消息历史，后续轮次的 LLM 能看到完整上下文。
+    """
     session = sessions.get(session_id)
     if not session:
         return {"error": "会话不存在"}
@@ -268,56 +583,97 @@ def run_agent_turn(session_id: str, user_message: str) -> dict:
     messages.append({"role": "user", "content": user_message})
 
     result_image = None
+    output = None
+    answer = "处理超时"
 
-    max_iterations = 5
-    for _ in range(max_iterations):
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            max_tokens=1024,
-            tools=tools,
-            messages=messages
-        )
-
-        choice = response.choices[0]
-        message = choice.message
+    intent = _intent_router.route(user_message, session.get("detection")) if _intent_router else None
 
-        if message.tool_calls:
-            # 添加 assistant 消息（带工具调用）
-            messages.append(message)
-
-            for tool_call in message.tool_calls:
-                inputs = json.loads(tool_call.function.arguments)
-                inputs['image_path'] = image_path
-
-                # 生成结果图片路径
-                session["result_count"] += 1
-                result_path = os.path.join(
-                    RESULT_FOLDER,
-                    f"{session_id}_result_{session['result_count']}.jpg"
-                )
-
-                tool_result = handle_tool(tool_call.function.name, inputs, result_path, session_id)
-
-                if tool_result.get("success"):
-                    result_image = result_path
-
-                messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": json.dumps(tool_result, ensure_ascii=False)
-                })
+    # 会话在本轮结束（包括异常）时整体写回会话存储
+    try:
+        if intent is not None:
+            progress("fast_path", tool=intent["tool"])
+            inputs = dict(intent["inputs"], image_path=image_path)
+            tool_call_id = f"local_{uuid.uuid4().hex[:12]}"
+            messages.append({
+                "role": "assistant",
+                "content": "",
+                "tool_calls": [{
+                    "id": tool_call_id,
+                    "type": "function",
+                    "function": {"name": intent["tool"], "arguments": json.dumps(inputs, ensure_ascii=False)}
+                }]
+            })
+
+            tool_result, result_path, tool_output = _run_tool(
+                session_id, session, intent["tool"], inputs, progress, render
+            )
+            if tool_result.get("success"):
+                result_image = result_path if render else None
+                output = tool_output or None
+
+            answer = describe_result(tool_result)
+            messages.append({
+                "role": "tool",
+                "tool_call_id": tool_call_id,
+                "content": json.dumps(tool_result, ensure_ascii=False)
+            })
+            messages.append({"role": "assistant", "content": answer})
         else:
-            # 普通回复，添加到历史并返回
-            messages.append({"role": "assistant", "content": message.content})
-            return {
-                "answer": message.content or "",
-                "result_image": result_image,
-                "session_id": session_id
-            }
+            # 流式补全：工具参数完整即派发到工具线程执行（按 LLM 输出顺序串行），
+            # 与剩余 token 的生成重叠；文本增量以 token 事件推送
+            from backend.llm_stream import stream_completion
+            max_iterations = 5
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="tool") as tool_executor:
+                for _ in range(max_iterations):
+                    progress("llm_planning")
+                    dispatched = []  # [(tool_call_id, Future 或 None)]
+
+                    def on_tool_call(tool_call_id, name, arguments):
+                        if arguments is None:
+                            dispatched.append((tool_call_id, None))
+                            return
+                        inputs = dict(arguments, image_path=image_path)
+                        dispatched.append((tool_call_id, tool_executor.submit(
+                            _run_tool, session_id, session, name, inputs, progress, render
+                        )))
+
+                    message = stream_completion(
+                        client,
+                        on_text=lambda text: progress("token", text=text),
+                        on_tool_call=on_tool_call,
+                        model="deepseek-chat",
+                        max_tokens=1024,
+                        tools=tools,
+                        messages=messages
+                    )
+                    messages.append(message)
+
+                    if not dispatched:
+                        # 普通回复（已随 token 事件流式推送）
+                        answer = message["content"]
+                        break
+
+                    for tool_call_id, future in dispatched:
+                        if future is None:
+                            tool_result = {"error": "工具参数不是有效的 JSON"}
+                        else:
+                            tool_result, result_path, tool_output = future.result()
+                            if tool_result.get("success"):
+                                result_image = result_path if render else None
+                                output = tool_output or None
+
+                        messages.append({
+                            "role": "tool",
+                            "tool_call_id": tool_call_id,
+                            "content": json.dumps(tool_result, ensure_ascii=False)
+                        })
+    finally:
+        sessions.update(session_id, session)
 
     return {
-        "answer": "处理超时",
+        "answer": answer,
         "result_image": result_image,
+        "output": output,
         "session_id": session_id
     }
 
@@ -328,10 +684,12 @@ def create_session():
     创建新会话，上传图片
 
     请求格式 (multipart/form-data):
-    - image: 图片文件
+    - image: 图片文件（JPEG / PNG / WebP / BMP / TIFF，不超过 UPLOAD_MAX_MB）
 
     返回:
     - session_id: 会话ID
+    - image_size: 工作图尺寸 [h, w]（检测结果与掩码默认基于此尺寸）
+    - original_size: 原图尺寸 [h, w]
     """
     if 'image' not in request.files:
         return jsonify({"error": "缺少图片"}), 400
@@ -340,14 +698,24 @@ def create_session():
 
     # 生成会话ID
     session_id = str(uuid.uuid4())
-    image_ext = os.path.splitext(image_file.filename)[1] or '.jpg'
-    image_path = os.path.join(UPLOAD_FOLDER, f"{session_id}{image_ext}")
 
-    # 保存图片
-    image_file.save(image_path)
+    # 流式保存原图并生成工作分辨率副本（相同内容只保存一份，会话持有其引用）
+    from backend.ingest import UploadError, UploadTooLarge
+    try:
+        upload = _uploads.put(image_file.stream)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    image_path = upload["image_path"]
+    image_hash = upload["image_hash"]
+
+    # 推测执行：后台提前计算骨干特征与 SAM 嵌入，检测/分割时可直接使用
+    if _precomputer:
+        _precomputer.schedule(session_id, image_path, image_hash)
 
     # 创建会话
-    sessions[session_id] = {
+    sessions.create(session_id, {
         "messages": [
             {"role": "system", "content": f"""你是图像分割助手。用户已上传图片，路径为: {image_path}。
 
@@ -364,19 +732,110 @@ def create_session():
 3. segment_object_with_sam - 一次性完成检测和分割（跳过预览）
    - 直接输出精确分割结果
 
+4. detect_multiple_objects - 一次检测多个类别（如 "banner、楼房和塔吊"）
+   - 用户一次提到多个物体时，使用此工具代替多次调用 detect_objects
+   - 检测结果按类别依次编号，之后同样使用 segment_with_sam 分割
+
 默认使用两步流程：先 detect_objects 预览，用户确认后再 segment_with_sam。
 当用户请求分割物体时，直接调用 detect_objects 工具，image_path 使用 '{image_path}'，object_prompt 使用用户描述的物体名称。"""}
         ],
         "image_path": image_path,
+        "image_hash": image_hash,
+        "original_path": upload["original_path"],
+        "original_size": upload["original_size"],
         "result_count": 0
-    }
+    })
 
     return jsonify({
         "session_id": session_id,
+        "image_size": upload["image_size"],
+        "original_size": upload["original_size"],
         "message": "会话已创建，请发送分割需求"
     })
 
 
+def _get_session_lock(session_id: str) -> threading.Lock:
+    """同一会话的对话轮次串行执行（消息历史与检测缓存不支持并发修改）"""
+    with _session_locks_guard:
+        return _session_locks.setdefault(session_id, threading.Lock())
+
+
+def _format_detections(output: dict, mask_format: str = None, target_size=None) -> dict:
+    """
+    把工具的结构化结果转为 JSON（boxes 为归一化 [cx, cy, w, h]）
+
+    mask_format 为 "rle" / "polygon" 时附带编码后的掩码（仅分割结果有掩码）。
+    target_size 为 [h, w] 时（如原图尺寸）掩码先缩放到该尺寸，image_size 同样报告该尺寸。
+    """
+    h, w = target_size or output['image_size']
+    detections = {
+        "image_size": [int(h), int(w)],
+        "num_objects": len(output['phrases']),
+        "detected": list(output['phrases']),
+        "scores": [round(float(x), 4) for x in output['logits']],
+        "boxes": [[round(float(v), 5) for v in box] for box in output['boxes']]
+    }
+    if mask_format and output.get('masks') is not None:
+        from backend.mask_codec import encode_masks
+        masks = output['masks']
+        if target_size is not None:
+            from backend.ingest import resize_masks
+            masks = resize_masks(masks, target_size)
+        detections["mask_format"] = mask_format
+        detections["masks"] = encode_masks(masks, mask_format)
+    return detections
+
+
+# 返回掩码的分辨率：工作图尺寸或原图尺寸
+MASK_RESOLUTIONS = ("working", "original")
+
+
+def _result_url(result_path: str) -> str:
+    """结果图的访问地址（由 /api/results/<filename> 提供）"""
+    return f"/api/results/{os.path.basename(result_path)}"
+
+
+def _chat_job(
+    job,
+    session_id: str,
+    message: str,
+    render: bool = True,
+    return_masks: str = None,
+    inline_image: bool = False,
+    original_masks: bool = False
+) -> dict:
+    """异步任务：执行一轮对话并生成响应数据"""
+    with _get_session_lock(session_id):
+        result = run_agent_turn(session_id, message, progress=job.emit, render=render)
+        session = sessions.get(session_id) if original_masks else None
+
+    if "error" in result:
+        raise RuntimeError(result["error"])
+
+    response_data = {
+        "answer": result["answer"],
+        "result_url": None,
+        "result_image": None,
+        "session_id": session_id
+    }
+
+    if return_masks or not render:
+        output = result.get("output")
+        target_size = session.get("original_size") if session else None
+        response_data["detections"] = _format_detections(output, return_masks, target_size) if output else None
+
+    # 结果图只返回地址，由客户端（或 CDN / 反向代理）按需获取并缓存
+    if result.get("result_image") and os.path.exists(result["result_image"]):
+        response_data["result_url"] = _result_url(result["result_image"])
+        # 兼容旧客户端：显式要求时才内联 base64
+        if inline_image:
+            with open(result["result_image"], "rb") as f:
+                image_data = base64.b64encode(f.read()).decode('utf-8')
+                response_data["result_image"] = f"data:image/jpeg;base64,{image_data}"
+
+    return response_data
+
+
 @app.route('/api/session/chat', methods=['POST'])
 def chat():
     """
@@ -385,10 +844,17 @@ def chat():
     请求格式 (JSON):
     - session_id: 会话ID
     - message: 用户消息
+    - async: 可选，为 true 时立即返回任务ID，通过 /api/jobs/<job_id> 轮询或订阅进度
+    - return_masks: 可选，"rle" 或 "polygon"，在 detections 中返回编码后的掩码
+    - render: 可选，为 false 时不生成结果图（默认 true）
+    - inline_image: 可选，为 true 时额外内联 base64 结果图（兼容旧客户端）
+    - mask_resolution: 可选，"working"（默认，工作图尺寸）或 "original"（放大到原图尺寸）
 
     返回:
     - answer: 文本回答
-    - result_image: base64 编码的结果图片（如果有）
+    - result_url: 结果图地址（如果有），通过 GET 获取
+    - result_image: base64 编码的结果图片（仅 inline_image 时）
+    - detections: 结构化结果（return_masks 或 render=false 时）
     - session_id: 会话ID
     """
     data = request.get_json()
@@ -404,25 +870,258 @@ def chat():
     if session_id not in sessions:
         return jsonify({"error": "会话不存在或已过期"}), 404
 
+    from backend.mask_codec import MASK_FORMATS
+    return_masks = data.get("return_masks")
+    if return_masks is not None and return_masks not in MASK_FORMATS:
+        return jsonify({"error": f"return_masks 仅支持 {', '.join(MASK_FORMATS)}"}), 400
+    render = data.get("render", True) is not False
+    inline_image = bool(data.get("inline_image"))
+    mask_resolution = data.get("mask_resolution", "working")
+    if mask_resolution not in MASK_RESOLUTIONS:
+        return jsonify({"error": f"mask_resolution 仅支持 {', '.join(MASK_RESOLUTIONS)}"}), 400
+
+    # 所有对话轮次都经由有界任务池执行，队列满时返回 503 由客户端重试
     try:
-        result = run_agent_turn(session_id, message)
+        job = _job_manager.submit(
+            _chat_job, session_id, message,
+            render=render, return_masks=return_masks, inline_image=inline_image,
+            original_masks=mask_resolution == "original"
+        )
+    except JobQueueFull:
+        return jsonify({"error": "服务繁忙，请稍后重试"}), 503
+
+    if data.get("async"):
+        return jsonify({
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/api/jobs/{job.id}",
+            "events_url": f"/api/jobs/{job.id}/events"
+        }), 202
+
+    job.wait()
+    if job.error:
+        return jsonify({"error": job.error}), 500
+    return jsonify(job.result)
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询异步任务状态，结束后包含与同步 chat 相同的 result"""
+    job = _job_manager.get(job_id)
+    if not job:
+        return jsonify({"error": "任务不存在或已过期"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    以 Server-Sent Events 推送任务进度
 
-        response_data = {
-            "answer": result["answer"],
-            "result_image": None,
-            "session_id": session_id
+    事件类型即阶段名：queued / llm_planning / token / fast_path / detection / sam / rendering / done / failed，
+    token 事件携带 LLM 回复的文本增量，done 事件的 data 中包含最终结果。支持 Last-Event-ID 断线续传。
+    """
+    job = _job_manager.get(job_id)
+    if not job:
+        return jsonify({"error": "任务不存在或已过期"}), 404
+
+    after = request.headers.get("Last-Event-ID", type=int)
+    after = after + 1 if after is not None else 0
+
+    def generate():
+        for event in job.iter_events(after=after):
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            data = dict(event["data"])
+            if event["stage"] == "done":
+                data["result"] = job.result
+            payload = json.dumps(data, ensure_ascii=False)
+            yield f"id: {event['seq']}\nevent: {event['stage']}\ndata: {payload}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route('/api/batch', methods=['POST'])
+def batch():
+    """
+    批量分割：多张图片共用一组提示词，按完成顺序流式返回结果
+
+    请求格式 (multipart/form-data):
+    - images: 图片文件（可多个）
+    - prompt: 文本提示，如 "crane arm"
+    - box_threshold / text_threshold: 可选阈值
+    - batch_size: 可选，每批图片数（默认 4）
+    - render: 可选，是否生成结果图（默认 1）
+    - return_masks: 可选，"rle" 或 "polygon"，返回编码后的掩码
+    - mask_resolution: 可选，"working"（默认）或 "original"，掩码放大到原图尺寸
+      （切块模式在原图上推理，"working" 时掩码缩小到工作图尺寸）
+    - tile_size: 可选，>0 时启用切块模式：在原图上按该边长切块检测与分割（适合航拍大图中的小目标）
+    - tile_overlap: 可选，切块模式相邻图块的重叠比例（默认 0.2）
+
+    返回 (application/x-ndjson，每行一个 JSON):
+    - index: 图片在上传列表中的下标
+    - filename: 原始文件名
+    - image_size / num_objects / detected / scores / boxes: 检测结果（boxes 为归一化 [cx, cy, w, h]）
+    - mask_format / masks: 编码后的掩码（return_masks 时）
+    - result_file / result_url: 结果图文件名与访问地址（render=1 且有检测结果时）
+    - timings: 各阶段耗时（秒）
+    """
+    image_files = request.files.getlist('images')
+    prompt = request.form.get('prompt')
+    if not image_files or not prompt:
+        return jsonify({"error": "缺少 images 或 prompt"}), 400
+
+    box_threshold = float(request.form.get('box_threshold', 0.35))
+    text_threshold = float(request.form.get('text_threshold', 0.25))
+    batch_size = int(request.form.get('batch_size', 4))
+    render = request.form.get('render', '1') != '0'
+    return_masks = request.form.get('return_masks') or None
+
+    mask_resolution = request.form.get('mask_resolution', 'working')
+    tile_size = int(request.form.get('tile_size', 0))
+    tile_overlap = float(request.form.get('tile_overlap', 0.2))
+
+    from backend.mask_codec import MASK_FORMATS
+    if return_masks is not None and return_masks not in MASK_FORMATS:
+        return jsonify({"error": f"return_masks 仅支持 {', '.join(MASK_FORMATS)}"}), 400
+    if mask_resolution not in MASK_RESOLUTIONS:
+        return jsonify({"error": f"mask_resolution 仅支持 {', '.join(MASK_RESOLUTIONS)}"}), 400
+    if tile_size > 0 and not 0 <= tile_overlap < 1:
+        return jsonify({"error": "tile_overlap 必须在 [0, 1) 内"}), 400
+
+    from backend.ingest import UploadError, UploadTooLarge, mask_target_size
+    batch_id = str(uuid.uuid4())
+    # 批量任务在响应结束前持有各图片的引用
+    image_paths, original_paths, filenames, target_sizes, hashes = [], [], [], [], []
+
+    def release_uploads():
+        for image_hash in hashes:
+            _uploads.release(image_hash)
+
+    for image_file in image_files:
+        try:
+            upload = _uploads.put(image_file.stream)
+        except UploadError as e:
+            release_uploads()
+            status = 413 if isinstance(e, UploadTooLarge) else 400
+            return jsonify({"error": f"{image_file.filename}: {e}"}), status
+        hashes.append(upload["image_hash"])
+        image_paths.append(upload["image_path"])
+        original_paths.append(upload["original_path"])
+        filenames.append(image_file.filename)
+        target_sizes.append(mask_target_size(upload, mask_resolution, tiled=tile_size > 0))
+
+    model = get_grounded_sam_model()
+
+    if tile_size > 0:
+        # 切块模式：逐张在原图上切块推理（单张图内的图块已批量执行），每张图是一个块
+        chunk_size = 1
+        futures = {
+            _inference.submit(
+                "predict_tiled",
+                original_paths[index],
+                prompt,
+                box_threshold=box_threshold,
+                text_threshold=text_threshold,
+                tile_size=tile_size,
+                overlap=tile_overlap,
+                batch_size=batch_size
+            ): index
+            for index in range(len(original_paths))
+        }
+    else:
+        # 图片按块提交，块之间在线请求可以插队；多进程时各块分散到不同进程并行执行
+        chunk_size = max(1, batch_size) * 4
+        futures = {
+            _inference.submit(
+                "predict_batch",
+                image_paths[start:start + chunk_size],
+                prompt,
+                box_threshold=box_threshold,
+                text_threshold=text_threshold,
+                batch_size=batch_size
+            ): start
+            for start in range(0, len(image_paths), chunk_size)
         }
 
-        # 如果有结果图片，转为 base64
-        if result.get("result_image") and os.path.exists(result["result_image"]):
-            with open(result["result_image"], "rb") as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-                response_data["result_image"] = f"data:image/jpeg;base64,{image_data}"
+    def results():
+        for future in as_completed(futures):
+            start = futures[future]
+            try:
+                chunk = future.result()
+            except Exception as e:
+                chunk = [
+                    {"index": i, "error": str(e)}
+                    for i in range(min(chunk_size, len(image_paths) - start))
+                ]
+            if isinstance(chunk, dict):
+                # predict_tiled 返回单张图的结果
+                chunk = [dict(chunk, index=0, image_path=original_paths[start])]
+            for result in chunk:
+                yield start, result
+
+    def generate():
+        for start, result in results():
+            index = start + result['index']
+            item = {"index": index, "filename": filenames[index]}
+            if 'error' in result:
+                item["error"] = result['error']
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+                continue
+
+            item.update(_format_detections(result, return_masks, target_sizes[index]))
+            item.update({
+                "result_file": None,
+                "result_url": None,
+                "timings": {k: round(v, 4) for k, v in result['timings'].items()}
+            })
+
+            if render and result['phrases']:
+                result_name = f"batch_{batch_id}_{index}.jpg"
+                model.annotate(
+                    image=result['image_path'],
+                    boxes=result['boxes'],
+                    masks=result['masks'],
+                    logits=result['logits'],
+                    phrases=result['phrases'],
+                    output_path=os.path.join(RESULT_FOLDER, result_name)
+                )
+                item["result_file"] = result_name
+                item["result_url"] = f"/api/results/{result_name}"
+
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # 无论客户端是否读完响应，连接关闭时都释放引用
+    response.call_on_close(release_uploads)
+    return response
 
-        return jsonify(response_data)
 
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+@app.errorhandler(413)
+def request_too_large(error):
+    """请求体超过 MAX_REQUEST_MB（在解析上传内容之前即被拒绝）"""
+    return jsonify({"error": f"请求体超过 {MAX_REQUEST_MB} MB 上限"}), 413
+
+
+@app.route('/api/results/<filename>', methods=['GET'])
+def get_result(filename):
+    """
+    获取结果图
+
+    由 send_file 直接流式发送文件（WSGI 服务器支持时零拷贝），支持 ETag / Last-Modified
+    条件请求（304）与 Range 请求；结果文件写入后不再修改，可被浏览器、CDN 长期缓存。
+    """
+    response = send_from_directory(
+        RESULT_FOLDER, filename, conditional=True, etag=True, max_age=RESULT_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 
 @app.route('/api/session/delete', methods=['POST'])
@@ -431,8 +1130,8 @@ def delete_session():
     data = request.get_json()
     session_id = data.get("session_id") if data else None
 
-    if session_id and session_id in sessions:
-        del sessions[session_id]
+    # 关联的检测结果、上传图片与结果图由 _on_session_removed 一并清理
+    if session_id and sessions.delete(session_id):
         return jsonify({"message": "会话已删除"})
 
     return jsonify({"error": "会话不存在"}), 404
@@ -441,7 +1140,30 @@ def delete_session():
 @app.route('/api/health', methods=['GET'])
 def health():
     """健康检查"""
-    return jsonify({"status": "ok", "active_sessions": len(sessions)})
+    from backend import model_registry
+    # 多进程时缓存位于各工作进程中，见 inference.workers
+    model = _grounded_sam_model if INFERENCE_PROCESSES <= 1 else None
+    return jsonify({
+        "status": "ok",
+        "active_sessions": len(sessions),
+        "session_store": sessions.stats(),
+        "models_loaded": model_registry.is_loaded(),
+        "model_load_times": model_registry.load_times(),
+        "precision": _grounded_sam_model.precision if _grounded_sam_model else None,
+        "engine": model.engine.stats() if model and model.engine else None,
+        "caches": {
+            "sam_embedding": model.embedding_cache.stats() if model else None,
+            "dino_backbone": model.dino_feature_cache.stats() if model else None,
+            "text_encoder": model.text_cache.stats() if model else None,
+            "decoded_image": model.decoded_image_cache.stats() if model else None,
+            "detection": model.detection_cache.stats() if model else None
+        },
+        "uploads": _uploads.stats(),
+        "precompute": _precomputer.stats() if _precomputer else None,
+        "intent_router": _intent_router.stats() if _intent_router else None,
+        "jobs": _job_manager.stats(),
+        "inference": _inference.stats()
+    })
 
 
 if __name__ == '__main__':
@@ -450,5 +1172,21 @@ if __name__ == '__main__':
     print("  POST /api/session/create  - 创建会话，上传图片")
     print("  POST /api/session/chat    - 发送消息，进行对话")
     print("  POST /api/session/delete  - 删除会话")
+    print("  POST /api/batch           - 批量分割（NDJSON 流式返回）")
+    print("  GET  /api/results/<file>  - 获取结果图")
+    print("  GET  /api/jobs/<id>       - 查询异步任务状态")
+    print("  GET  /api/jobs/<id>/events - 订阅异步任务进度（SSE）")
     print("  GET  /api/health          - 健康检查")
+
+    # 启动时预热模型，避免首个请求承担权重加载耗时
+    if WARMUP_MODELS:
+        from backend import model_registry
+        warm_model = get_grounded_sam_model()
+        for name, seconds in model_registry.load_times().items():
+            print(f"  {name}: {seconds:.2f}s")
+        # 启动时导出 / 加载全部尺寸桶的推理图，首个请求不承担导出耗时；
+        # 多进程时推理池已在导入阶段 fork，由各工作进程完成
+        if warm_model.engine is not None and INFERENCE_PROCESSES <= 1:
+            warm_model.engine.compile_all()
+
     app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
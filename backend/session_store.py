@@ -0,0 +1,571 @@
+"""
+会话存储
+
+会话（消息历史、上传图片信息、检测结果）按 TTL 过期，并在总字节数超过预算时
+按 LRU 淘汰。后台清理线程定期移除过期会话，并删除 uploads/ 与 results/ 中
+不再被任何会话引用的陈旧文件。
+
+两种实现共用同一接口（SessionStore）：
+
+- MemorySessionStore: 进程内存储，单进程部署
+- SQLiteSessionStore: SQLite 文件存储，同一台机器上的多个服务进程共享会话状态
+
+会话是可 JSON 序列化的字典（消息为普通 dict），检测结果以紧凑的数值数组保存：
+{"boxes": float32 (N, 4) 归一化 [cx, cy, w, h], "logits": float32 (N,), "phrases": [...],
+ "image_path": ..., "image_hash": ...}，不保存解码后的图像，
+任何进程都可以只重新读取图片就继续 SAM 分割。已分割过的框的掩码以位压缩形式
+保存在 "masks" {框下标: uint8 数组} 中（见 cache_masks），重新选择时只分割新增的框。
+
+get() 返回的会话可以直接修改，修改后调用 update(session_id, session) 写回并重新计入字节预算。
+"""
+
+import os
+import abc
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.cache import estimate_nbytes
+
+
+def make_detection(boxes, logits, phrases: List[str], image_path: str, image_hash: Optional[str]) -> dict:
+    """
+    构造会话中保存的检测结果（张量转为 float32 数组）
+
+    Args:
+        boxes: 归一化 [cx, cy, w, h] 边界框（torch.Tensor / numpy array）
+        logits: 置信度
+        phrases: 短语
+        image_path: 图像路径
+        image_hash: 图像内容哈希
+    """
+    def to_array(value, shape):
+        value = value.detach().cpu().numpy() if hasattr(value, "detach") else np.asarray(value)
+        return np.ascontiguousarray(value, dtype=np.float32).reshape(shape)
+
+    return {
+        "boxes": to_array(boxes, (-1, 4)),
+        "logits": to_array(logits, (-1,)),
+        "phrases": list(phrases),
+        "image_path": image_path,
+        "image_hash": image_hash
+    }
+
+
+def cache_masks(detection: dict, indices: Sequence[int], masks: Sequence[np.ndarray]):
+    """
+    把 SAM 掩码按检测框下标存入检测结果（np.packbits 位压缩，每像素 1 bit）
+
+    检测结果被新的检测替换时掩码随之失效，因此以框下标为键即对应（图像哈希, 框）。
+
+    Args:
+        detection: make_detection 构造的检测结果（原地修改）
+        indices: 各掩码对应的框下标
+        masks: (H, W) 掩码列表，同一图像的掩码尺寸相同
+    """
+    stored = detection.setdefault("masks", {})
+    for index, mask in zip(indices, masks):
+        mask = np.asarray(mask) > 0
+        detection["mask_shape"] = list(mask.shape)
+        stored[int(index)] = np.packbits(mask.reshape(-1))
+
+
+def cached_masks(detection: dict, indices: Sequence[int]) -> List[Optional[np.ndarray]]:
+    """
+    读取已缓存的掩码
+
+    Args:
+        detection: 检测结果
+        indices: 框下标
+
+    Returns:
+        与 indices 等长的列表，每项为 (H, W) bool 掩码，未缓存时为 None
+    """
+    stored = detection.get("masks") or {}
+    if not stored:
+        return [None] * len(indices)
+    h, w = detection["mask_shape"]
+    return [
+        np.unpackbits(stored[int(i)], count=h * w).reshape(h, w).astype(bool) if int(i) in stored else None
+        for i in indices
+    ]
+
+
+class SessionStore(abc.ABC):
+    """会话存储接口"""
+
+    def __init__(self, on_remove: Optional[Callable[[str, dict], None]] = None):
+        """
+        Args:
+            on_remove: on_remove(session_id, session)，会话被删除、过期或淘汰后调用，
+                       用于清理文件、预计算记录等关联资源
+        """
+        self._on_remove = on_remove
+        self._sweeper = None
+
+    @abc.abstractmethod
+    def create(self, session_id: str, session: dict):
+        """新建会话"""
+
+    @abc.abstractmethod
+    def get(self, session_id: str) -> Optional[dict]:
+        """获取会话并刷新访问时间；不存在或已过期时返回 None"""
+
+    @abc.abstractmethod
+    def update(self, session_id: str, session: dict):
+        """写回修改后的会话，重新计算字节数并按预算淘汰（当前会话本身不会被淘汰）"""
+
+    @abc.abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """删除会话，返回会话是否存在"""
+
+    @abc.abstractmethod
+    def items(self) -> List[Tuple[str, dict]]:
+        """全部会话（不刷新访问时间）"""
+
+    @abc.abstractmethod
+    def expire(self) -> int:
+        """移除所有已过期会话，返回移除数"""
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        """返回会话数、字节数与删除/过期/淘汰计数"""
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        """会话数"""
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def _notify(self, removed: Iterable[Tuple[str, dict]]):
+        if self._on_remove is None:
+            return
+        for session_id, session in removed:
+            try:
+                self._on_remove(session_id, session)
+            except Exception as e:
+                print(f"Session cleanup failed for {session_id}: {e}")
+
+    def start_sweeper(
+        self,
+        interval: float,
+        stale_folders: Iterable[str] = (),
+        referenced_files: Optional[Callable[[], Iterable[str]]] = None
+    ):
+        """
+        启动后台清理线程
+
+        Args:
+            interval: 清理间隔（秒）
+            stale_folders: 需要清理陈旧文件的目录（如 uploads/、results/）；只清理本进程启动清理线程之后
+                写入的文件，目录中已有的文件（如仓库自带的示例图片、上次运行留下的文件）不会被删除
+            referenced_files: 返回仍被使用的文件路径，这些文件即使陈旧也不删除
+        """
+        if self._sweeper is not None:
+            return
+        stale_folders = list(stale_folders)
+        started = time.time()
+
+        def sweep():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.expire()
+                    keep = set(os.path.abspath(p) for p in (referenced_files() if referenced_files else ()))
+                    for folder in stale_folders:
+                        remove_stale_files(folder, self.ttl_seconds, keep, since=started)
+                except Exception as e:
+                    print(f"Session sweep failed: {e}")
+
+        self._sweeper = threading.Thread(target=sweep, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+
+class MemorySessionStore(SessionStore):
+    """带 TTL 与字节预算的进程内会话存储"""
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: float,
+        on_remove: Optional[Callable[[str, dict], None]] = None
+    ):
+        """
+        Args:
+            max_bytes: 全部会话的字节预算，超出时淘汰最久未访问的会话
+            ttl_seconds: 会话空闲超过该时间（秒）后过期
+            on_remove: 见 SessionStore
+        """
+        super().__init__(on_remove)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()  # {session_id: {"session", "nbytes", "accessed"}}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "deleted": 0, "expired": 0, "evicted": 0}
+
+    def create(self, session_id: str, session: dict):
+        with self._lock:
+            self._data[session_id] = {"session": session, "nbytes": 0, "accessed": time.time()}
+            self._stats["created"] += 1
+        self.update(session_id, session)
+
+    def get(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is None:
+                return None
+            if self._expired(entry, time.time()):
+                removed = [self._pop(session_id, "expired")]
+            else:
+                entry["accessed"] = time.time()
+                self._data.move_to_end(session_id)
+                return entry["session"]
+        self._notify(removed)
+        return None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self._data:
+                return False
+            removed = [self._pop(session_id, "deleted")]
+        self._notify(removed)
+        return True
+
+    def update(self, session_id: str, session: dict):
+        # 估算在锁外进行，长消息历史不阻塞其他会话
+        nbytes = estimate_nbytes(session)
+
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is None:
+                return
+            entry["session"] = session
+            self._total_bytes += nbytes - entry["nbytes"]
+            entry["nbytes"] = nbytes
+            entry["accessed"] = time.time()
+            self._data.move_to_end(session_id)
+
+            removed = []
+            for victim in list(self._data):
+                if self._total_bytes <= self.max_bytes:
+                    break
+                if victim != session_id:
+                    removed.append(self._pop(victim, "evicted"))
+        self._notify(removed)
+
+    def items(self) -> List[Tuple[str, dict]]:
+        with self._lock:
+            return [(session_id, entry["session"]) for session_id, entry in self._data.items()]
+
+    def _expired(self, entry: dict, now: float) -> bool:
+        return now - entry["accessed"] > self.ttl_seconds
+
+    def _pop(self, session_id: str, reason: str) -> Tuple[str, dict]:
+        # 调用方需持有 self._lock
+        entry = self._data.pop(session_id)
+        self._total_bytes -= entry["nbytes"]
+        self._stats[reason] += 1
+        return session_id, entry["session"]
+
+    def expire(self) -> int:
+        now = time.time()
+        with self._lock:
+            removed = [
+                self._pop(session_id, "expired")
+                for session_id, entry in list(self._data.items())
+                if self._expired(entry, now)
+            ]
+        self._notify(removed)
+        return len(removed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "backend": "memory",
+                "sessions": len(self._data),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds
+            })
+        return stats
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite 会话存储，多个服务进程共享同一数据库文件
+
+    会话状态（消息、图片路径等）存为 JSON，检测框与置信度存为 float32 BLOB，
+    已缓存的掩码按下标顺序拼接为一个 BLOB（下标列表记录在 det_meta 中）。
+    会话级锁只在进程内有效，同一会话的并发请求应由负载均衡按会话保持路由到同一进程。
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            det_boxes BLOB,
+            det_logits BLOB,
+            det_meta TEXT,
+            nbytes INTEGER NOT NULL,
+            accessed REAL NOT NULL,
+            det_masks BLOB
+        );
+        CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions (accessed);
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int,
+        ttl_seconds: float,
+        on_remove: Optional[Callable[[str, dict], None]] = None
+    ):
+        """
+        Args:
+            path: 数据库文件路径
+            max_bytes: 全部会话的字节预算（按存储的行大小计算）
+            ttl_seconds: 会话空闲超过该时间（秒）后过期
+            on_remove: 见 SessionStore（由执行删除的进程调用）
+        """
+        super().__init__(on_remove)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._stats = {"created": 0, "deleted": 0, "expired": 0, "evicted": 0}
+        self._stats_lock = threading.Lock()
+        conn = self._conn()
+        conn.executescript(self._SCHEMA)
+        # 旧版本创建的数据库没有掩码列
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+        if "det_masks" not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN det_masks BLOB")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # 每个线程一个连接；WAL 模式下读写互不阻塞
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, reason: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[reason] += n
+
+    # ---- 序列化 ----
+
+    @staticmethod
+    def _encode(session: dict) -> tuple:
+        state = json.dumps(
+            {k: v for k, v in session.items() if k != "detection"}, ensure_ascii=False
+        )
+        detection = session.get("detection")
+        if detection is None:
+            return state, None, None, None, None
+        masks = detection.get("masks") or {}
+        meta = {k: v for k, v in detection.items() if k not in ("boxes", "logits", "masks")}
+        meta["mask_indices"] = sorted(masks)
+        boxes = np.ascontiguousarray(detection["boxes"], dtype=np.float32).tobytes()
+        logits = np.ascontiguousarray(detection["logits"], dtype=np.float32).tobytes()
+        mask_bits = b"".join(masks[i].tobytes() for i in meta["mask_indices"]) if masks else None
+        return state, boxes, logits, json.dumps(meta, ensure_ascii=False), mask_bits
+
+    @staticmethod
+    def _decode(state: str, boxes: bytes, logits: bytes, meta: str, mask_bits: Optional[bytes] = None) -> dict:
+        session = json.loads(state)
+        if meta is not None:
+            detection = json.loads(meta)
+            detection["boxes"] = np.frombuffer(boxes, dtype=np.float32).reshape(-1, 4).copy()
+            detection["logits"] = np.frombuffer(logits, dtype=np.float32).copy()
+            mask_indices = detection.pop("mask_indices", [])
+            if mask_bits and mask_indices:
+                # 每个掩码位压缩后长度相同
+                packed = np.frombuffer(mask_bits, dtype=np.uint8).reshape(len(mask_indices), -1)
+                detection["masks"] = {i: packed[k].copy() for k, i in enumerate(mask_indices)}
+            session["detection"] = detection
+        return session
+
+    # ---- 基本操作 ----
+
+    def create(self, session_id: str, session: dict):
+        self._write(session_id, session, insert=True)
+        self._count("created")
+
+    def get(self, session_id: str) -> Optional[dict]:
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            row = conn.execute(
+                "SELECT state, det_boxes, det_logits, det_meta, det_masks, accessed FROM sessions "
+                "WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[5] <= self.ttl_seconds:
+                conn.execute("UPDATE sessions SET accessed = ? WHERE session_id = ?", (now, session_id))
+                return self._decode(*row[:5])
+        # 已过期：由删除成功的进程负责清理
+        removed = self._remove([session_id], "expired", accessed_before=now - self.ttl_seconds)
+        self._notify(removed)
+        return None
+
+    def update(self, session_id: str, session: dict):
+        self._write(session_id, session, insert=False)
+
+    def _write(self, session_id: str, session: dict, insert: bool):
+        row = self._encode(session)
+        nbytes = sum(len(v) for v in row if v is not None)
+        conn = self._conn()
+        with conn:
+            if insert:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions "
+                    "(session_id, state, det_boxes, det_logits, det_meta, det_masks, nbytes, accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (session_id,) + row + (nbytes, time.time())
+                )
+            else:
+                updated = conn.execute(
+                    "UPDATE sessions SET state = ?, det_boxes = ?, det_logits = ?, det_meta = ?, det_masks = ?, "
+                    "nbytes = ?, accessed = ? WHERE session_id = ?",
+                    row + (nbytes, time.time(), session_id)
+                ).rowcount
+                if not updated:
+                    return
+            total = conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM sessions").fetchone()[0]
+
+        # 超出预算时按最久未访问淘汰（不淘汰当前会话）
+        victims = []
+        if total > self.max_bytes:
+            rows = conn.execute(
+                "SELECT session_id, nbytes FROM sessions WHERE session_id != ? ORDER BY accessed",
+                (session_id,)
+            ).fetchall()
+            for victim, victim_bytes in rows:
+                if total <= self.max_bytes:
+                    break
+                victims.append(victim)
+                total -= victim_bytes
+        if victims:
+            self._notify(self._remove(victims, "evicted"))
+
+    def _remove(
+        self,
+        session_ids: List[str],
+        reason: str,
+        accessed_before: Optional[float] = None
+    ) -> List[Tuple[str, dict]]:
+        """
+        删除指定会话，返回本进程实际删除的 (session_id, session)
+
+        accessed_before 不为 None 时只删除在此之前访问的会话（其他进程可能刚刚访问过）。
+        """
+        removed = []
+        cutoff = float("inf") if accessed_before is None else accessed_before
+        conn = self._conn()
+        with conn:
+            for session_id in session_ids:
+                row = conn.execute(
+                    "SELECT state, det_boxes, det_logits, det_meta FROM sessions "
+                    "WHERE session_id = ? AND accessed < ?",
+                    (session_id, cutoff)
+                ).fetchone()
+                if row is None:
+                    continue
+                conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                removed.append((session_id, self._decode(*row)))
+        if removed:
+            self._count(reason, len(removed))
+        return removed
+
+    def delete(self, session_id: str) -> bool:
+        removed = self._remove([session_id], "deleted")
+        self._notify(removed)
+        return bool(removed)
+
+    def items(self) -> List[Tuple[str, dict]]:
+        # 只用于遍历会话元数据（引用的文件等），不读取掩码
+        rows = self._conn().execute(
+            "SELECT session_id, state, det_boxes, det_logits, det_meta FROM sessions"
+        ).fetchall()
+        return [(row[0], self._decode(*row[1:])) for row in rows]
+
+    def expire(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        session_ids = [
+            row[0] for row in self._conn().execute(
+                "SELECT session_id FROM sessions WHERE accessed < ?", (cutoff,)
+            ).fetchall()
+        ]
+        removed = self._remove(session_ids, "expired", accessed_before=cutoff)
+        self._notify(removed)
+        return len(removed)
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def stats(self) -> dict:
+        sessions, total = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM sessions"
+        ).fetchone()
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({
+            "backend": "sqlite",
+            "path": self.path,
+            "sessions": sessions,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds
+        })
+        return stats
+
+
+def remove_stale_files(folder: str, max_age: float, keep: Iterable[str] = (), since: Optional[float] = None) -> int:
+    """
+    删除目录中修改时间早于 max_age 秒之前的文件
+
+    Args:
+        folder: 目录
+        max_age: 最大保留时间（秒）
+        keep: 不删除的文件绝对路径
+        since: 只删除修改时间不早于该时刻的文件（如进程启动时间），None 时不限制
+
+    Returns:
+        删除的文件数
+    """
+    keep = set(keep)
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = list(os.scandir(folder))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if not entry.is_file() or os.path.abspath(entry.path) in keep:
+            continue
+        try:
+            mtime = entry.stat().st_mtime
+            if mtime < cutoff and (since is None or mtime >= since):
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
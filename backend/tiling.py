@@ -0,0 +1,138 @@
+"""
+高分辨率图像切块
+
+GroundingDINO 把输入缩放到短边 800，无人机航拍等大图中的小目标（标牌、螺栓、远处的塔吊）
+会缩到只剩几个像素。切块模式把大图切成有重叠的等尺寸图块分别检测，再把各图块的框
+映射回原图坐标并做跨图块 NMS。本模块只包含与模型无关的几何计算，推理见
+GroundedSAM.detect_tiled / predict_tiled。
+"""
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+# 图块 (x0, y0, x1, y1)，像素坐标，右下开区间
+Tile = Tuple[int, int, int, int]
+
+
+def _starts(length: int, tile: int, stride: int) -> List[int]:
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    # 最后一块贴齐图像边缘，所有图块尺寸相同（批量前向时无需补零）
+    starts.append(length - tile)
+    return starts
+
+
+def tile_grid(height: int, width: int, tile_size: int, overlap: float) -> List[Tile]:
+    """
+    计算覆盖整幅图像的图块网格
+
+    Args:
+        height, width: 图像尺寸
+        tile_size: 图块边长（像素），图像某一边小于该值时该方向只有一块
+        overlap: 相邻图块的重叠比例 [0, 1)，应不小于待检测目标相对图块的尺寸
+
+    Returns:
+        图块列表 [(x0, y0, x1, y1), ...]，按行优先排列
+    """
+    if tile_size <= 0:
+        raise ValueError(f"tile_size 必须为正数: {tile_size}")
+    if not 0 <= overlap < 1:
+        raise ValueError(f"overlap 必须在 [0, 1) 内: {overlap}")
+
+    tile_w, tile_h = min(tile_size, width), min(tile_size, height)
+    stride = max(1, int(tile_size * (1 - overlap)))
+    return [
+        (x0, y0, x0 + tile_w, y0 + tile_h)
+        for y0 in _starts(height, tile_h, stride)
+        for x0 in _starts(width, tile_w, stride)
+    ]
+
+
+def inner_edge_mask(boxes: np.ndarray, tile: Tile, height: int, width: int, margin: float = 2.0) -> np.ndarray:
+    """
+    判断框是否贴着图块的内部边缘（被图块边界截断）
+
+    贴着图像真实边界的一侧不算截断。
+
+    Args:
+        boxes: (N, 4) 原图像素坐标 [x1, y1, x2, y2]
+        tile: 图块
+        height, width: 原图尺寸
+        margin: 判定为贴边的距离（像素）
+
+    Returns:
+        (N,) bool，True 表示被截断
+    """
+    x0, y0, x1, y1 = tile
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    cut = np.zeros(len(boxes), dtype=bool)
+    if x0 > 0:
+        cut |= boxes[:, 0] <= x0 + margin
+    if y0 > 0:
+        cut |= boxes[:, 1] <= y0 + margin
+    if x1 < width:
+        cut |= boxes[:, 2] >= x1 - margin
+    if y1 < height:
+        cut |= boxes[:, 3] >= y1 - margin
+    return cut
+
+
+def merge_detections(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float = 0.5
+) -> np.ndarray:
+    """
+    跨图块 NMS（与类别无关：同一提示词在不同图块中可能得到略有差异的短语）
+
+    Args:
+        boxes: (N, 4) 原图像素坐标 [x1, y1, x2, y2]
+        scores: (N,) 置信度
+        iou_threshold: IoU 超过该值的框只保留得分最高者
+
+    Returns:
+        保留的下标（按得分降序）
+    """
+    import torch
+    from torchvision.ops import nms
+
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    keep = nms(
+        torch.as_tensor(np.asarray(boxes), dtype=torch.float32),
+        torch.as_tensor(np.asarray(scores), dtype=torch.float32),
+        iou_threshold
+    )
+    return keep.numpy()
+
+
+def assign_to_tiles(boxes: np.ndarray, tiles: Sequence[Tile]) -> np.ndarray:
+    """
+    为每个框选择完整包含它、且中心离框中心最近的图块（SAM 在该图块内分割）
+
+    Args:
+        boxes: (N, 4) 原图像素坐标 [x1, y1, x2, y2]
+        tiles: 图块列表
+
+    Returns:
+        (N,) 图块下标，没有图块能完整包含（如整图检测得到的大目标）时为 -1
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    grid = np.asarray(tiles, dtype=np.float32)
+
+    inside = (
+        (boxes[:, None, 0] >= grid[None, :, 0]) & (boxes[:, None, 1] >= grid[None, :, 1]) &
+        (boxes[:, None, 2] <= grid[None, :, 2]) & (boxes[:, None, 3] <= grid[None, :, 3])
+    )
+    box_centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+    tile_centers = (grid[:, :2] + grid[:, 2:]) / 2
+    distances = ((box_centers[:, None] - tile_centers[None]) ** 2).sum(axis=2)
+    distances[~inside] = np.inf
+
+    owners = distances.argmin(axis=1)
+    owners[~inside.any(axis=1)] = -1
+    return owners
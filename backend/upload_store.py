@@ -0,0 +1,132 @@
+"""
+内容寻址的上传图片存储
+
+上传图片按内容哈希保存（见 ingest.store_upload），相同图片无论上传多少次都只占一份磁盘；
+会话通过 image_hash 引用图片，检测 / SAM 嵌入 / 解码缓存也都以同一个哈希为键，跨会话复用。
+每个哈希维护引用计数：会话删除、过期或批量任务结束时释放引用，计数归零才删除文件。
+"""
+
+import os
+import threading
+from typing import BinaryIO, Dict, Iterable, List
+
+from backend.ingest import receive_upload, store_upload
+
+
+class UploadStore:
+    """按内容哈希去重、带引用计数的上传图片存储（线程安全）"""
+
+    def __init__(self, folder: str, max_bytes: int, max_side: int, delete_on_release: bool = True):
+        """
+        Args:
+            folder: 保存目录
+            max_bytes: 单张图片字节上限
+            max_side: 工作图长边上限（像素）
+            delete_on_release: 引用计数归零时是否立即删除文件；多个服务进程共享会话时
+                               其他进程的引用不可见，应关闭并交给后台陈旧文件清理
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_side = max_side
+        self.delete_on_release = delete_on_release
+        self._lock = threading.Lock()
+        # {image_hash: {"paths": [...], "refs": int, "upload": store_upload 的返回值（落盘完成后）}}
+        self._entries: Dict[str, dict] = {}
+        self._stats = {"uploads": 0, "deduplicated": 0, "deleted": 0}
+
+    def put(self, stream: BinaryIO) -> Dict:
+        """
+        接收一张上传图片并持有一个引用（用完后调用 release）
+
+        Args:
+            stream: 上传文件的字节流
+
+        Returns:
+            ingest.store_upload 的返回值
+
+        Raises:
+            UploadTooLarge / UploadError: 见 ingest.receive_upload / store_upload
+        """
+        # 锁内只做去重检查与引用计数；流式接收、解码、缩放与写盘都不持锁。
+        # 落盘前先持有引用，期间同一内容的最后一个旧引用被释放也不会删除文件
+        part_path, content_hash, image_format, ext = receive_upload(stream, self.folder, self.max_bytes)
+        try:
+            with self._lock:
+                entry = self._entries.get(content_hash)
+                stored = entry.get("upload") if entry else None
+                self._acquire(content_hash, [])
+                self._stats["uploads"] += 1
+                if stored is not None:
+                    self._stats["deduplicated"] += 1
+
+            if stored is not None:
+                # 已被引用的图片：文件一定存在，刷新修改时间以免被陈旧文件清理删除
+                for path in {stored["original_path"], stored["image_path"]}:
+                    os.utime(path)
+                return dict(stored, deduplicated=True)
+
+            try:
+                upload = store_upload(part_path, content_hash, image_format, ext, self.folder, self.max_side)
+            except BaseException:
+                self.release(content_hash)
+                raise
+
+            with self._lock:
+                entry = self._entries[content_hash]
+                for path in (upload["original_path"], upload["image_path"]):
+                    if path not in entry["paths"]:
+                        entry["paths"].append(path)
+                entry.setdefault("upload", upload)
+                if upload["deduplicated"]:
+                    self._stats["deduplicated"] += 1
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        return upload
+
+    def acquire(self, image_hash: str, paths: Iterable[str]):
+        """为已存在的图片增加一个引用（如启动时从持久化的会话恢复引用计数）"""
+        if not image_hash:
+            return
+        with self._lock:
+            self._acquire(image_hash, paths)
+
+    def _acquire(self, image_hash: str, paths: Iterable[str]):
+        # 调用方需持有 self._lock
+        entry = self._entries.setdefault(image_hash, {"paths": [], "refs": 0})
+        for path in paths:
+            if path and path not in entry["paths"]:
+                entry["paths"].append(path)
+        entry["refs"] += 1
+
+    def release(self, image_hash: str):
+        """释放一个引用，计数归零时删除该图片的原图与工作图"""
+        if not image_hash:
+            return
+        with self._lock:
+            entry = self._entries.get(image_hash)
+            if entry is None:
+                return
+            entry["refs"] -= 1
+            if entry["refs"] > 0:
+                return
+            del self._entries[image_hash]
+            if not self.delete_on_release:
+                return
+            for path in entry["paths"]:
+                if os.path.exists(path):
+                    os.remove(path)
+                    self._stats["deleted"] += 1
+
+    def referenced(self) -> List[str]:
+        """仍被引用的文件（后台清理时保留）"""
+        with self._lock:
+            return [path for entry in self._entries.values() for path in entry["paths"]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "images": len(self._entries),
+                "references": sum(entry["refs"] for entry in self._entries.values()),
+                **self._stats
+            }
@@ -1,5 +1,5 @@
 import { useState } from 'react';
-import { api } from './api';
+import { api, resultUrl } from './api';
 import './App.css';
 import { UploadZone } from './components/UploadZone';
 import { Workspace } from './components/Workspace';
@@ -54,8 +54,8 @@ function App() {
 
       setMessages(prev => [...prev, assistantMsg]);
 
-      if (response.result_image) {
-        setResultImage(response.result_image);
+      if (response.result_url) {
+        setResultImage(resultUrl(response.result_url));
       }
     } catch (err: any) {
       console.error(err);
@@ -8,7 +8,10 @@ export interface CreateSessionResponse {
 
 export interface ChatResponse {
   answer: string;
-  result_image: string | null;
+  /** Path of the rendered result, relative to API_BASE_URL (served with HTTP caching) */
+  result_url: string | null;
+  /** Inline base64 result, only present when requested with inline_image */
+  result_image?: string | null;
   session_id: string;
 }
 
@@ -16,6 +19,11 @@ export interface ErrorResponse {
   error: string;
 }
 
+/**
+ * Absolute URL of a result path returned by the API
+ */
+export const resultUrl = (path: string): string => `${API_BASE_URL}${path}`;
+
 export const api = {
   /**
    * Create a new session with an image
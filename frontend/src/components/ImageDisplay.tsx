@@ -3,7 +3,7 @@ import './ImageDisplay.css';
 
 interface ImageDisplayProps {
     originalImage: string; // URL.createObjectURL or Base64
-    resultImage: string | null; // Base64
+    resultImage: string | null; // Result URL
 }
 
 export const ImageDisplay: React.FC<ImageDisplayProps> = ({ originalImage, resultImage }) => {
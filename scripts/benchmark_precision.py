@@ -0,0 +1,147 @@
+"""
+推理精度模式对比：在参考图像集上比较 int8 / bf16 与 fp32 的精度、速度与内存
+
+- 检测：各模式的检测框与 fp32 检测框按 IoU 贪心匹配，统计召回率、精确率与平均 IoU
+- 分割：各模式对 fp32 的检测框运行 SAM，与 fp32 掩码逐个计算 IoU（只衡量 SAM 本身的误差）
+- 速度：检测与分割的平均耗时（关闭所有特征缓存，每次都完整前向）及相对 fp32 的加速比
+- 内存：GroundingDINO 与 SAM 权重序列化后的大小及相对 fp32 的节省比例
+
+用法:
+    python scripts/benchmark_precision.py <参考图像目录> "crane arm" --modes fp32,int8,bf16 --repeat 3
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from backend import model_registry
+from backend.grounded_sam import GroundedSAM, DecodedImage
+from backend.precision import PRECISIONS, box_agreement, mean_mask_iou, serialized_nbytes
+
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def load_model(precision: str) -> GroundedSAM:
+    # 关闭所有特征 / 结果缓存，保证每次计时都是完整前向
+    return GroundedSAM(
+        groundingdino_config=model_registry.DEFAULT_GROUNDINGDINO_CONFIG,
+        groundingdino_checkpoint=model_registry.DEFAULT_GROUNDINGDINO_CHECKPOINT,
+        sam_checkpoint=model_registry.DEFAULT_SAM_CHECKPOINT,
+        device="cpu",
+        embedding_cache_bytes=0,
+        dino_feature_cache_bytes=0,
+        text_cache_bytes=0,
+        decoded_image_cache_bytes=0,
+        detection_cache_bytes=0,
+        precision=precision
+    )
+
+
+def run_image(model: GroundedSAM, image: DecodedImage, prompt: str, args, reference_boxes=None) -> dict:
+    """检测 + 分割一张图像，返回像素坐标检测框、掩码与平均耗时"""
+    h, w = image.shape[:2]
+    detect_times, segment_times = [], []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        boxes, _, _ = model.detect_with_groundingdino(image, prompt, args.box_threshold, args.text_threshold)
+        detect_times.append(time.perf_counter() - start)
+    boxes_xyxy = model._boxes_to_xyxy(boxes, w, h, True).numpy()
+
+    # 分割统一使用 fp32 的检测框，掩码差异只来自 SAM
+    segment_boxes = boxes_xyxy if reference_boxes is None else reference_boxes
+    masks = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        masks = model.segment_with_sam(image, segment_boxes) if len(segment_boxes) else []
+        segment_times.append(time.perf_counter() - start)
+
+    return {
+        "boxes": boxes_xyxy,
+        "masks": masks,
+        "detect": float(np.mean(detect_times)),
+        "segment": float(np.mean(segment_times))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推理精度模式对比（精度 / 速度 / 内存）")
+    parser.add_argument("image_dir", help="参考图像目录")
+    parser.add_argument("text_prompt", help="文本提示，如 'crane arm'")
+    parser.add_argument("--modes", default=",".join(PRECISIONS), help="要比较的精度模式，逗号分隔（fp32 总是作为参考）")
+    parser.add_argument("--repeat", type=int, default=3, help="每张图像的计时重复次数")
+    parser.add_argument("--threads", type=int, default=0, help="torch 线程数，0 表示使用默认值")
+    parser.add_argument("--box-threshold", type=float, default=0.35)
+    parser.add_argument("--text-threshold", type=float, default=0.25)
+    parser.add_argument("--json", default=None, help="把结果另存为 JSON")
+    args = parser.parse_args()
+
+    import torch
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    paths = sorted(
+        os.path.join(args.image_dir, name) for name in os.listdir(args.image_dir)
+        if name.lower().endswith(EXTENSIONS)
+    )
+    if not paths:
+        print(f"目录中没有图像: {args.image_dir}")
+        return
+    images = [DecodedImage.from_path(path) for path in paths]
+    modes = ["fp32"] + [m for m in args.modes.split(",") if m and m != "fp32"]
+
+    reference = None
+    report = {}
+    for mode in modes:
+        print(f"\n=== {mode} ===")
+        model = load_model(mode)
+        if model.precision != mode:
+            print(f"当前设备不支持 {mode}，跳过")
+            continue
+
+        runs = []
+        for i, image in enumerate(images):
+            ref_boxes = reference[i]["boxes"] if reference else None
+            runs.append(run_image(model, image, args.text_prompt, args, ref_boxes))
+            print(f"  {os.path.basename(paths[i])}: detect {runs[-1]['detect'] * 1000:.0f} ms, "
+                  f"segment {runs[-1]['segment'] * 1000:.0f} ms")
+        if reference is None:
+            reference = runs
+
+        agreements = [box_agreement(ref["boxes"], run["boxes"]) for ref, run in zip(reference, runs)]
+        report[mode] = {
+            "detect_ms": 1000 * float(np.mean([r["detect"] for r in runs])),
+            "segment_ms": 1000 * float(np.mean([r["segment"] for r in runs])),
+            "weights_mb": (serialized_nbytes(model.groundingdino) + serialized_nbytes(model.sam_predictor.model)) / 2 ** 20,
+            "box_recall": float(np.mean([a["recall"] for a in agreements])),
+            "box_precision": float(np.mean([a["precision"] for a in agreements])),
+            "box_mean_iou": float(np.mean([a["mean_iou"] for a in agreements])),
+            "mask_iou": float(np.mean([mean_mask_iou(ref["masks"], run["masks"]) for ref, run in zip(reference, runs)]))
+        }
+
+    base = report["fp32"]
+    print(f"\n{len(images)} 张图像，提示词 '{args.text_prompt}'，每张重复 {args.repeat} 次\n")
+    print(f"{'mode':<6}{'detect ms':>11}{'segment ms':>12}{'speedup':>9}{'weights MB':>12}{'saved':>8}"
+          f"{'box recall':>12}{'box prec':>10}{'box IoU':>9}{'mask IoU':>10}")
+    for mode, r in report.items():
+        total = r["detect_ms"] + r["segment_ms"]
+        r["speedup"] = (base["detect_ms"] + base["segment_ms"]) / total if total else 0.0
+        r["memory_saving"] = 1 - r["weights_mb"] / base["weights_mb"]
+        print(f"{mode:<6}{r['detect_ms']:>11.0f}{r['segment_ms']:>12.0f}{r['speedup']:>8.2f}x{r['weights_mb']:>12.0f}"
+              f"{r['memory_saving']:>8.0%}{r['box_recall']:>12.3f}{r['box_precision']:>10.3f}"
+              f"{r['box_mean_iou']:>9.3f}{r['mask_iou']:>10.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n结果已保存到 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""
+pytest 配置
+
+单元测试位于 tests/unit/；tests/ 下的其余脚本需要真实权重或运行中的服务，手动执行，不参与收集。
+"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+collect_ignore = ["test1.py", "test_two_step.py", "request_test.py"]
@@ -0,0 +1,65 @@
+"""backend.cache 的字节预算 LRU 缓存"""
+
+import numpy as np
+
+from backend.cache import LRUByteCache, estimate_nbytes, image_hash
+
+
+def test_evicts_least_recently_used_over_budget():
+    cache = LRUByteCache(max_bytes=100)
+    cache.put("a", "x", nbytes=40)
+    cache.put("b", "y", nbytes=40)
+    assert cache.get("a") == "x"  # a 变为最近使用
+
+    cache.put("c", "z", nbytes=40)
+
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert cache.total_bytes == 80
+    assert cache.stats() == {"entries": 2, "bytes": 80, "max_bytes": 100, "hits": 1, "misses": 0, "evictions": 1}
+
+
+def test_replacing_a_key_updates_bytes():
+    cache = LRUByteCache(max_bytes=100)
+    cache.put("a", 1, nbytes=30)
+    cache.put("a", 2, nbytes=50)
+
+    assert cache.get("a") == 2 and len(cache) == 1 and cache.total_bytes == 50
+
+
+def test_oversized_items_are_skipped_and_zero_budget_disables():
+    cache = LRUByteCache(max_bytes=10)
+    cache.put("big", "v", nbytes=11)
+    assert "big" not in cache
+
+    disabled = LRUByteCache(max_bytes=0)
+    disabled.put("a", np.zeros(4))
+    assert len(disabled) == 0
+    assert disabled.get("a", "default") == "default" and disabled.stats()["misses"] == 1
+
+
+def test_pop_and_clear():
+    cache = LRUByteCache(max_bytes=100)
+    cache.put("a", "x", nbytes=10)
+    cache.put("b", "y", nbytes=20)
+
+    assert cache.pop("a") == "x" and cache.pop("a") is None
+    assert cache.total_bytes == 20
+    cache.clear()
+    assert len(cache) == 0 and cache.total_bytes == 0
+
+
+def test_estimate_nbytes_of_nested_values():
+    value = {"features": [np.zeros((2, 3), dtype=np.float32)], "name": "abc"}
+
+    assert estimate_nbytes(value) == len("features") + 24 + len("name") + 3
+
+
+def test_image_hash_depends_on_content_shape_and_dtype():
+    image = np.zeros((4, 4, 3), dtype=np.uint8)
+
+    assert image_hash(image) == image_hash(image.copy())
+    assert image_hash(image) != image_hash(image.reshape(4, 12, 1))
+    assert image_hash(image) != image_hash(image.astype(np.float32))
+    changed = image.copy()
+    changed[0, 0, 0] = 1
+    assert image_hash(image) != image_hash(changed)
@@ -0,0 +1,192 @@
+"""GroundedSAM 批量检测的输入 / 输出形状约定（用假的 GroundingDINO 代替真实权重）"""
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+pytest.importorskip("groundingdino")
+
+from backend.grounded_sam import GroundedSAM, normalize_caption  # noqa: E402
+
+NUM_QUERIES = 900
+NUM_TOKENS = 256
+
+
+class FakeTokenizer:
+    def __call__(self, caption):
+        return {"input_ids": list(range(NUM_TOKENS))}
+
+    def decode(self, token_ids):
+        return "crane" if token_ids else ""
+
+
+class FakeGroundingDINO(torch.nn.Module):
+    """
+    与真实 forward 相同，先读取 samples.device（列表输入会在这里失败）
+
+    detections[i] 为第 i 次调用中各图像的命中查询 [(logit, [cx, cy, w, h]), ...]，
+    未提供时每张图像第 0 个查询命中；命中的查询都指向第 1 个 token。
+    """
+
+    def __init__(self, detections=None):
+        super().__init__()
+        self.tokenizer = FakeTokenizer()
+        self.detections = list(detections or [])
+        self.samples = None
+
+    def forward(self, samples, captions):
+        samples.device
+        self.samples = samples
+        batch = samples.tensors.shape[0]
+        assert len(captions) == batch
+        per_image = self.detections.pop(0) if self.detections else [[(10.0, [0.25] * 4)]] * batch
+        logits = torch.full((batch, NUM_QUERIES, NUM_TOKENS), -10.0)
+        boxes = torch.full((batch, NUM_QUERIES, 4), 0.25)
+        for i, hits in enumerate(per_image):
+            for q, (logit, box) in enumerate(hits):
+                logits[i, q, 1] = logit
+                boxes[i, q] = torch.tensor(box)
+        return {"pred_logits": logits, "pred_boxes": boxes}
+
+
+def make_model(detections=None) -> GroundedSAM:
+    model = GroundedSAM.__new__(GroundedSAM)
+    model.device = "cpu"
+    model.precision = "fp32"
+    model.engine = None
+    model.groundingdino = FakeGroundingDINO(detections)
+    return model
+
+
+def test_forward_batch_pads_images_of_different_sizes():
+    model = make_model()
+    images = [np.zeros((480, 640, 3), dtype=np.uint8), np.zeros((600, 400, 3), dtype=np.uint8)]
+
+    outputs = model._forward_groundingdino_batch(images, "crane .")
+
+    assert len(outputs) == 2
+    for logits, boxes in outputs:
+        assert logits.shape == (NUM_QUERIES, NUM_TOKENS)
+        assert boxes.shape == (NUM_QUERIES, 4)
+        assert float(logits.max()) <= 1.0  # 已经过 sigmoid
+
+    # 480x640 -> 800x1066，400x600 -> 1200x800，补零到 1200x1066
+    samples = model.groundingdino.samples
+    assert tuple(samples.tensors.shape) == (2, 3, 1200, 1066)
+    assert not samples.mask[0, :800, :1066].any() and samples.mask[0, 800:].all()
+    assert not samples.mask[1, :, :800].any() and samples.mask[1, :, 800:].all()
+
+
+def test_detect_batch_returns_one_result_per_image():
+    model = make_model()
+    images = [np.zeros((480, 640, 3), dtype=np.uint8), np.zeros((480, 640, 3), dtype=np.uint8)]
+
+    results = model.detect_batch(images, "crane", box_threshold=0.35, text_threshold=0.25)
+
+    assert len(results) == 2
+    for boxes, logits, phrases in results:
+        assert boxes.shape == (1, 4)
+        assert logits.shape == (1,)
+        assert phrases == ["crane"]
+
+
+def test_detect_tiled_maps_tile_offsets_and_merges_overlaps():
+    pytest.importorskip("torchvision")
+    # 1500x1000 的图像、1000 像素图块、50% 重叠 -> 图块 (0, 0, 1000, 1000) 与 (500, 0, 1500, 1000)
+    model = make_model(detections=[[
+        [(8.0, [0.75, 0.5, 0.1, 0.1])],                                  # 全局中心 x = 750
+        [(6.0, [0.25, 0.5, 0.1, 0.1]), (7.0, [0.9, 0.5, 0.1, 0.1])],     # x = 500 + 250（重复）与 500 + 900
+    ]])
+    image = np.zeros((1000, 1500, 3), dtype=np.uint8)
+
+    boxes, scores, phrases = model.detect_tiled(
+        image, "crane", tile_size=1000, overlap=0.5, batch_size=4, include_full=False
+    )
+
+    # 两个图块在同一批次前向
+    assert model.groundingdino.samples.tensors.shape[0] == 2
+    # 重叠区域的重复框只保留得分最高的一个，按得分降序
+    assert len(phrases) == 2 and phrases == ["crane", "crane"]
+    np.testing.assert_allclose(boxes[:, 0].numpy(), [750 / 1500, 1400 / 1500], atol=1e-4)
+    np.testing.assert_allclose(boxes[:, 2].numpy(), [100 / 1500, 100 / 1500], atol=1e-4)
+    np.testing.assert_allclose(boxes[:, 1].numpy(), [0.5, 0.5], atol=1e-4)
+    assert scores[0] > scores[1]
+
+
+class FakeCachingGroundingDINO(FakeGroundingDINO):
+    """带骨干特征注入接口的假模型：注入特征时跳过骨干，与真实 forward 一致"""
+
+    def __init__(self, detections=None):
+        super().__init__(detections)
+        self.backbone_calls = 0
+
+    def backbone(self, samples):
+        from groundingdino.util.misc import NestedTensor
+
+        self.backbone_calls += 1
+        tensors = samples.tensors[:, :1, ::32, ::32]
+        mask = samples.mask[:, ::32, ::32]
+        return [NestedTensor(tensors, mask)], [torch.zeros_like(tensors)]
+
+    def set_image_tensor(self, samples):
+        self.features, self.poss = self.backbone(samples)
+
+    def unset_image_tensor(self):
+        for name in ("features", "poss"):
+            if hasattr(self, name):
+                delattr(self, name)
+
+    def forward(self, samples, captions):
+        if not hasattr(self, "features"):
+            self.set_image_tensor(samples)
+        assert len(self.features) == 1 and self.features[0].tensors.shape[0] == samples.tensors.shape[0]
+        return super().forward(samples, captions)
+
+
+def test_detect_batch_populates_feature_and_detection_caches():
+    from backend.cache import LRUByteCache
+
+    model = make_model()
+    model.groundingdino = FakeCachingGroundingDINO()
+    model.dino_feature_cache = LRUByteCache(64 * 2 ** 20)
+    model.detection_cache = LRUByteCache(64 * 2 ** 20)
+    model.detection_score_floor = 0.1
+    images = [np.zeros((480, 640, 3), dtype=np.uint8), np.zeros((600, 400, 3), dtype=np.uint8)]
+
+    model.detect_batch(images, "crane", image_keys=["a", None])
+
+    # 整批只跑一次骨干，前向结束后不残留注入的特征
+    assert model.groundingdino.backbone_calls == 1
+    assert not hasattr(model.groundingdino, "features")
+    # 有键的图像按自己的切片和整批的补零尺寸缓存骨干特征，无键的不缓存
+    features = model.dino_feature_cache.get("a")
+    assert features["padded_size"] == (1200, 1066)
+    assert features["features"][0].tensors.shape[0] == 1
+    assert "b" not in model.dino_feature_cache and len(model.dino_feature_cache) == 1
+    # 原始输出只保留超过下限的查询
+    assert model.detection_cached("a", "crane")
+    cached = model.detection_cache.get(("a", normalize_caption("crane")))
+    assert cached["logits"].shape == (1, NUM_TOKENS) and cached["logits"].dtype == torch.float32
+    assert len(model.detection_cache) == 1
+
+
+def test_detection_cache_hit_matches_uncached_forward():
+    from backend.cache import LRUByteCache
+
+    query = [(0.3, [0.123456, 0.654321, 0.111111, 0.222222])]
+    model = make_model(detections=[[query], [query]])
+    model.detection_cache = LRUByteCache(64 * 2 ** 20)
+    model.detection_score_floor = 0.1
+    image = np.zeros((480, 640, 3), dtype=np.uint8)
+    caption = normalize_caption("crane")
+
+    miss = model.detect_with_groundingdino(image, "crane", 0.35, 0.25, image_key="a")
+    hit = model.detect_with_groundingdino(image, "crane", 0.35, 0.25, image_key="a")
+    # 第二次检测命中缓存，没有前向
+    assert len(model.groundingdino.detections) == 1
+    uncached = model._postprocess_detection(*model._forward_groundingdino(image, caption), caption, 0.35, 0.25)
+
+    # 命中、未命中与不经缓存的框、分数与短语逐位一致
+    for result in (hit, uncached):
+        assert torch.equal(result[0], miss[0]) and torch.equal(result[1], miss[1]) and result[2] == miss[2]
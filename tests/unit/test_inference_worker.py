@@ -0,0 +1,91 @@
+"""backend.inference_worker 的检测请求合并（用假的模型代替 GroundedSAM）"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from backend.inference_worker import InferenceWorker
+
+
+class FakeModel:
+    """记录调用；返回值标明由哪条路径计算、对应哪张图像"""
+
+    def __init__(self, cached_keys=(), fail=False):
+        self.dino_feature_cache = set(cached_keys)
+        self.fail = fail
+        self.calls = []
+        self.loads = []
+
+    def load_image(self, image_path, image_key=None):
+        # 图像以路径传入，由推理线程读取；像素值取自文件名便于核对结果归属
+        self.loads.append((image_path, image_key))
+        value = int(os.path.splitext(os.path.basename(image_path))[0])
+        return np.full((4, 4, 3), value, dtype=np.uint8)
+
+    def detection_cached(self, image_key, text_prompt):
+        return False
+
+    def detect_with_groundingdino(self, image, text_prompt, box_threshold, text_threshold, image_key=None):
+        self.calls.append(("single", image_key))
+        if self.fail:
+            raise RuntimeError("boom")
+        return "single", int(image[0, 0, 0])
+
+    def detect_batch(self, images, text_prompt, box_threshold, text_threshold, **kwargs):
+        self.calls.append(("batch", len(images)))
+        return [("batch", int(image[0, 0, 0])) for image in images]
+
+
+def detect_concurrently(model, requests):
+    # 时间窗口足够长，同时提交的请求落在同一批
+    worker = InferenceWorker(lambda: model, window_ms=200, max_batch=16)
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        futures = [
+            executor.submit(worker.detect, f"uploads/{value}.jpg", prompt, 0.35, 0.25, image_key=key)
+            for value, prompt, key in requests
+        ]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result(timeout=5))
+            except RuntimeError as e:
+                results.append(e)
+    return worker, results
+
+
+def test_same_image_and_prompt_is_detected_once():
+    model = FakeModel(cached_keys=["a"])
+
+    worker, results = detect_concurrently(model, [(1, "crane", "a")] * 3)
+
+    assert results == [("single", 1)] * 3
+    assert model.calls == [("single", "a")]
+    assert model.loads == [("uploads/1.jpg", "a")]
+    assert worker.stats()["coalesced"] == 2
+
+
+def test_uncached_images_share_one_batched_forward():
+    model = FakeModel()
+
+    _, results = detect_concurrently(model, [(1, "crane", "a"), (2, "crane", "b"), (2, "crane", "b")])
+
+    assert results == [("batch", 1), ("batch", 2), ("batch", 2)]
+    assert model.calls == [("batch", 2)]
+
+
+def test_cached_images_and_other_prompts_run_alone():
+    model = FakeModel(cached_keys=["a", "b"])
+
+    _, results = detect_concurrently(model, [(1, "crane", "a"), (2, "crane", "b"), (3, "banner", None)])
+
+    assert results == [("single", 1), ("single", 2), ("single", 3)]
+    assert sorted(model.calls, key=str) == sorted([("single", "a"), ("single", "b"), ("single", None)], key=str)
+
+
+def test_errors_reach_every_coalesced_request():
+    model = FakeModel(cached_keys=["a"], fail=True)
+
+    _, results = detect_concurrently(model, [(1, "crane", "a")] * 2)
+
+    assert all(isinstance(result, RuntimeError) and str(result) == "boom" for result in results)
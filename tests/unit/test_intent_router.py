@@ -0,0 +1,83 @@
+"""backend.intent_router 的本地意图解析"""
+
+import pytest
+
+from backend.intent_router import IntentRouter, describe_result
+
+DETECTION = {"phrases": ["crane"] * 25}
+
+
+@pytest.fixture
+def router():
+    return IntentRouter()
+
+
+@pytest.mark.parametrize("message", ["确认分割", "确认", "好的，分割", "ok 确认", "开始分割吧", "全部分割"])
+def test_confirm_segments_all(router, message):
+    assert router.route(message, DETECTION) == {"tool": "segment_with_sam", "inputs": {}}
+
+
+@pytest.mark.parametrize("message", ["好的", "对", "行", "嗯", "开始", "继续", "y", "ok", "好的，继续"])
+def test_bare_acknowledgement_is_not_confirm(router, message):
+    assert router.route(message, DETECTION) is None
+
+
+@pytest.mark.parametrize("message", ["...", "~", "。", "😀", "你好"])
+def test_punctuation_or_chat_is_not_confirm(router, message):
+    assert router.route(message, DETECTION) is None
+
+
+def test_confirm_without_detection_falls_back(router):
+    assert router.route("确认分割", None) is None
+
+
+@pytest.mark.parametrize("message", ["不要分割", "为什么分割", "取消"])
+def test_negation_falls_back(router, message):
+    assert router.route(message, DETECTION) is None
+
+
+@pytest.mark.parametrize("message, indices", [
+    ("分割第1和第3个", [0, 2]),
+    ("只要第二个", [1]),
+    ("第 3 个", [2]),
+    ("分割第十一个", [10]),
+    ("第二十和第3个", [2, 19]),
+    ("分割第二十一、第十个", [9, 20]),
+])
+def test_index_selection(router, message, indices):
+    assert router.route(message, DETECTION) == {
+        "tool": "segment_with_sam", "inputs": {"object_indices": indices}
+    }
+
+
+def test_index_out_of_range_falls_back(router):
+    assert router.route("分割第九十九个", DETECTION) is None
+    assert router.route("分割第3个", {"phrases": ["crane", "banner"]}) is None
+
+
+def test_segment_commands(router):
+    assert router.route("请帮我分割banner", None) == {
+        "tool": "detect_objects", "inputs": {"object_prompt": "banner"}
+    }
+    assert router.route("检测塔吊和楼房", None) == {
+        "tool": "detect_multiple_objects", "inputs": {"object_prompts": ["tower crane", "building"]}
+    }
+    assert router.route("直接分割图中的挖掘机", None) == {
+        "tool": "segment_object_with_sam", "inputs": {"object_prompt": "excavator"}
+    }
+
+
+def test_unknown_chinese_object_falls_back(router):
+    assert router.route("分割混凝土泵车", None) is None
+
+
+def test_stats_counts_routed_and_fallback(router):
+    router.route("确认分割", DETECTION)
+    router.route("...", DETECTION)
+
+    assert router.stats() == {"routed": 1, "fallback": 1}
+
+
+def test_describe_result():
+    assert describe_result({"error": "boom"}) == "处理失败：boom"
+    assert "2 个目标" in describe_result({"detected": ["crane", "banner"], "method": "detection_only"})
@@ -0,0 +1,66 @@
+"""backend.mask_codec 的 RLE 往返与多边形提取"""
+
+import numpy as np
+import pytest
+
+from backend.mask_codec import decode_rle, encode_masks, encode_polygons, encode_rle, rle_counts
+
+
+@pytest.mark.parametrize("mask", [
+    np.zeros((5, 7), dtype=bool),
+    np.ones((5, 7), dtype=bool),
+    np.eye(6, 9, dtype=bool),
+    np.random.default_rng(0).random((37, 53)) > 0.5,
+])
+def test_rle_round_trip(mask):
+    rle = encode_rle(mask)
+
+    assert rle["size"] == list(mask.shape)
+    decoded = decode_rle(rle)
+    assert decoded.dtype == bool and decoded.shape == mask.shape
+    np.testing.assert_array_equal(decoded, mask)
+
+
+def test_rle_long_runs_round_trip():
+    # 游程长度超过单个字符的 5 位、以及与前前个游程的负差分
+    mask = np.zeros((400, 300), dtype=bool)
+    mask[10:390, 5:20] = True
+    mask[0, 250:] = True
+
+    np.testing.assert_array_equal(decode_rle(encode_rle(mask)), mask)
+
+
+def test_rle_counts_are_column_major_and_start_with_zeros():
+    mask = np.array([[1, 0], [1, 1]], dtype=bool)
+
+    # 按列展开为 1, 1, 0, 1：第一个游程（0 值）长度为 0
+    assert rle_counts(mask) == [0, 2, 1, 1]
+    assert rle_counts(np.zeros((0, 0), dtype=bool)) == []
+
+
+def test_rle_matches_pycocotools():
+    mask_utils = pytest.importorskip("pycocotools.mask")
+    mask = np.random.default_rng(1).random((31, 17)) > 0.3
+
+    expected = mask_utils.encode(np.asfortranarray(mask.astype(np.uint8)))
+    assert encode_rle(mask)["counts"] == expected["counts"].decode()
+
+
+def test_encode_polygons_outlines_rectangle():
+    mask = np.zeros((50, 60), dtype=bool)
+    mask[10:20, 30:45] = True
+
+    polygons = encode_polygons(mask)
+
+    assert len(polygons) == 1
+    xs, ys = polygons[0][0::2], polygons[0][1::2]
+    assert (min(xs), max(xs), min(ys), max(ys)) == (30, 44, 10, 19)
+    assert encode_polygons(np.zeros((5, 5), dtype=bool)) == []
+
+
+def test_encode_masks_dispatches_by_format():
+    masks = [np.eye(4, dtype=bool)]
+
+    assert encode_masks(masks, "rle") == [encode_rle(masks[0])]
+    with pytest.raises(ValueError):
+        encode_masks(masks, "png")
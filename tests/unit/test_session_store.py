@@ -0,0 +1,163 @@
+"""backend.session_store 的两种会话存储与掩码缓存（同一组用例分别运行在内存与 SQLite 实现上）"""
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+from backend.session_store import (
+    MemorySessionStore, SQLiteSessionStore, cache_masks, cached_masks, make_detection, remove_stale_files
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    removed = []
+
+    def make(max_bytes=1 << 20, ttl_seconds=60):
+        on_remove = lambda session_id, session: removed.append(session_id)  # noqa: E731
+        if request.param == "sqlite":
+            return SQLiteSessionStore(str(tmp_path / "sessions.db"), max_bytes, ttl_seconds, on_remove=on_remove)
+        return MemorySessionStore(max_bytes, ttl_seconds, on_remove=on_remove)
+
+    make.removed = removed
+    return make
+
+
+def detection(n=3):
+    boxes = np.tile(np.array([[0.5, 0.5, 0.2, 0.2]], dtype=np.float32), (n, 1))
+    return make_detection(boxes, np.linspace(0.4, 0.9, n), ["crane"] * n, "uploads/a.jpg", "hash-a")
+
+
+def test_make_detection_converts_to_float32_arrays():
+    det = make_detection([0.5, 0.5, 0.2, 0.2], [0.8], ["crane"], "a.jpg", None)
+
+    assert det["boxes"].shape == (1, 4) and det["boxes"].dtype == np.float32
+    assert det["logits"].shape == (1,) and det["phrases"] == ["crane"]
+
+
+def test_mask_cache_round_trip():
+    det = detection()
+    mask = np.zeros((7, 9), dtype=bool)
+    mask[2:5, 3:8] = True
+
+    assert cached_masks(det, [0, 1]) == [None, None]
+    cache_masks(det, [1], [mask])
+
+    restored = cached_masks(det, [0, 1])
+    assert restored[0] is None
+    np.testing.assert_array_equal(restored[1], mask)
+
+
+def test_create_get_update_delete(make_store):
+    store = make_store()
+    store.create("s1", {"messages": [], "image_path": "uploads/a.jpg", "result_count": 0})
+
+    session = store.get("s1")
+    session["messages"].append({"role": "user", "content": "分割塔吊"})
+    session["detection"] = detection()
+    store.update("s1", session)
+
+    restored = store.get("s1")
+    assert restored["messages"] == [{"role": "user", "content": "分割塔吊"}]
+    np.testing.assert_array_equal(restored["detection"]["boxes"], session["detection"]["boxes"])
+    assert restored["detection"]["phrases"] == ["crane"] * 3
+    assert "s1" in store and len(store) == 1 and store.get("missing") is None
+
+    assert store.delete("s1") and not store.delete("s1")
+    assert store.get("s1") is None and make_store.removed == ["s1"]
+    assert store.stats()["created"] == 1 and store.stats()["deleted"] == 1
+
+
+def test_cached_masks_survive_update(make_store):
+    store = make_store()
+    mask = np.eye(6, 8, dtype=bool)
+    det = detection()
+    cache_masks(det, [0, 2], [mask, ~mask])
+    store.create("s1", {"messages": [], "detection": det})
+
+    restored = store.get("s1")["detection"]
+
+    masks = cached_masks(restored, [0, 1, 2])
+    np.testing.assert_array_equal(masks[0], mask)
+    assert masks[1] is None
+    np.testing.assert_array_equal(masks[2], ~mask)
+
+
+def test_idle_sessions_expire(make_store, clock):
+    store = make_store(ttl_seconds=60)
+    store.create("old", {"messages": []})
+    clock[0] += 30
+    store.create("new", {"messages": []})
+    clock[0] += 40
+
+    assert store.expire() == 1
+    assert "old" not in store and store.get("new") is not None
+    assert make_store.removed == ["old"] and store.stats()["expired"] == 1
+
+    # get 时发现已过期同样会删除
+    clock[0] += 61
+    assert store.get("new") is None and make_store.removed == ["old", "new"]
+
+
+def test_least_recently_used_session_is_evicted_over_budget(make_store, clock):
+    store = make_store(max_bytes=3000)
+    for session_id in ("a", "b", "c"):
+        clock[0] += 1
+        store.create(session_id, {"messages": [{"content": "x" * 900}]})
+    clock[0] += 1
+    store.get("a")  # a 变为最近访问
+
+    clock[0] += 1
+    store.create("d", {"messages": [{"content": "x" * 900}]})
+
+    assert "b" not in store and all(s in store for s in ("a", "c", "d"))
+    assert make_store.removed == ["b"] and store.stats()["evicted"] == 1
+
+
+def test_sqlite_sessions_are_shared_between_store_instances(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    writer = SQLiteSessionStore(path, max_bytes=1 << 20, ttl_seconds=60)
+    det = detection()
+    cache_masks(det, [1], [np.ones((4, 4), dtype=bool)])
+    writer.create("s1", {"messages": [], "detection": det})
+
+    reader = SQLiteSessionStore(path, max_bytes=1 << 20, ttl_seconds=60)
+
+    restored = reader.get("s1")
+    assert restored["detection"]["image_hash"] == "hash-a"
+    assert cached_masks(restored["detection"], [1])[0].all()
+    assert [session_id for session_id, _ in reader.items()] == ["s1"]
+
+
+def test_remove_stale_files_keeps_referenced_and_recent(tmp_path):
+    old, kept, recent = (tmp_path / name for name in ("old.jpg", "kept.jpg", "recent.jpg"))
+    for path in (old, kept, recent):
+        path.write_bytes(b"x")
+    past = time.time() - 3600
+    for path in (old, kept):
+        os.utime(path, (past, past))
+
+    assert remove_stale_files(str(tmp_path), max_age=60, keep=[str(kept)]) == 1
+    assert not old.exists() and kept.exists() and recent.exists()
+
+
+def test_remove_stale_files_keeps_files_that_predate_the_process(tmp_path):
+    # 目录中原有的文件（如仓库自带的示例图片）早于进程启动，不属于清理范围
+    sample, created = tmp_path / "sample.jpg", tmp_path / "created.jpg"
+    for path in (sample, created):
+        path.write_bytes(b"x")
+    now = time.time()
+    os.utime(sample, (now - 7200, now - 7200))
+    os.utime(created, (now - 1800, now - 1800))
+
+    assert remove_stale_files(str(tmp_path), max_age=60, since=now - 3600) == 1
+    assert sample.exists() and not created.exists()
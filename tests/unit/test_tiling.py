@@ -0,0 +1,63 @@
+"""backend.tiling 的图块几何与跨图块合并"""
+
+import numpy as np
+import pytest
+
+from backend.tiling import assign_to_tiles, inner_edge_mask, merge_detections, tile_grid
+
+
+def test_tile_grid_covers_image_with_equal_tiles():
+    tiles = tile_grid(1000, 2500, tile_size=1024, overlap=0.2)
+
+    assert all((x1 - x0, y1 - y0) == (1024, 1000) for x0, y0, x1, y1 in tiles)
+    xs = sorted({x0 for x0, _, _, _ in tiles})
+    assert xs[0] == 0 and xs[-1] + 1024 == 2500
+    # 相邻图块之间没有空隙
+    assert all(b - a <= 1024 for a, b in zip(xs, xs[1:]))
+
+
+def test_tile_grid_small_image_is_single_tile():
+    assert tile_grid(300, 400, tile_size=1024, overlap=0.2) == [(0, 0, 400, 300)]
+
+
+@pytest.mark.parametrize("tile_size, overlap", [(0, 0.2), (512, 1.0), (512, -0.1)])
+def test_tile_grid_rejects_invalid_arguments(tile_size, overlap):
+    with pytest.raises(ValueError):
+        tile_grid(1000, 1000, tile_size, overlap)
+
+
+def test_inner_edge_mask_ignores_image_border():
+    tile = (500, 0, 1500, 1000)
+    boxes = np.array([
+        [501, 100, 600, 200],     # 贴着图块左边（图块内部边缘）
+        [1400, 100, 1499, 200],   # 贴着右边，但那是图像真实边界
+        [800, 400, 900, 500],     # 完全在内部
+    ], dtype=np.float32)
+
+    cut = inner_edge_mask(boxes, tile, height=1000, width=1500)
+
+    assert cut.tolist() == [True, False, False]
+
+
+def test_assign_to_tiles_prefers_nearest_containing_tile():
+    tiles = [(0, 0, 1000, 1000), (500, 0, 1500, 1000)]
+    boxes = np.array([
+        [100, 100, 200, 200],      # 只在第一个图块内
+        [900, 100, 1000, 200],     # 两个都包含，离第二个图块中心更近
+        [0, 0, 1500, 1000],        # 没有图块能完整包含
+    ], dtype=np.float32)
+
+    assert assign_to_tiles(boxes, tiles).tolist() == [0, 1, -1]
+
+
+def test_assign_to_tiles_empty():
+    assert len(assign_to_tiles(np.zeros((0, 4)), [(0, 0, 10, 10)])) == 0
+
+
+def test_merge_detections_keeps_highest_scoring_duplicate():
+    pytest.importorskip("torchvision")
+    boxes = np.array([[0, 0, 100, 100], [2, 2, 101, 101], [300, 300, 400, 400]], dtype=np.float32)
+    scores = np.array([0.5, 0.9, 0.7], dtype=np.float32)
+
+    assert merge_detections(boxes, scores, iou_threshold=0.5).tolist() == [1, 2]
+    assert len(merge_detections(np.zeros((0, 4)), np.zeros(0))) == 0
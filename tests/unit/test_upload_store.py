@@ -0,0 +1,122 @@
+"""backend.upload_store 的内容去重与引用计数"""
+
+import io
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from backend import upload_store
+from backend.ingest import UploadError, UploadTooLarge, mask_target_size, resize_masks
+from backend.upload_store import UploadStore
+
+
+def jpeg_bytes(width=64, height=48, value=0):
+    buffer = io.BytesIO()
+    Image.fromarray(np.full((height, width, 3), value, dtype=np.uint8)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path), max_bytes=1 << 20, max_side=32)
+
+
+def test_duplicate_uploads_share_files_until_last_release(store, tmp_path):
+    data = jpeg_bytes()
+    first = store.put(io.BytesIO(data))
+    second = store.put(io.BytesIO(data))
+
+    assert not first["deduplicated"] and second["deduplicated"]
+    assert second["image_path"] == first["image_path"] and second["image_hash"] == first["image_hash"]
+    # 64x48 的原图缩小到长边 32 的工作图
+    assert first["image_size"] == [24, 32] and first["original_size"] == [48, 64]
+    assert store.stats()["references"] == 2 and store.stats()["deduplicated"] == 1
+
+    store.release(first["image_hash"])
+    assert os.path.exists(first["original_path"]) and os.path.exists(first["image_path"])
+
+    store.release(first["image_hash"])
+    assert not os.path.exists(first["original_path"]) and not os.path.exists(first["image_path"])
+    assert store.stats()["images"] == 0 and store.referenced() == []
+    # 临时文件都已清理或改名
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".part")]
+
+
+def test_different_content_is_stored_separately(store):
+    a = store.put(io.BytesIO(jpeg_bytes(value=0)))
+    b = store.put(io.BytesIO(jpeg_bytes(value=255)))
+
+    assert a["image_hash"] != b["image_hash"]
+    assert sorted(store.referenced()) == sorted([a["original_path"], a["image_path"], b["original_path"], b["image_path"]])
+
+
+def test_keep_files_when_delete_on_release_is_off(tmp_path):
+    store = UploadStore(str(tmp_path), max_bytes=1 << 20, max_side=32, delete_on_release=False)
+    upload = store.put(io.BytesIO(jpeg_bytes()))
+
+    store.release(upload["image_hash"])
+
+    assert store.stats()["images"] == 0
+    assert os.path.exists(upload["original_path"])
+
+
+def test_acquire_restores_reference_to_existing_files(store):
+    upload = store.put(io.BytesIO(jpeg_bytes()))
+    store.acquire(upload["image_hash"], [upload["original_path"], upload["image_path"]])
+    store.acquire(None, [])
+
+    assert store.stats()["references"] == 2
+
+
+@pytest.mark.parametrize("data, error", [(b"not an image at all", UploadError), (b"\0" * (2 << 20), UploadTooLarge)])
+def test_rejected_upload_holds_no_reference(store, tmp_path, data, error):
+    with pytest.raises(error):
+        store.put(io.BytesIO(data))
+
+    assert store.stats()["images"] == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_undecodable_upload_releases_its_reference(store, tmp_path):
+    # JPEG 文件头正确但内容损坏，解码失败时引用与文件都被清理
+    with pytest.raises(UploadError):
+        store.put(io.BytesIO(b"\xff\xd8\xff" + b"\0" * 64))
+
+    assert store.stats()["images"] == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_decode_and_write_run_outside_the_lock(store, monkeypatch):
+    calls = []
+
+    def checked_store_upload(*args):
+        calls.append(store._lock.locked())
+        return store_upload(*args)
+
+    store_upload = upload_store.store_upload
+    monkeypatch.setattr(upload_store, "store_upload", checked_store_upload)
+
+    data = jpeg_bytes()
+    store.put(io.BytesIO(data))
+    # 已被引用的内容直接复用，不再解码
+    store.put(io.BytesIO(data))
+
+    assert calls == [False]
+
+
+@pytest.mark.parametrize("mask_resolution, expected", [("working", (24, 32)), ("original", (48, 64))])
+@pytest.mark.parametrize("tiled", [False, True])
+def test_masks_match_requested_resolution(store, mask_resolution, expected, tiled):
+    upload = store.put(io.BytesIO(jpeg_bytes()))
+    # 常规推理的掩码为工作图尺寸，切块推理的掩码为原图尺寸
+    h, w = upload["original_size"] if tiled else upload["image_size"]
+    mask = np.zeros((h, w), dtype=bool)
+    mask[h // 4:h // 2, w // 4:w // 2] = True
+
+    size = mask_target_size(upload, mask_resolution, tiled=tiled)
+    masks = resize_masks([mask], size) if size is not None else [mask]
+
+    assert masks[0].shape == expected
+    assert 0 < masks[0].mean() < 0.2